@@ -1,3 +1,210 @@
-from django.contrib import admin
+import json
+import logging
+import threading
+from django.contrib import admin, messages
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db import connection, connections, transaction
+from django.utils import timezone
+from django.utils.functional import cached_property
+from .barcode_cache import cache_key
+from .barcodes import try_normalize_barcode
+from .current_prices import pairs_for_prices, refresh_current_prices
+from .models import Grocery, NewsletterCampaign, Price, PriceShop, Shop
 
-# Register your models here.
+logger = logging.getLogger(__name__)
+
+
+# Paginator that uses the planner's row estimate instead of COUNT(*) on
+# PostgreSQL once a changelist is large enough for the estimate to matter
+class EstimatedCountPaginator(Paginator):
+    # Below this many (estimated) rows an exact count is cheap enough
+    exact_count_threshold = 10000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if connections[queryset.db].vendor != 'postgresql':
+            return super().count
+        plan = json.loads(queryset.explain(format='json'))
+        if isinstance(plan, list):
+            plan = plan[0]
+        estimate = int(plan['Plan']['Plan Rows'])
+        if estimate < self.exact_count_threshold:
+            return super().count
+        return estimate
+
+
+# Base admin for large tables: estimated counts, no second "full" count, and
+# keyset ("Older") navigation on the primary key instead of OFFSET pages
+class LargeTableAdmin(admin.ModelAdmin):
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    ordering = ('-pk',)
+    list_per_page = 100
+    change_list_template = 'admin/cursor_change_list.html'
+    # Rows per UPDATE in bulk actions
+    action_batch_size = 1000
+    # Rows a bulk action updates within the request; the rest of a larger
+    # selection is updated by a background thread
+    action_sync_limit = 10000
+
+    def changelist_view(self, request, extra_context=None):
+        response = super().changelist_view(request, extra_context)
+        cl = getattr(response, 'context_data', {}).get('cl')
+        if cl is not None:
+            rows = list(cl.result_list)
+            # The cursor only makes sense in the default (newest first) order
+            if len(rows) == cl.list_per_page and 'o' not in request.GET:
+                response.context_data['cursor_next'] = rows[-1].pk
+            response.context_data['cursor_active'] = 'id__lt' in request.GET
+        return response
+
+    # Apply `values` to the queryset in primary key batches so a large
+    # selection doesn't turn into one long-running UPDATE. Ids are read by
+    # keyset, one batch at a time. `after_batch` is called with each batch of
+    # ids inside its transaction. updated_at is bumped by hand since update()
+    # bypasses auto_now. Up to action_sync_limit rows are updated before
+    # returning; the rest continue in the background. Returns (rows updated so
+    # far, whether the background thread was started).
+    def update_in_batches(self, queryset, values, after_batch=None):
+        if any(field.name == 'updated_at' for field in self.model._meta.fields):
+            values = {**values, 'updated_at': timezone.now()}
+        queryset = queryset.order_by('pk')
+        updated, last_pk = self._update_batches(queryset, values, after_batch, limit=self.action_sync_limit)
+        if last_pk is None:
+            return updated, False
+        self.run_in_background(self._update_batches, queryset, values, after_batch, last_pk)
+        return updated, True
+
+    # Update batches after `last_pk` until the queryset is exhausted or
+    # `limit` rows are done. Returns (rows updated, last pk when rows remain).
+    def _update_batches(self, queryset, values, after_batch, last_pk=0, limit=None):
+        updated = 0
+        while limit is None or updated < limit:
+            batch = list(queryset.filter(pk__gt=last_pk).values_list('pk', flat=True)[:self.action_batch_size])
+            if not batch:
+                return updated, None
+            last_pk = batch[-1]
+            with transaction.atomic():
+                self.model.objects.filter(pk__in=batch).update(**values)
+                if after_batch:
+                    after_batch(batch)
+            updated += len(batch)
+        return updated, last_pk if queryset.filter(pk__gt=last_pk).exists() else None
+
+    # Each batch commits on its own, so a thread stopped with its worker
+    # leaves a consistent, partly updated selection that can be run again
+    def run_in_background(self, target, *args):
+        def run():
+            try:
+                target(*args)
+            except Exception:
+                logger.exception("Background admin action on %s failed", self.model._meta.label)
+            finally:
+                connection.close()  # The thread's own connection
+
+        threading.Thread(target=run, name='admin-bulk-action', daemon=True).start()
+
+    def report_update(self, request, in_background, message):
+        if in_background:
+            message += " The rest of the selection is being updated in the background."
+        self.message_user(request, message, messages.SUCCESS)
+
+
+@admin.register(Grocery)
+class GroceryAdmin(LargeTableAdmin):
+    list_display = ('id', 'barcode_number', 'name', 'brand', 'category', 'manually_entered',
+                    'barcode_lookup_failed', 'barcode_api_last_checked')
+    list_filter = ('manually_entered', 'barcode_lookup_failed')
+    # Exact match on the unique barcode index; see get_search_results
+    search_fields = ('=barcode_number',)
+    search_help_text = "Search by barcode (UPC, EAN or GTIN)."
+    actions = ['relookup_barcodes', 'mark_manually_entered']
+
+    # Accept any spelling of a barcode and search for its canonical form
+    def get_search_results(self, request, queryset, search_term):
+        canonical = try_normalize_barcode(search_term)
+        return super().get_search_results(request, queryset, canonical or search_term)
+
+    def invalidate_cached_products(self, ids):
+        barcodes = Grocery.objects.filter(pk__in=ids).exclude(barcode_number=None).values_list('barcode_number', flat=True)
+        cache.delete_many([cache_key(barcode) for barcode in barcodes])
+
+    # Queue the selection for the relookup_barcodes job by clearing the last
+    # check time; the job (or the next scan) looks them up again
+    @admin.action(description="Re-lookup barcodes")
+    def relookup_barcodes(self, request, queryset):
+        count, in_background = self.update_in_batches(
+            queryset.filter(manually_entered=False),
+            {'barcode_api_last_checked': None, 'barcode_lookup_failed': False},
+            after_batch=self.invalidate_cached_products,
+        )
+        self.report_update(request, in_background, f"{count} groceries queued for a barcode re-lookup.")
+
+    @admin.action(description="Mark manually entered")
+    def mark_manually_entered(self, request, queryset):
+        count, in_background = self.update_in_batches(queryset, {'manually_entered': True},
+                                                      after_batch=self.invalidate_cached_products)
+        self.report_update(request, in_background, f"{count} groceries marked as manually entered.")
+
+
+@admin.register(Shop)
+class ShopAdmin(LargeTableAdmin):
+    list_display = ('id', 'name', 'owner', 'city', 'country', 'active', 'deleted', 'updated_at')
+    list_filter = ('active', 'deleted')
+    list_select_related = ('owner',)
+    raw_id_fields = ('owner',)
+    search_fields = ('=id', '=owner__username')
+    search_help_text = "Search by shop id or exact owner username."
+
+
+@admin.register(Price)
+class PriceAdmin(LargeTableAdmin):
+    list_display = ('id', 'user_grocery', 'owner', 'price', 'is_discounted', 'price_before_discount',
+                    'is_anomaly', 'anomaly_score', 'active', 'deleted', 'created_at')
+    list_filter = ('is_anomaly', 'is_discounted', 'active', 'deleted')
+    list_select_related = ('user_grocery__owner',)
+    raw_id_fields = ('user_grocery',)
+    search_fields = ('=id', '=user_grocery__id')
+    search_help_text = "Search by price id or user grocery id."
+    actions = ['deactivate_prices', 'approve_prices']
+
+    @admin.display(description="Owner")
+    def owner(self, obj):
+        return obj.user_grocery.owner
+
+    # QuerySet.update() skips the CurrentPrice signal handlers, so refresh
+    # the affected pairs per batch
+    @admin.action(description="Deactivate selected prices")
+    def deactivate_prices(self, request, queryset):
+        count, in_background = self.update_in_batches(
+            queryset, {'active': False},
+            after_batch=lambda ids: refresh_current_prices(pairs_for_prices(ids)),
+        )
+        self.report_update(request, in_background, f"{count} prices deactivated.")
+
+    # Release prices held back by anomaly detection
+    @admin.action(description="Approve flagged prices")
+    def approve_prices(self, request, queryset):
+        count, in_background = self.update_in_batches(
+            queryset.filter(is_anomaly=True), {'is_anomaly': False, 'active': True},
+            after_batch=lambda ids: refresh_current_prices(pairs_for_prices(ids)),
+        )
+        self.report_update(request, in_background, f"{count} prices approved.")
+
+
+@admin.register(PriceShop)
+class PriceShopAdmin(LargeTableAdmin):
+    list_display = ('id', 'price', 'shop', 'active', 'deleted', 'created_at')
+    list_filter = ('active', 'deleted')
+    list_select_related = ('price', 'shop')
+    raw_id_fields = ('price', 'shop')
+    search_fields = ('=id', '=price__id', '=shop__id')
+
+
+# Campaigns are written here and sent with the send_newsletter command
+@admin.register(NewsletterCampaign)
+class NewsletterCampaignAdmin(admin.ModelAdmin):
+    list_display = ('id', 'subject', 'created_at', 'started_at', 'finished_at')
+    readonly_fields = ('started_at', 'finished_at')
@@ -0,0 +1,204 @@
+# groceries/alerts.py
+
+# Batch price drop alerts.
+#
+# match_price_drops() walks new Price rows past a checkpoint in primary key
+# order. Each batch's discounted observations are matched, with a few set-based
+# queries, to watched items of the user who owns the shop: the observed item
+# itself and the user's other items with the same canonical barcode
+# (GroceryItem.barcode). Shops are private, so an alert never carries another
+# user's shop or prices. The work scales with the number of new prices rather
+# than the number of shopping lists. send_price_alerts() emails pending
+# alerts, one message per user, over a single SMTP connection.
+
+from collections import defaultdict
+from datetime import timedelta
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.db.models import CharField, F, Value
+from django.template.loader import render_to_string
+from django.utils import timezone
+from .models import GroceryItem, JobCheckpoint, Price, PriceAlert, PriceShop, UserGrocery
+
+CHECKPOINT_NAME = 'price_drop_alerts'
+
+# Prices younger than this are left for the next run, so rows from
+# transactions that commit out of primary key order are not skipped
+SETTLE_DELAY = timedelta(seconds=30)
+
+
+# Valid discounted observations for the Price id range: (price_shop id,
+# shop id, shop owner id, user_grocery id, price, price before discount)
+def discounted_observations(first_price_id, last_price_id):
+    return (
+        PriceShop.objects.filter(
+            price_id__gte=first_price_id, price_id__lte=last_price_id,
+            active=True, deleted=False,
+            shop__deleted=False,
+            price__active=True, price__deleted=False,
+            price__is_discounted=True,
+        )
+        # Only real drops: ignore "discounts" that are not below the old price
+        .exclude(price__price_before_discount__isnull=False,
+                 price__price_before_discount__lte=F('price__price'))
+        .values_list('id', 'shop_id', 'shop__owner_id', 'price__user_grocery_id',
+                     'price__price', 'price__price_before_discount')
+    )
+
+
+# Canonical barcodes of the observed items: (user_grocery id, barcode)
+def observed_barcodes(user_grocery_ids):
+    return (
+        GroceryItem.objects.filter(user_grocery_id__in=user_grocery_ids, deleted=False, barcode__gt='')
+        .values_list('user_grocery_id', 'barcode')
+        .distinct()
+    )
+
+
+# Watched, live items of the given owners that are one of the observed items
+# or carry one of the barcodes: (user_grocery id, owner id, barcode), with
+# None as the barcode for the observed items themselves
+def price_drop_watchers(owner_ids, user_grocery_ids, barcodes):
+    watched = UserGrocery.objects.filter(
+        owner_id__in=owner_ids, watch_price_drops=True, active=True, deleted=False,
+        shopping_list__active=True, shopping_list__deleted=False,
+    )
+    observed = watched.filter(pk__in=user_grocery_ids).values_list('id', 'owner_id', Value(None, CharField()))
+    same_product = (
+        GroceryItem.objects.filter(barcode__in=barcodes, deleted=False, user_grocery__in=watched)
+        .values_list('user_grocery_id', 'user_grocery__owner_id', 'barcode')
+    )
+    return observed.union(same_product)
+
+
+# (user_grocery id, shop id, price) of alerts created for the watched items
+# within PRICE_ALERT_REPEAT_AFTER
+def recent_alerts(user_grocery_ids):
+    return PriceAlert.objects.filter(
+        user_grocery_id__in=user_grocery_ids, created_at__gte=timezone.now() - settings.PRICE_ALERT_REPEAT_AFTER,
+    ).values_list('user_grocery_id', 'shop_id', 'price')
+
+
+# Create PriceAlert rows for discounted prices recorded since the last run,
+# for watched items of the owner of the shop. The same sale price at the same shop is only reported again after
+# PRICE_ALERT_REPEAT_AFTER. Returns (prices scanned, alerts matched).
+def match_price_drops(batch_size=5000):
+    checkpoint, _ = JobCheckpoint.objects.get_or_create(name=CHECKPOINT_NAME)
+    cutoff = timezone.now() - SETTLE_DELAY
+    scanned = matched = 0
+
+    while True:
+        price_ids = list(
+            Price.objects.filter(id__gt=checkpoint.position, created_at__lte=cutoff)
+            .order_by('id').values_list('id', flat=True)[:batch_size]
+        )
+        if not price_ids:
+            break
+
+        observations = list(discounted_observations(price_ids[0], price_ids[-1]))
+        observed = {row[3] for row in observations}
+        barcodes = defaultdict(set)
+        direct = set()  # (user_grocery, owner) watching the observed item itself
+        by_barcode = defaultdict(set)  # (owner, barcode) -> watched user_grocery ids
+        if observations:
+            for user_grocery_id, barcode in observed_barcodes(observed):
+                barcodes[user_grocery_id].add(barcode)
+            owner_ids = {row[2] for row in observations}
+            all_barcodes = set().union(*barcodes.values())
+            for user_grocery_id, owner_id, barcode in price_drop_watchers(owner_ids, observed, all_barcodes):
+                if barcode is None:
+                    direct.add((user_grocery_id, owner_id))
+                else:
+                    by_barcode[owner_id, barcode].add(user_grocery_id)
+        watching = {user_grocery_id for user_grocery_id, _ in direct}.union(*by_barcode.values())
+        # (user_grocery, shop, price) already reported recently, or earlier in this batch
+        reported = set(recent_alerts(watching)) if watching else set()
+
+        alerts = []
+        for price_shop_id, shop_id, owner_id, observed_id, price, price_before_discount in observations:
+            # Only the shop's owner hears about it, for the observed item and
+            # their other items of the same product
+            targets = {observed_id} if (observed_id, owner_id) in direct else set()
+            for barcode in barcodes.get(observed_id, ()):
+                targets |= by_barcode.get((owner_id, barcode), set())
+            for user_grocery_id in sorted(targets):
+                if (user_grocery_id, shop_id, price) in reported:
+                    continue
+                reported.add((user_grocery_id, shop_id, price))
+                alerts.append(PriceAlert(
+                    price_shop_id=price_shop_id, shop_id=shop_id, user_grocery_id=user_grocery_id,
+                    owner_id=owner_id, price=price, price_before_discount=price_before_discount,
+                ))
+
+        with transaction.atomic():
+            PriceAlert.objects.bulk_create(alerts, ignore_conflicts=True)
+            checkpoint.position = price_ids[-1]
+            checkpoint.save(update_fields=['position', 'updated_at'])
+        scanned += len(price_ids)
+        matched += len(alerts)
+
+    return scanned, matched
+
+
+# Email pending alerts, one message per user, reusing one SMTP connection.
+# Works through `batch_size` users at a time. Returns the number of emails sent.
+def send_price_alerts(batch_size=500):
+    sent = 0
+    connection = get_connection()
+    with connection:
+        while True:
+            # Alerts are only ever about the recipient's own shops; rows
+            # matched across users by earlier versions are not sent
+            pending = PriceAlert.objects.filter(notified_at__isnull=True, shop__owner=F('owner'))
+            owner_ids = list(
+                pending.order_by('owner_id').values_list('owner_id', flat=True).distinct()[:batch_size]
+            )
+            if not owner_ids:
+                break
+            alerts = list(
+                pending.filter(owner_id__in=owner_ids)
+                .select_related('owner', 'shop')
+                .order_by('owner_id', 'id')
+            )
+
+            names = {}
+            for user_grocery_id, name in (
+                GroceryItem.objects.filter(user_grocery_id__in={a.user_grocery_id for a in alerts}, deleted=False)
+                .order_by('id').values_list('user_grocery_id', 'name')
+            ):
+                names.setdefault(user_grocery_id, name)
+
+            by_owner = defaultdict(list)
+            for alert in alerts:
+                by_owner[alert.owner].append(alert)
+
+            messages = []
+            for owner, owner_alerts in by_owner.items():
+                if not owner.email:
+                    continue
+                context = {
+                    'first_name': owner.first_name,
+                    'alerts': [
+                        {
+                            'name': names.get(alert.user_grocery_id, f"Item {alert.user_grocery_id}"),
+                            'shop': alert.shop.name,
+                            'price': alert.price,
+                            'price_before_discount': alert.price_before_discount,
+                        }
+                        for alert in owner_alerts
+                    ],
+                }
+                message = EmailMultiAlternatives(
+                    subject="Price drops on your shopping lists",
+                    body=render_to_string('emails/price_alerts.txt', context),
+                    from_email=settings.DEFAULT_FROM_EMAIL,
+                    to=[owner.email],
+                )
+                message.attach_alternative(render_to_string('emails/price_alerts.html', context), "text/html")
+                messages.append(message)
+
+            connection.send_messages(messages)
+            PriceAlert.objects.filter(pk__in=[alert.pk for alert in alerts]).update(notified_at=timezone.now())
+            sent += len(messages)
+    return sent
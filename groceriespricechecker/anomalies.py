@@ -0,0 +1,146 @@
+# groceries/anomalies.py
+
+# Price anomaly scoring at ingestion.
+#
+# New observations are compared with the recent price history of the same
+# (user_grocery, shop) pair using robust statistics: the median and the
+# median absolute deviation (MAD). The history for a whole batch is loaded
+# with one query and all the statistics are computed with NumPy over flat
+# arrays, grouped by pair, so there is no per-row query or Python loop.
+#
+# An observation is an anomaly when it is both far from the median in robust
+# z-score terms and off by a large factor, so ordinary discounts pass while
+# typos such as 0.09 for 9.00 do not.
+
+import numpy as np
+from django.conf import settings
+from django.db.models import F, Value, Window
+from django.db.models.functions import RowNumber
+from .models import PriceShop
+
+# Scales the MAD to a standard deviation for normally distributed prices
+MAD_SCALE = 1.4826
+
+
+# Pack (user_grocery_id, shop_id) pairs into one int64 key per pair
+def pair_keys(user_grocery_ids, shop_ids):
+    return (np.asarray(user_grocery_ids, dtype=np.int64) << 32) | np.asarray(shop_ids, dtype=np.int64)
+
+
+# The same key computed in SQL
+PAIR_KEY_SQL = F('price__user_grocery_id') * Value(1 << 32) + F('shop_id')
+
+
+# Median of `values` per group, for groups 0..n_groups-1. `order` must sort
+# the values by (group, value). Groups without values get NaN.
+def _group_medians(groups, values, order, n_groups):
+    counts = np.bincount(groups, minlength=n_groups)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    sorted_values = values[order]
+    has_values = counts > 0
+    low = starts + (counts - 1) // 2
+    high = starts + counts // 2
+    medians = np.full(n_groups, np.nan)
+    medians[has_values] = (sorted_values[low[has_values]] + sorted_values[high[has_values]]) / 2
+    return medians, counts
+
+
+# Score new prices against history. History and new observations are given
+# as pair keys and values (floats). Returns (scores, anomalies): the robust
+# z-score of each new value (NaN when its pair has too little history) and a
+# boolean array marking the anomalies.
+def score_prices(history_keys, history_values, keys, values,
+                 threshold=None, max_ratio=None, min_history=None, min_spread=None):
+    threshold = settings.PRICE_ANOMALY_THRESHOLD if threshold is None else threshold
+    max_ratio = settings.PRICE_ANOMALY_MAX_RATIO if max_ratio is None else max_ratio
+    min_history = settings.PRICE_ANOMALY_MIN_HISTORY if min_history is None else min_history
+    min_spread = settings.PRICE_ANOMALY_MIN_SPREAD if min_spread is None else min_spread
+
+    keys = np.asarray(keys, dtype=np.int64)
+    values = np.asarray(values, dtype=np.float64)
+    history_keys = np.asarray(history_keys, dtype=np.int64)
+    history_values = np.asarray(history_values, dtype=np.float64)
+
+    # Number the pairs that appear in the batch; history for other pairs is ignored
+    pairs, batch_groups = np.unique(keys, return_inverse=True)
+    positions = np.searchsorted(pairs, history_keys)
+    positions = np.minimum(positions, max(len(pairs) - 1, 0))
+    relevant = (pairs[positions] == history_keys) if len(pairs) else np.zeros(len(history_keys), bool)
+    groups = positions[relevant]
+    history_values = history_values[relevant]
+
+    order = np.lexsort((history_values, groups))
+    medians, counts = _group_medians(groups, history_values, order, len(pairs))
+    deviations = np.abs(history_values - medians[groups])
+    mads, _ = _group_medians(groups, deviations, np.lexsort((deviations, groups)), len(pairs))
+
+    median = medians[batch_groups]
+    # A pair whose price never changed has a MAD of 0; fall back to a
+    # fraction of the median so a single new price isn't infinitely far off
+    spread = np.maximum(mads[batch_groups] * MAD_SCALE, median * min_spread)
+    enough = counts[batch_groups] >= min_history
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        scores = np.where(enough & (spread > 0), (values - median) / spread, np.nan)
+        ratios = np.where(enough & (median > 0), values / median, 1.0)
+    far = np.abs(np.nan_to_num(scores)) > threshold
+    off_by_factor = (ratios > max_ratio) | (ratios < 1 / max_ratio)
+    return scores, far & off_by_factor
+
+
+# The value a price is judged by: the regular price for discounted items
+# when it is known, since the discount itself is expected to be low. Takes
+# parallel sequences; None in `price_before_discount` means unknown.
+def comparable_values(prices, is_discounted, price_before_discount):
+    prices = np.asarray(prices, dtype=np.float64)
+    before = np.asarray(price_before_discount, dtype=np.float64)  # None becomes NaN
+    return np.where(np.asarray(is_discounted, dtype=bool) & ~np.isnan(before), before, prices)
+
+
+# Recent valid, non-anomalous history for the pairs in one query: at most
+# PRICE_ANOMALY_HISTORY prices per pair, newest first. Returns (keys, values).
+# The id lists let the indexes find the rows; the pair key then drops the
+# other combinations of those ids before the window function ranks them.
+def load_history(pairs):
+    pairs = set(pairs)
+    if not pairs:
+        return np.empty(0, np.int64), np.empty(0)
+    user_grocery_ids, shop_ids = zip(*pairs)
+    rows = (
+        PriceShop.objects.filter(
+            active=True, deleted=False, price__active=True, price__deleted=False, price__is_anomaly=False,
+            price__user_grocery_id__in=set(user_grocery_ids), shop_id__in=set(shop_ids),
+        )
+        .alias(pair_key=PAIR_KEY_SQL)
+        .filter(pair_key__in=pair_keys(user_grocery_ids, shop_ids).tolist())
+        .annotate(row_number=Window(
+            RowNumber(),
+            partition_by=[F('price__user_grocery_id'), F('shop_id')],
+            order_by=[F('price__created_at').desc(), F('price_id').desc()],
+        ))
+        .filter(row_number__lte=settings.PRICE_ANOMALY_HISTORY)
+        .values_list('price__user_grocery_id', 'shop_id', 'price__price',
+                     'price__is_discounted', 'price__price_before_discount')
+    )
+    rows = list(rows)
+    if not rows:
+        return np.empty(0, np.int64), np.empty(0)
+    user_grocery_ids, shop_ids, prices, discounted, before = zip(*rows)
+    return pair_keys(user_grocery_ids, shop_ids), comparable_values(prices, discounted, before)
+
+
+# Score a batch of validated price observations (dicts with user_grocery,
+# shop, price, is_discounted and price_before_discount). Returns (scores,
+# anomalies) in observation order.
+def score_observations(observations):
+    if not observations:
+        return np.empty(0), np.empty(0, bool)
+    user_grocery_ids = [obs['user_grocery'] for obs in observations]
+    shop_ids = [obs['shop'] for obs in observations]
+    values = comparable_values(
+        [obs['price'] for obs in observations],
+        [obs.get('is_discounted', False) for obs in observations],
+        [obs.get('price_before_discount') for obs in observations],
+    )
+    history_keys, history_values = load_history(zip(user_grocery_ids, shop_ids))
+    return score_prices(history_keys, history_values, pair_keys(user_grocery_ids, shop_ids), values)
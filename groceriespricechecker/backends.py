@@ -0,0 +1,57 @@
+# groceries/backends.py
+
+from datetime import timedelta
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.db.models import Q
+from django.db.models.functions import Lower
+from django.utils import timezone
+
+UserModel = get_user_model()
+
+
+# Authenticates with either the username or the email address in a single
+# query. Email matching is case-insensitive through LOWER(email), which is
+# backed by the auth_user_email_lower_idx functional index.
+class UsernameOrEmailBackend(ModelBackend):
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        if username is None:
+            username = kwargs.get(UserModel.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+
+        # "@" usually means an email address, but usernames may contain it
+        # too, so match both and try the exact username first
+        if "@" in username:
+            candidates = sorted(
+                UserModel._default_manager.alias(email_lower=Lower('email'))
+                .filter(Q(**{UserModel.USERNAME_FIELD: username}) | Q(email_lower=username.lower()))
+                .order_by('pk'),
+                key=lambda user: user.get_username() != username,
+            )
+        else:
+            candidates = list(UserModel._default_manager.filter(**{UserModel.USERNAME_FIELD: username}))
+
+        if not candidates:
+            # Run the default password hasher once to reduce the timing
+            # difference between an existing and a nonexistent user (#20760).
+            UserModel().set_password(password)
+            return None
+        for user in candidates:
+            if user.check_password(password) and self.user_can_authenticate(user):
+                return user
+        return None
+
+
+# Record a login without writing on every token request: last_login is only
+# updated when the stored value is older than LAST_LOGIN_UPDATE_INTERVAL, and
+# then with a single UPDATE that skips the model save machinery.
+def update_last_login_coalesced(user, now=None):
+    now = now or timezone.now()
+    interval = timedelta(seconds=settings.LAST_LOGIN_UPDATE_INTERVAL)
+    if user.last_login and now - user.last_login < interval:
+        return False
+    UserModel._default_manager.filter(pk=user.pk).update(last_login=now)
+    user.last_login = now
+    return True
@@ -0,0 +1,156 @@
+# groceries/barcode_cache.py
+
+# Lookup cache for product-from-barcode/ payloads, plus lightweight access
+# tracking so the most scanned barcodes can be preloaded when a worker starts
+# and refreshed before their data goes stale.
+
+import logging
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import timedelta
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import F
+from django.utils import timezone
+from .models import BarcodePopularity, Grocery
+
+logger = logging.getLogger(__name__)
+
+# Barcode data older than this is looked up again (unless manually entered)
+BARCODE_REFRESH_AGE = timedelta(days=180)
+
+# Upper bound on how long a payload stays cached, so edits made outside the
+# API (e.g. in the admin) show up eventually even without invalidation
+CACHE_MAX_TIMEOUT = 60 * 60 * 24
+
+
+def cache_key(barcode_number):
+    return f"barcode-product:{barcode_number}"
+
+
+# Response payload for a grocery, as returned by product-from-barcode/
+def build_product_data(grocery):
+    return {
+        "barcode_number": grocery.barcode_number,
+        "title": grocery.name,
+        "description": grocery.description,
+        "category": grocery.category,
+        "brand": grocery.brand,
+        "size": grocery.size,
+        "images": [grocery.image_url] if grocery.image_url else [],
+        "stores": [{
+            "name": grocery.store_name,
+            "price": str(grocery.store_price) if grocery.store_price else "",
+            "last_update": grocery.store_price_last_updated.strftime("%Y-%m-%d %H:%M:%S") if grocery.store_price_last_updated else ""
+        }] if grocery.store_name else [],
+        "manually_entered": grocery.manually_entered,
+        "barcode_lookup_failed": grocery.barcode_lookup_failed,
+        "barcode_api_last_checked": grocery.barcode_api_last_checked.strftime("%Y-%m-%d %H:%M:%S") if grocery.barcode_api_last_checked else ""
+    }
+
+
+# Seconds the grocery's payload may be cached: never past the point where the
+# view would look the barcode up again. None means it must not be cached.
+def cache_timeout(grocery, now):
+    if grocery.manually_entered:
+        return CACHE_MAX_TIMEOUT
+    if not grocery.barcode_api_last_checked:
+        return None
+    remaining = (grocery.barcode_api_last_checked + BARCODE_REFRESH_AGE - now).total_seconds()
+    if remaining <= 0:
+        return None
+    return int(min(remaining, CACHE_MAX_TIMEOUT))
+
+
+def get_cached_product(barcode_number):
+    return cache.get(cache_key(barcode_number))
+
+
+def cache_product(grocery, data=None, now=None):
+    timeout = cache_timeout(grocery, now or timezone.now())
+    if timeout:
+        cache.set(cache_key(grocery.barcode_number), data or build_product_data(grocery), timeout)
+
+
+def invalidate_product(barcode_number):
+    if barcode_number:
+        cache.delete(cache_key(barcode_number))
+
+
+# Counts barcode lookups in memory and adds them to BarcodePopularity at most
+# once per `flush_interval` seconds, so tracking costs a dict increment per
+# request and a handful of queries per minute per worker. The writes run in a
+# background thread, never in the request that happens to make a flush due.
+class BarcodeAccessTracker:
+    def __init__(self, flush_interval=60, max_keys=10000):
+        self.flush_interval = flush_interval
+        self.max_keys = max_keys
+        self.counts = Counter()
+        self.lock = threading.Lock()
+        self.last_flush = time.monotonic()
+        self.flushing = False
+
+    def record(self, barcode_number):
+        with self.lock:
+            # Past max_keys only already-tracked barcodes are counted, which
+            # keeps memory bounded and favours the hot set
+            if barcode_number in self.counts or len(self.counts) < self.max_keys:
+                self.counts[barcode_number] += 1
+            due = not self.flushing and time.monotonic() - self.last_flush >= self.flush_interval
+            if due:
+                self.flushing = True
+        if due:
+            threading.Thread(target=self._flush_in_background, name='barcode-access-flush', daemon=True).start()
+
+    def _flush_in_background(self):
+        try:
+            self.flush()
+        except Exception:
+            logger.exception("Could not save barcode access counts")
+        finally:
+            self.flushing = False
+            connection.close()  # The thread's own connection
+
+    def flush(self):
+        with self.lock:
+            counts, self.counts = self.counts, Counter()
+            self.last_flush = time.monotonic()
+        if not counts:
+            return
+        BarcodePopularity.objects.bulk_create(
+            [BarcodePopularity(barcode_number=barcode) for barcode in counts],
+            ignore_conflicts=True,
+        )
+        # One UPDATE per distinct count rather than one per barcode
+        by_count = defaultdict(list)
+        for barcode, count in counts.items():
+            by_count[count].append(barcode)
+        now = timezone.now()
+        for count, barcodes in by_count.items():
+            BarcodePopularity.objects.filter(barcode_number__in=barcodes).update(
+                hits=F('hits') + count, last_seen=now,
+            )
+
+
+tracker = BarcodeAccessTracker()
+
+
+# Most scanned barcodes, most popular first
+def top_barcodes(limit):
+    return list(
+        BarcodePopularity.objects.order_by('-hits').values_list('barcode_number', flat=True)[:limit]
+    )
+
+
+# Preload the payloads of the `limit` most scanned barcodes into the cache.
+# Returns the number of payloads cached.
+def warm_barcode_cache(limit=500):
+    now = timezone.now()
+    warmed = 0
+    for grocery in Grocery.objects.filter(barcode_number__in=top_barcodes(limit)):
+        timeout = cache_timeout(grocery, now)
+        if timeout:
+            cache.set(cache_key(grocery.barcode_number), build_product_data(grocery), timeout)
+            warmed += 1
+    return warmed
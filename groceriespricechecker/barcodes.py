@@ -0,0 +1,51 @@
+# groceries/barcodes.py
+
+# Helpers for turning scanned barcodes into a single canonical GTIN string, so
+# that the same product scanned as UPC-A, EAN-13 or GTIN-14 maps to one row
+# and one upstream lookup.
+
+VALID_LENGTHS = (8, 12, 13, 14)
+
+
+# GS1 mod-10 check digit for the given digits (without the check digit)
+def gtin_check_digit(digits):
+    total = 0
+    for position, digit in enumerate(reversed(digits)):
+        total += int(digit) * (3 if position % 2 == 0 else 1)
+    return str((10 - total % 10) % 10)
+
+
+# Return the canonical form of a GTIN-8/12/13/14 barcode.
+#
+# The code is padded to GTIN-14 and its check digit verified. The canonical
+# form is the 8 digit code for GTIN-8 (six leading zeros in GTIN-14 form, as
+# GS1 reserves that range for GTIN-8), the 13 digit EAN for UPC-A/EAN-13 (and
+# GTIN-14 with a zero indicator digit), and the full 14 digits otherwise.
+# 8 digit input is treated as EAN-8, not UPC-E. Raises ValueError for
+# anything that is not a valid GTIN.
+def normalize_barcode(value):
+    if value is None:
+        raise ValueError("Barcode is required.")
+    barcode = str(value).strip().replace(" ", "").replace("-", "")
+    if not barcode.isdigit() or not barcode.isascii():
+        raise ValueError("Barcode must contain only digits.")
+    if len(barcode) not in VALID_LENGTHS:
+        raise ValueError("Barcode must be 8, 12, 13 or 14 digits long.")
+
+    gtin14 = barcode.zfill(14)
+    if gtin_check_digit(gtin14[:-1]) != gtin14[-1]:
+        raise ValueError("Barcode check digit is invalid.")
+
+    if gtin14.startswith("000000"):
+        return gtin14[6:]
+    if gtin14.startswith("0"):
+        return gtin14[1:]
+    return gtin14
+
+
+# Like normalize_barcode() but returns None instead of raising
+def try_normalize_barcode(value):
+    try:
+        return normalize_barcode(value)
+    except ValueError:
+        return None
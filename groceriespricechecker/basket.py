@@ -0,0 +1,244 @@
+# groceries/basket.py
+
+# Split a shopping list across at most k shops at the lowest total cost.
+#
+# The list's current prices are loaded with one query into a dense item x shop
+# NumPy matrix (missing prices are +inf). The cost of visiting a set of shops
+# is the sum over items of the cheapest price among them, plus an optional
+# per-shop distance penalty. Sets are scored column-wise with NumPy, so
+# scoring every candidate shop for a step is a single vectorized operation.
+#
+# A greedy pass followed by single-shop swaps gives a good plan quickly. When
+# the number of shop combinations is small enough, they are then enumerated
+# to prove the best one; otherwise the rest of the time budget goes to
+# iterated local search (swap a few shops for random others, improve again,
+# keep the result if it is cheaper). Every stage stops at the time budget and
+# returns the best plan found so far.
+
+import math
+import time
+from itertools import combinations, islice
+import numpy as np
+from django.conf import settings
+from .models import CurrentPrice
+
+EARTH_RADIUS_KM = 6371.0
+
+
+class Basket:
+    def __init__(self, user_grocery_ids, shops, prices, costs):
+        self.user_grocery_ids = user_grocery_ids  # Row labels
+        self.shops = shops  # Column labels: dicts with id, name, latitude, longitude
+        self.prices = prices  # {(row, column): Decimal} for the response
+        self.costs = costs  # float matrix, +inf where a shop has no price
+
+
+# Load the current prices of the list's active items at active shops into
+# a Basket. Items no shop has a price for are left out.
+def load_basket(shopping_list):
+    rows = (
+        CurrentPrice.objects.filter(
+            user_grocery__shopping_list=shopping_list,
+            user_grocery__active=True, user_grocery__deleted=False,
+            shop__active=True, shop__deleted=False,
+        )
+        .order_by('user_grocery_id', 'shop_id')
+        .values_list('user_grocery_id', 'shop_id', 'price', 'shop__name', 'shop__latitude', 'shop__longitude')
+    )
+    user_grocery_index, shop_index, shops, prices = {}, {}, [], {}
+    for user_grocery_id, shop_id, price, name, latitude, longitude in rows:
+        row = user_grocery_index.setdefault(user_grocery_id, len(user_grocery_index))
+        if shop_id not in shop_index:
+            shop_index[shop_id] = len(shops)
+            shops.append({"id": shop_id, "name": name, "latitude": latitude, "longitude": longitude})
+        prices[row, shop_index[shop_id]] = price
+
+    costs = np.full((len(user_grocery_index), len(shops)), np.inf)
+    if prices:
+        cells = np.array(list(prices), dtype=np.intp)
+        costs[cells[:, 0], cells[:, 1]] = np.fromiter((float(price) for price in prices.values()), float, len(prices))
+    return Basket(list(user_grocery_index), shops, prices, costs)
+
+
+# Great-circle distance (km) from one point to each shop; NaN without coordinates
+def shop_distances(shops, latitude, longitude):
+    lat2 = np.radians(np.array([np.nan if s["latitude"] is None else float(s["latitude"]) for s in shops]))
+    lng2 = np.radians(np.array([np.nan if s["longitude"] is None else float(s["longitude"]) for s in shops]))
+    lat1, lng1 = math.radians(latitude), math.radians(longitude)
+    a = np.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+class BasketOptimizer:
+    # Scores are floats; improvements smaller than this are noise
+    epsilon = 1e-9
+
+    def __init__(self, costs, shop_penalties=None, time_budget=None, max_combinations=None):
+        self.deadline = time.monotonic() + (time_budget if time_budget is not None else settings.BASKET_TIME_BUDGET)
+        self.max_combinations = max_combinations or settings.BASKET_EXACT_MAX_COMBINATIONS
+        n_shops = costs.shape[1]
+        self.penalties = np.zeros(n_shops) if shop_penalties is None else np.asarray(shop_penalties, float)
+        # An item missing from every chosen shop costs more than any real
+        # price, so plans that cover more items always win
+        finite = costs[np.isfinite(costs)]
+        self.missing_cost = (finite.max() if finite.size else 1.0) * (costs.shape[0] + 1) + 1
+        self.costs = np.where(np.isfinite(costs), costs, self.missing_cost)
+
+    def expired(self):
+        return time.monotonic() > self.deadline
+
+    def score(self, shops):
+        if not shops:
+            return self.missing_cost * self.costs.shape[0]
+        columns = list(shops)
+        return self.costs[:, columns].min(axis=1).sum() + self.penalties[columns].sum()
+
+    # Score of adding each shop to the set whose per-item best costs are `best`
+    def _scores_with_each(self, best, penalty):
+        return np.minimum(best[:, None], self.costs).sum(axis=0) + penalty + self.penalties
+
+    def _best_costs(self, shops):
+        if not shops:
+            return np.full(self.costs.shape[0], self.missing_cost)
+        return self.costs[:, list(shops)].min(axis=1)
+
+    def greedy(self, k):
+        chosen = []
+        current = self.score(chosen)
+        while len(chosen) < k:
+            scores = self._scores_with_each(self._best_costs(chosen), self.penalties[chosen].sum())
+            scores[chosen] = np.inf
+            shop = int(np.argmin(scores))
+            if scores[shop] >= current - self.epsilon:
+                break  # Another shop only adds distance
+            chosen.append(shop)
+            current = scores[shop]
+        return chosen, current
+
+    # Replace one chosen shop at a time with the best outside shop while that
+    # lowers the cost
+    def improve(self, chosen, current):
+        chosen = list(chosen)
+        improved = True
+        while improved and not self.expired():
+            improved = False
+            for position in range(len(chosen)):
+                others = chosen[:position] + chosen[position + 1:]
+                scores = self._scores_with_each(self._best_costs(others), self.penalties[others].sum())
+                scores[chosen] = np.inf
+                shop = int(np.argmin(scores))
+                if scores[shop] < current - self.epsilon:
+                    chosen[position] = shop
+                    current = scores[shop]
+                    improved = True
+        return chosen, current
+
+    # Iterated local search from `chosen` until the time budget runs out.
+    # Seeded, so the same inputs give the same plan when time allows.
+    def perturb(self, chosen, score, seed=0):
+        n = self.costs.shape[1]
+        best, best_score = list(chosen), score
+        if not best or len(best) >= n:
+            return best, best_score
+        rng = np.random.default_rng(seed)
+        while not self.expired():
+            candidate = list(best)
+            outside = np.setdiff1d(np.arange(n), candidate)
+            swaps = min(int(rng.integers(1, max(1, len(candidate) // 3) + 1)), len(outside))
+            positions = rng.choice(len(candidate), swaps, replace=False)
+            for position, shop in zip(positions, rng.choice(outside, swaps, replace=False)):
+                candidate[position] = int(shop)
+            candidate, candidate_score = self.improve(candidate, self.score(candidate))
+            if candidate_score < best_score - self.epsilon:
+                best, best_score = candidate, candidate_score
+        return best, best_score
+
+    def combination_count(self, sizes):
+        n = self.costs.shape[1]
+        return sum(math.comb(n, size) for size in sizes)
+
+    # Enumerate every set of the given sizes in vectorized chunks. Returns the
+    # best set, its score and whether the enumeration finished in time.
+    def exhaustive(self, sizes, best, best_score, chunk_size=2048):
+        n = self.costs.shape[1]
+        for size in sizes:
+            candidates = combinations(range(n), size)
+            while True:
+                chunk = np.array(list(islice(candidates, chunk_size)), dtype=np.intp).reshape(-1, size)
+                if not len(chunk):
+                    break
+                scores = self.costs[:, chunk].min(axis=2).sum(axis=0) + self.penalties[chunk].sum(axis=1)
+                index = int(np.argmin(scores))
+                if scores[index] < best_score - self.epsilon:
+                    best, best_score = list(chunk[index]), scores[index]
+                if self.expired():
+                    return best, best_score, False
+        return best, best_score, True
+
+    # Best set of at most k shops: (shop columns, score, proven optimal, method)
+    def solve(self, k):
+        n = self.costs.shape[1]
+        k = min(k, n)
+        if n == 0 or k == 0:
+            return [], self.score([]), True, "exact"
+        chosen, score = self.improve(*self.greedy(k))
+        # Without distance penalties more shops never cost more, so only
+        # sets of exactly k shops can be strictly better
+        sizes = range(k, k + 1) if not self.penalties.any() else range(1, k + 1)
+        if self.expired() or self.combination_count(sizes) > self.max_combinations:
+            chosen, score = self.perturb(chosen, score)
+            return chosen, score, False, "heuristic"
+        chosen, score, finished = self.exhaustive(sizes, chosen, score)
+        return chosen, score, finished, "exact" if finished else "heuristic"
+
+
+# Optimise the shopping list and build the response plan. `latitude` and
+# `longitude` (together with a positive `distance_weight`, cost per km)
+# penalise each visited shop by its distance; shops without coordinates are
+# then left out.
+def plan_basket(shopping_list, k, latitude=None, longitude=None, distance_weight=0.0):
+    basket = load_basket(shopping_list)
+    columns = np.arange(len(basket.shops))
+    penalties = None
+    distances = None
+    if distance_weight and latitude is not None and longitude is not None:
+        distances = shop_distances(basket.shops, latitude, longitude)
+        columns = columns[~np.isnan(distances)]
+        penalties = distances[columns] * distance_weight
+
+    optimizer = BasketOptimizer(basket.costs[:, columns], penalties)
+    chosen, score, optimal, method = optimizer.solve(k)
+    chosen = [int(columns[column]) for column in chosen]
+
+    plan = {column: [] for column in chosen}
+    missing = []
+    if chosen:
+        best_columns = np.array(chosen)[np.argmin(basket.costs[:, chosen], axis=1)]
+    for row, user_grocery_id in enumerate(basket.user_grocery_ids):
+        price = basket.prices.get((row, int(best_columns[row]))) if chosen else None
+        if price is None:
+            missing.append(user_grocery_id)
+        else:
+            plan[int(best_columns[row])].append({"user_grocery": user_grocery_id, "price": price})
+
+    shops = []
+    total = 0
+    for column in chosen:
+        shop = basket.shops[column]
+        subtotal = sum((item["price"] for item in plan[column]), start=0)
+        total += subtotal
+        shops.append({
+            "id": shop["id"],
+            "name": shop["name"],
+            "distance_km": round(float(distances[column]), 2) if distances is not None else None,
+            "subtotal": str(subtotal),
+            "items": [{"user_grocery": item["user_grocery"], "price": str(item["price"])} for item in plan[column]],
+        })
+    return {
+        "shops": shops,
+        "total": str(total),
+        "distance_penalty": round(float(distances[chosen].sum() * distance_weight), 2) if distances is not None and chosen else 0,
+        "missing": missing,
+        "optimal": optimal,
+        "method": method,
+    }
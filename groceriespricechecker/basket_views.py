@@ -0,0 +1,49 @@
+# groceries/basket_views.py
+
+import math
+from django.conf import settings
+from django.shortcuts import get_object_or_404
+from rest_framework.views import APIView
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework import status
+from .basket import plan_basket
+from .models import ShoppingList
+
+
+# GET shopping-lists/<pk>/basket/?k=2 - cheapest way to buy the list at no
+# more than k of the user's shops. lat/lng plus distance_weight (cost per km
+# from that point to each visited shop) trade price against distance.
+class BasketPlanAPIView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, pk, format=None):
+        shopping_list = get_object_or_404(ShoppingList, pk=pk, owner=request.user, deleted=False)
+        params = request.query_params
+
+        k = params.get('k', '1')
+        if not k.isdigit() or not 1 <= int(k) <= settings.BASKET_MAX_SHOPS:
+            return Response({"error": f"k must be between 1 and {settings.BASKET_MAX_SHOPS}."},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            latitude = float(params['lat']) if 'lat' in params else None
+            longitude = float(params['lng']) if 'lng' in params else None
+            distance_weight = float(params.get('distance_weight', 0))
+            # float() also accepts "nan" and "inf"
+            numbers = [value for value in (latitude, longitude, distance_weight) if value is not None]
+            if not all(math.isfinite(value) for value in numbers):
+                raise ValueError
+        except ValueError:
+            return Response({"error": "lat, lng and distance_weight must be numbers."},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if (latitude is None) != (longitude is None):
+            return Response({"error": "lat and lng must be given together."}, status=status.HTTP_400_BAD_REQUEST)
+        if latitude is not None and not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+            return Response({"error": "lat/lng out of range."}, status=status.HTTP_400_BAD_REQUEST)
+        if distance_weight < 0 or (distance_weight and latitude is None):
+            return Response({"error": "distance_weight must be positive and needs lat and lng."},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        plan = plan_basket(shopping_list, int(k), latitude, longitude, distance_weight)
+        return Response(plan, status=status.HTTP_200_OK)
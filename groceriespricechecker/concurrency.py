@@ -0,0 +1,106 @@
+# groceries/concurrency.py
+
+# Adaptive (AIMD) concurrency limiting for work that waits on upstream
+# services. The number of calls allowed in flight grows by roughly one per
+# window of fast, successful calls and halves whenever a call is slow or fails,
+# so a struggling provider quickly gets fewer workers parked on it and the rest
+# stay free for endpoints that only touch the database.
+#
+# The in-flight counter and the current limit live in the cache, so with a
+# shared cache (REDIS_URL) the limit applies across all gunicorn workers; with
+# the local memory cache it applies per process.
+
+import time
+from contextlib import contextmanager
+from django.conf import settings
+from django.core.cache import cache
+
+
+class Overloaded(Exception):
+    pass
+
+
+class AdaptiveConcurrencyLimiter:
+    # The in-flight counter expires this many seconds after the last slot was
+    # taken or released. Every operation refreshes it, so it can't expire
+    # under load, but a slot leaked by a killed worker is reclaimed once
+    # traffic pauses.
+    counter_timeout = 120
+    # The limit is stored in thousandths so it can be adjusted with atomic
+    # incr/decr instead of a read-modify-write
+    scale = 1000
+
+    def __init__(self, name, min_limit=1, max_limit=None, latency_target=None):
+        self.name = name
+        self.min_limit = min_limit
+        self.max_limit = max_limit or settings.UPSTREAM_MAX_CONCURRENCY
+        self.latency_target = latency_target or settings.UPSTREAM_LATENCY_TARGET
+        self.inflight_key = f"concurrency-inflight:{name}"
+        self.limit_key = f"concurrency-limit-milli:{name}"
+
+    def limit(self):
+        return cache.get(self.limit_key, self.max_limit * self.scale) / self.scale
+
+    def inflight(self):
+        return cache.get(self.inflight_key, 0)
+
+    def try_acquire(self):
+        inflight = self._add(self.inflight_key, 1, 0, self.counter_timeout)
+        if inflight > int(self.limit()):
+            self._decrement()
+            return False
+        return True
+
+    def release(self, latency, ok=True):
+        self._decrement()
+        low, high = self.min_limit * self.scale, self.max_limit * self.scale
+        current = cache.get(self.limit_key, high)
+        if not ok or latency > self.latency_target:
+            # Multiplicative decrease; concurrent decreases compound, which
+            # only makes the limiter back off faster
+            step = -(current // 2)
+        else:
+            step = max(1, self.scale * self.scale // max(current, 1))  # Additive increase of 1 / limit
+        limit = self._add(self.limit_key, step, high, None)
+        # Undo any overshoot with the opposite atomic step rather than a set(),
+        # which could overwrite a concurrent update
+        if limit < low:
+            self._add(self.limit_key, low - limit, high, None)
+        elif limit > high:
+            self._add(self.limit_key, high - limit, high, None)
+
+    # Atomically add `delta` to a cache counter, creating it with `initial`
+    # (and the timeout) first, and refresh its timeout. Returns the new value.
+    def _add(self, key, delta, initial, timeout):
+        cache.add(key, initial, timeout)
+        try:
+            value = cache.incr(key, delta)
+        except ValueError:
+            # The counter expired between add() and incr()
+            cache.add(key, initial + delta, timeout)
+            value = initial + delta
+        if timeout is not None:
+            cache.touch(key, timeout)
+        return value
+
+    def _decrement(self):
+        inflight = self._add(self.inflight_key, -1, 1, self.counter_timeout)
+        if inflight < 0:
+            # More releases than acquisitions (e.g. the counter was lost)
+            self._add(self.inflight_key, -inflight, 0, self.counter_timeout)
+
+    # Run the block in a slot or raise Overloaded straight away
+    @contextmanager
+    def slot(self):
+        if not self.try_acquire():
+            raise Overloaded(self.name)
+        start = time.monotonic()
+        ok = False
+        try:
+            yield
+            ok = True
+        finally:
+            self.release(time.monotonic() - start, ok)
+
+
+upstream_limiter = AdaptiveConcurrencyLimiter('barcode-upstream')
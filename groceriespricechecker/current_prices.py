@@ -0,0 +1,111 @@
+# groceries/current_prices.py
+
+# Maintenance of the CurrentPrice table: the newest active, non-deleted
+# Price/PriceShop for each (user_grocery, shop) pair.
+
+from django.db import transaction
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+from .models import CurrentPrice, PriceShop, UserGrocery
+
+UPDATE_FIELDS = ['price_shop', 'price', 'is_discounted', 'price_before_discount', 'observed_at', 'updated_at']
+
+
+# PriceShop rows that are eligible to be a current price
+def valid_price_shops():
+    return PriceShop.objects.filter(
+        active=True, deleted=False, price__active=True, price__deleted=False,
+    )
+
+
+# The newest valid PriceShop per (user_grocery, shop) within `queryset`,
+# selected in SQL with a window function
+def latest_price_shops(queryset):
+    return (
+        queryset
+        .annotate(
+            row_number=Window(
+                RowNumber(),
+                partition_by=[F('price__user_grocery_id'), F('shop_id')],
+                order_by=[F('price__created_at').desc(), F('price_id').desc(), F('id').desc()],
+            )
+        )
+        .filter(row_number=1)
+        .select_related('price')
+    )
+
+
+def build_current_price(price_shop):
+    price = price_shop.price
+    return CurrentPrice(
+        user_grocery_id=price.user_grocery_id,
+        shop_id=price_shop.shop_id,
+        price_shop=price_shop,
+        price=price.price,
+        is_discounted=price.is_discounted,
+        price_before_discount=price.price_before_discount,
+        observed_at=price.created_at,
+    )
+
+
+# Upsert CurrentPrice rows in one statement
+def save_current_prices(current_prices, batch_size=1000):
+    CurrentPrice.objects.bulk_create(
+        current_prices,
+        batch_size=batch_size,
+        update_conflicts=True,
+        unique_fields=['user_grocery', 'shop'],
+        update_fields=UPDATE_FIELDS,
+    )
+
+
+# Recompute the current price for the given (user_grocery_id, shop_id) pairs.
+# Uses one query to find the newest valid rows, one upsert and one delete for
+# pairs that no longer have a valid price. Call this inside the transaction
+# that changed the prices; it is also used by the signal handlers, so
+# QuerySet.update() and bulk_create() callers must call it themselves.
+#
+# The user groceries are locked first, so refreshes of the same pairs run one
+# after the other and each reads the prices the previous one committed. Without
+# the lock, a transaction that read the history before a newer price committed
+# could commit last and overwrite that price with an older observation. Locks
+# are taken in id order to avoid deadlocks.
+def refresh_current_prices(pairs):
+    pairs = set(pairs)
+    if not pairs:
+        return
+    user_grocery_ids = {user_grocery_id for user_grocery_id, _ in pairs}
+    shop_ids = {shop_id for _, shop_id in pairs}
+    with transaction.atomic():
+        list(UserGrocery.objects.select_for_update().filter(pk__in=user_grocery_ids).order_by('pk').values_list('pk'))
+        _refresh_locked(pairs, user_grocery_ids, shop_ids)
+
+
+def _refresh_locked(pairs, user_grocery_ids, shop_ids):
+    queryset = valid_price_shops().filter(
+        price__user_grocery_id__in=user_grocery_ids, shop_id__in=shop_ids,
+    )
+    current_prices = [
+        build_current_price(price_shop)
+        for price_shop in latest_price_shops(queryset)
+        if (price_shop.price.user_grocery_id, price_shop.shop_id) in pairs
+    ]
+    save_current_prices(current_prices)
+
+    stale = pairs - {(cp.user_grocery_id, cp.shop_id) for cp in current_prices}
+    if stale:
+        stale_ids = [
+            pk for pk, user_grocery_id, shop_id in CurrentPrice.objects.filter(
+                user_grocery_id__in={pair[0] for pair in stale}, shop_id__in={pair[1] for pair in stale},
+            ).values_list('id', 'user_grocery_id', 'shop_id')
+            if (user_grocery_id, shop_id) in stale
+        ]
+        CurrentPrice.objects.filter(pk__in=stale_ids).delete()
+
+
+# (user_grocery_id, shop_id) pairs affected by a set of prices
+def pairs_for_prices(price_ids):
+    return set(
+        PriceShop.objects.filter(price_id__in=price_ids)
+        .values_list('price__user_grocery_id', 'shop_id')
+    )
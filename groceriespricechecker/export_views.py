@@ -0,0 +1,142 @@
+# groceries/export_views.py
+
+import csv
+import json
+import zlib
+from abc import ABCMeta, abstractmethod
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+from django.utils.cache import patch_vary_headers
+from rest_framework.views import APIView
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
+from rest_framework.response import Response
+from rest_framework import status
+from .middleware import accepts_encoding
+from .models import Grocery, PriceShop
+
+CONTENT_TYPES = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+
+# File-like object that hands back what csv.writer writes to it
+class Echo:
+    def write(self, value):
+        return value
+
+
+# Base view for exports that stream rows straight from a server-side cursor.
+#
+# Rows are read with values_list().iterator(chunk_size=...), encoded as NDJSON
+# or CSV (?output=ndjson|csv, default ndjson), grouped into buffers of roughly
+# `buffer_size` bytes and optionally gzip-compressed when the client's
+# Accept-Encoding allows gzip (disable with ?compress=0). Memory use does not
+# depend on the number of rows exported. Subclasses implement get_queryset().
+class StreamingExportView(APIView, metaclass=ABCMeta):
+    filename = 'export'
+    # Output column names, and the ORM lookups they are read from when they differ
+    fields = []
+    lookups = {}
+    chunk_size = 2000
+    buffer_size = 64 * 1024
+
+    @abstractmethod
+    def get_queryset(self):
+        ...
+
+    def get(self, request, format=None):
+        output = request.query_params.get('output', 'ndjson')
+        if output not in CONTENT_TYPES:
+            return Response({"error": "output must be one of: ndjson, csv."},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        lookups = [self.lookups.get(field, field) for field in self.fields]
+        rows = self.get_queryset().values_list(*lookups).iterator(chunk_size=self.chunk_size)
+        encode = self.encode_ndjson if output == 'ndjson' else self.encode_csv
+        stream = self.buffered(encode(rows))
+
+        compress = (
+            request.query_params.get('compress', '1') != '0'
+            and accepts_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''), 'gzip')
+        )
+        if compress:
+            stream = self.gzip(stream)
+
+        response = StreamingHttpResponse(stream, content_type=CONTENT_TYPES[output])
+        response['Content-Disposition'] = f'attachment; filename="{self.filename}.{output}"'
+        if compress:
+            response['Content-Encoding'] = 'gzip'
+        patch_vary_headers(response, ['Accept-Encoding'])
+        return response
+
+    def encode_ndjson(self, rows):
+        encoder = DjangoJSONEncoder()
+        for row in rows:
+            yield encoder.encode(dict(zip(self.fields, row))) + '\n'
+
+    def encode_csv(self, rows):
+        writer = csv.writer(Echo())
+        yield writer.writerow(self.fields)
+        for row in rows:
+            yield writer.writerow(row)
+
+    # Join small pieces into larger byte chunks to cut per-yield overhead
+    def buffered(self, pieces):
+        buffer, size = [], 0
+        for piece in pieces:
+            buffer.append(piece)
+            size += len(piece)
+            if size >= self.buffer_size:
+                yield ''.join(buffer).encode('utf-8')
+                buffer, size = [], 0
+        if buffer:
+            yield ''.join(buffer).encode('utf-8')
+
+    def gzip(self, chunks):
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+        for chunk in chunks:
+            data = compressor.compress(chunk)
+            if data:
+                yield data
+        yield compressor.flush()
+
+
+# Full dump of the Grocery table, for staff only
+class GroceryExportView(StreamingExportView):
+    permission_classes = [IsAdminUser]
+    filename = 'groceries'
+    fields = [
+        'id', 'barcode_number', 'name', 'description', 'category', 'brand', 'size',
+        'image_url', 'store_name', 'store_price', 'store_price_last_updated',
+        'manually_entered', 'barcode_api_last_checked', 'barcode_lookup_failed', 'created_at',
+    ]
+
+    def get_queryset(self):
+        return Grocery.objects.order_by('id')
+
+
+# Price history, one row per PriceShop. Staff get every user's prices,
+# everyone else gets their own.
+class PriceExportView(StreamingExportView):
+    permission_classes = [IsAuthenticated]
+    filename = 'prices'
+    fields = [
+        'id', 'price_id', 'user_grocery', 'shop', 'shop_name', 'price', 'is_discounted',
+        'price_before_discount', 'created_at', 'active', 'deleted',
+    ]
+    lookups = {
+        'user_grocery': 'price__user_grocery_id',
+        'shop': 'shop_id',
+        'shop_name': 'shop__name',
+        'price': 'price__price',
+        'is_discounted': 'price__is_discounted',
+        'price_before_discount': 'price__price_before_discount',
+        'created_at': 'price__created_at',
+    }
+
+    def get_queryset(self):
+        queryset = PriceShop.objects.order_by('id')
+        if not self.request.user.is_staff:
+            queryset = queryset.filter(price__user_grocery__owner=self.request.user)
+        return queryset
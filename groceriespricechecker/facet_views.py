@@ -0,0 +1,31 @@
+# groceries/facet_views.py
+
+from rest_framework.views import APIView
+from rest_framework.response import Response
+from rest_framework import status
+from .facets import FACETS, get_facets
+
+
+# Grocery counts per category and brand, read from the GroceryFacet summary
+# table. ?q= keeps values starting with the query, ?facet= picks one facet
+# and ?limit= caps the values returned per facet.
+class GroceryFacetsAPIView(APIView):
+    default_limit = 50
+    max_limit = 500
+
+    def get(self, request, format=None):
+        facets = FACETS
+        facet = request.query_params.get('facet')
+        if facet:
+            if facet not in FACETS:
+                return Response({"error": f"facet must be one of: {', '.join(FACETS)}."},
+                                status=status.HTTP_400_BAD_REQUEST)
+            facets = [facet]
+
+        limit = request.query_params.get('limit', str(self.default_limit))
+        if not limit.isdigit() or not 0 < int(limit) <= self.max_limit:
+            return Response({"error": f"limit must be between 1 and {self.max_limit}."},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        prefix = request.query_params.get('q', '').strip()
+        return Response(get_facets(facets, prefix=prefix, limit=int(limit)), status=status.HTTP_200_OK)
@@ -0,0 +1,77 @@
+# groceries/facets.py
+
+# Category and brand counts for catalog browsing, kept in the GroceryFacet
+# summary table. Single Grocery saves and deletes adjust the counts through
+# signals; bulk writes that skip signals are fixed by rebuild_facets (the
+# rebuild_facets command).
+
+from django.db import transaction
+from django.db.models import Count, F
+from .models import Grocery, GroceryFacet
+
+FACETS = [GroceryFacet.CATEGORY, GroceryFacet.BRAND]
+
+
+# The facet values a grocery counts towards, as {facet: value}
+def facet_values(category, brand):
+    values = {}
+    for facet, value in zip(FACETS, (category, brand)):
+        value = (value or '').strip()[:100]
+        if value:
+            values[facet] = value
+    return values
+
+
+# Add `delta` to the count of each (facet, value)
+def adjust_facets(values, delta):
+    if not values or not delta:
+        return
+    GroceryFacet.objects.bulk_create(
+        [GroceryFacet(facet=facet, value=value, key=value.lower()) for facet, value in values.items()],
+        ignore_conflicts=True,
+    )
+    for facet, value in values.items():
+        GroceryFacet.objects.filter(facet=facet, value=value).update(count=F('count') + delta)
+
+
+# Move a grocery's counts from its old values to its new ones
+def update_facets(old_values, new_values):
+    removed = {f: v for f, v in old_values.items() if new_values.get(f) != v}
+    added = {f: v for f, v in new_values.items() if old_values.get(f) != v}
+    if not removed and not added:
+        return
+    with transaction.atomic():
+        adjust_facets(removed, -1)
+        adjust_facets(added, 1)
+
+
+# Recompute the whole table from Grocery with one GROUP BY per facet
+def rebuild_facets():
+    counts = {}
+    for facet in FACETS:
+        for value, count in Grocery.objects.values_list(facet).annotate(count=Count('id')).order_by():
+            value = (value or '').strip()[:100]
+            if value:
+                counts[facet, value] = counts.get((facet, value), 0) + count
+    with transaction.atomic():
+        GroceryFacet.objects.all().delete()
+        GroceryFacet.objects.bulk_create(
+            [GroceryFacet(facet=facet, value=value, key=value.lower(), count=count)
+             for (facet, value), count in counts.items()],
+            batch_size=1000,
+        )
+    return len(counts)
+
+
+# Top facet values by count, optionally only those starting with `prefix`
+def get_facets(facets=FACETS, prefix=None, limit=50):
+    result = {}
+    for facet in facets:
+        queryset = GroceryFacet.objects.filter(facet=facet, count__gt=0)
+        if prefix:
+            queryset = queryset.filter(key__startswith=prefix.lower())
+        result[facet] = [
+            {"value": value, "count": count}
+            for value, count in queryset.order_by('-count', 'value').values_list('value', 'count')[:limit]
+        ]
+    return result
@@ -0,0 +1,120 @@
+# groceries/idempotency.py
+
+# Idempotency-Key support for POST endpoints.
+#
+# The first response to a POST carrying an Idempotency-Key header is stored in
+# the cache for IDEMPOTENCY_TTL seconds and replayed for any retry with the
+# same key, method, path and credentials (the client IP for anonymous
+# requests). A retry that arrives while the original is still running polls
+# for its response for up to IDEMPOTENCY_WAIT seconds and replays it; if the
+# original is still running after that, the retry gets a 409 with Retry-After
+# rather than holding a worker thread any longer. Entries expire through the
+# cache's TTL, so there is nothing to clean up.
+#
+# Keys are only shared between processes through a shared cache (REDIS_URL);
+# gunicorn.conf.py warns when workers run without one.
+
+import hashlib
+import time
+from functools import wraps
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse, JsonResponse
+from rest_framework.throttling import BaseThrottle
+
+HEADER = 'HTTP_IDEMPOTENCY_KEY'
+# Headers copied from the original response into replays
+REPLAYED_HEADERS = ('Content-Type', 'Location')
+# Seconds between checks for the original's response
+POLL_INTERVAL = 0.05
+
+
+def _digest(*parts):
+    return hashlib.sha256("\x00".join(parts).encode('utf-8')).hexdigest()
+
+
+# Who the key belongs to: the credentials, or for anonymous requests the
+# client address as DRF's throttles see it (honouring NUM_PROXIES)
+def _caller(request):
+    authorization = request.META.get('HTTP_AUTHORIZATION')
+    if authorization:
+        return f"auth:{authorization}"
+    return f"ip:{BaseThrottle().get_ident(request)}"
+
+
+# Wait for the request holding the key's lock to store its response. Returns
+# (record, locked): the stored record, or locked=True if the original finished
+# without storing one (a server error) and this request now holds the lock, or
+# neither if the original is still running after IDEMPOTENCY_WAIT seconds.
+def _await_original(record_key, lock_key, fingerprint):
+    deadline = time.monotonic() + settings.IDEMPOTENCY_WAIT
+    while True:
+        record = cache.get(record_key)
+        if record is not None:
+            return record, False
+        if cache.add(lock_key, fingerprint, settings.IDEMPOTENCY_LOCK_TIMEOUT):
+            # The original may have stored its response and let go of the
+            # lock since the read above
+            record = cache.get(record_key)
+            if record is not None:
+                cache.delete(lock_key)
+            return record, record is None
+        if time.monotonic() >= deadline:
+            return None, False
+        time.sleep(POLL_INTERVAL)
+
+
+def idempotent(view):
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        key = request.META.get(HEADER)
+        if request.method != 'POST' or not key:
+            return view(request, *args, **kwargs)
+        if len(key) > 255:
+            return JsonResponse({"error": "Idempotency-Key must be at most 255 characters."}, status=400)
+
+        # Scope keys to the caller so clients can't collide
+        scope = _digest(request.method, request.path, _caller(request), key)
+        record_key = f"idempotency:{scope}"
+        lock_key = f"idempotency-lock:{scope}"
+        fingerprint = hashlib.sha256(request.body).hexdigest()
+
+        record = cache.get(record_key)
+        if record is None and not cache.add(lock_key, fingerprint, settings.IDEMPOTENCY_LOCK_TIMEOUT):
+            # Only one request per key gets to run the view
+            record, locked = _await_original(record_key, lock_key, fingerprint)
+            if record is None and not locked:
+                response = JsonResponse(
+                    {"error": "A request with this Idempotency-Key is still being processed."},
+                    status=409,
+                )
+                response['Retry-After'] = '1'
+                return response
+        if record is not None:
+            if record['fingerprint'] != fingerprint:
+                return JsonResponse(
+                    {"error": "Idempotency-Key was already used with a different request body."},
+                    status=422,
+                )
+            response = HttpResponse(record['content'], status=record['status'])
+            for header, value in record['headers'].items():
+                response[header] = value
+            response['Idempotent-Replayed'] = 'true'
+            return response
+
+        try:
+            response = view(request, *args, **kwargs)
+            if hasattr(response, 'render') and callable(response.render):
+                response = response.render()
+            # Server errors are not stored, so a retry runs the request again
+            if not response.streaming and response.status_code < 500:
+                cache.set(record_key, {
+                    'fingerprint': fingerprint,
+                    'status': response.status_code,
+                    'content': response.content,
+                    'headers': {h: response[h] for h in REPLAYED_HEADERS if response.has_header(h)},
+                }, settings.IDEMPOTENCY_TTL)
+            return response
+        finally:
+            cache.delete(lock_key)
+    return wrapper
@@ -0,0 +1,69 @@
+import statistics
+import time
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connection
+from django.test import Client
+from rest_framework_simplejwt.tokens import AccessToken
+from groceriespricechecker.models import Grocery, Shop
+from groceriespricechecker.shop_cache import invalidate_shops
+
+User = get_user_model()
+
+
+# Latency of shops/ and groceries/<pk>/ with a new DB connection per request
+# versus persistent, health-checked connections. The request_started and
+# request_finished connection handling of a real server is reproduced around
+# each request (the test client skips it). Run against the production-like
+# database (DATABASE_URL), since the handshake cost is what is being measured.
+class Command(BaseCommand):
+    help = "Compare endpoint latency with per-request and persistent database connections."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help="Timed requests per endpoint and mode.")
+        parser.add_argument('--username', help="User to authenticate as (defaults to the first user with shops).")
+        parser.add_argument('--max-age', type=int, default=600, help="CONN_MAX_AGE for the persistent mode.")
+
+    def handle(self, *args, **options):
+        if options['username']:
+            user = User.objects.filter(username=options['username']).first()
+        else:
+            user = User.objects.filter(pk__in=Shop.objects.values('owner_id')).order_by('pk').first()
+        grocery = Grocery.objects.order_by('pk').first()
+        if user is None or grocery is None:
+            raise CommandError("Needs a user with shops and a grocery; see generate_synthetic_data.")
+
+        client = Client(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(user)}")
+        endpoints = ['/api/shops/', f'/api/groceries/{grocery.pk}/']
+        settings_dict = connection.settings_dict
+        original = settings_dict['CONN_MAX_AGE'], settings_dict['CONN_HEALTH_CHECKS']
+        self.stdout.write(f"{connection.vendor} database, {options['requests']} requests per row")
+        try:
+            for mode, max_age, health_checks in (('per-request', 0, False),
+                                                 ('persistent', options['max_age'], True)):
+                settings_dict['CONN_MAX_AGE'], settings_dict['CONN_HEALTH_CHECKS'] = max_age, health_checks
+                connection.close()
+                for url in endpoints:
+                    self.run(client, user, mode, url, options['requests'])
+        finally:
+            settings_dict['CONN_MAX_AGE'], settings_dict['CONN_HEALTH_CHECKS'] = original
+            connection.close()
+
+    def run(self, client, user, mode, url, requests):
+        timings = []
+        for i in range(requests + 10):
+            invalidate_shops(user.pk)  # Measure the database path, not the shop cache
+            start = time.perf_counter()
+            close_old_connections()
+            response = client.get(url)
+            close_old_connections()
+            elapsed = time.perf_counter() - start
+            if response.status_code != 200:
+                raise CommandError(f"{url} returned {response.status_code}")
+            if i >= 10:  # Warm-up requests are not counted
+                timings.append(elapsed * 1000)
+        timings.sort()
+        self.stdout.write(
+            f"{mode:<12} {url:<24} mean {statistics.mean(timings):7.2f} ms  "
+            f"p50 {timings[len(timings) // 2]:7.2f} ms  p95 {timings[int(len(timings) * 0.95)]:7.2f} ms"
+        )
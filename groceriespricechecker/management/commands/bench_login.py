@@ -0,0 +1,67 @@
+import time
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+from groceriespricechecker.serializers import CustomTokenObtainPairSerializer
+
+User = get_user_model()
+
+
+class Rollback(Exception):
+    pass
+
+
+# The token login path as it was before UsernameOrEmailBackend: resolve the
+# email with email__iexact, authenticate again by username, then save
+# last_login on every request
+def legacy_login(identifier, password):
+    if "@" in identifier:
+        try:
+            identifier = User.objects.get(email__iexact=identifier).username
+        except User.DoesNotExist:
+            pass
+    user = ModelBackend().authenticate(None, username=identifier, password=password)
+    user.last_login = timezone.now()
+    user.save(update_fields=['last_login'])
+    return user
+
+
+def current_login(identifier, password):
+    serializer = CustomTokenObtainPairSerializer(data={'username': identifier, 'password': password})
+    serializer.is_valid(raise_exception=True)
+    return serializer.user
+
+
+class Command(BaseCommand):
+    help = "Measure email logins per second for the legacy and current token login paths."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--logins', type=int, default=500)
+        parser.add_argument('--real-hasher', action='store_true',
+                            help="Use the configured password hasher. By default a fast hasher is used "
+                                 "so the numbers show the query overhead rather than PBKDF2.")
+
+    def handle(self, *args, **options):
+        hashers = None if options['real_hasher'] else ['django.contrib.auth.hashers.MD5PasswordHasher']
+        with override_settings(**({'PASSWORD_HASHERS': hashers} if hashers else {})):
+            try:
+                # Everything happens in a transaction that is rolled back
+                with transaction.atomic():
+                    User.objects.create_user('benchlogin', 'Bench.Login@example.com', 'Password123')
+                    for name, login in (('legacy', legacy_login), ('current', current_login)):
+                        self.run(name, login, options['logins'])
+                    raise Rollback
+            except Rollback:
+                pass
+
+    def run(self, name, login, logins):
+        with CaptureQueriesContext(connection) as queries:
+            login('bench.login@example.com', 'Password123')
+        start = time.perf_counter()
+        for _ in range(logins):
+            login('bench.login@example.com', 'Password123')
+        elapsed = time.perf_counter() - start
+        self.stdout.write(f"{name:<8} {logins / elapsed:>10.1f} logins/s  {len(queries)} queries on first login")
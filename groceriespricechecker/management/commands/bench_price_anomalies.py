@@ -0,0 +1,43 @@
+import time
+import numpy as np
+from django.core.management.base import BaseCommand
+from groceriespricechecker.anomalies import pair_keys, score_prices
+
+
+class Command(BaseCommand):
+    help = "Measure how many price observations per second the anomaly scoring stage handles."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--observations', type=int, default=50000, help="New prices per scored batch.")
+        parser.add_argument('--pairs', type=int, default=20000, help="Distinct (user grocery, shop) pairs.")
+        parser.add_argument('--history', type=int, default=50, help="History prices per pair.")
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(0)
+        pairs = options['pairs']
+        # In-memory arrays shaped like load_history() output, so the numbers
+        # cover the NumPy stage only, not the history query
+        base = rng.uniform(0.5, 20, pairs)
+        history_pairs = np.repeat(np.arange(pairs), options['history'])
+        history_values = base[history_pairs] * rng.normal(1, 0.05, len(history_pairs))
+        batch_pairs = rng.integers(0, pairs, options['observations'])
+        values = base[batch_pairs] * rng.normal(1, 0.05, len(batch_pairs))
+        typos = rng.random(len(values)) < 0.01
+        values[typos] /= 100
+
+        history_keys = pair_keys(history_pairs + 1, history_pairs % 97 + 1)
+        keys = pair_keys(batch_pairs + 1, batch_pairs % 97 + 1)
+        timings = []
+        for _ in range(options['repeat']):
+            start = time.perf_counter()
+            _, anomalies = score_prices(history_keys, history_values, keys, values)
+            timings.append(time.perf_counter() - start)
+
+        best = min(timings)
+        self.stdout.write(
+            f"{len(values)} observations against {len(history_values)} history prices: "
+            f"{best * 1000:.1f} ms, {len(values) / best:,.0f} observations/s"
+        )
+        self.stdout.write(f"Flagged {int(anomalies.sum())} of {int(typos.sum())} injected typos "
+                          f"({int((anomalies & typos).sum())} true positives).")
@@ -0,0 +1,55 @@
+import time
+from datetime import timedelta
+from decimal import Decimal
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from django.utils.text import compress_string
+from rest_framework.renderers import JSONRenderer
+from groceriespricechecker.models import Grocery
+from groceriespricechecker.renderers import ColumnarJSONRenderer, MessagePackRenderer
+from groceriespricechecker.serializers import GrocerySerializer
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+class Command(BaseCommand):
+    help = "Compare encode time and payload size of the JSON, columnar JSON and MessagePack renderers."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1000, help="Number of synthetic groceries per payload.")
+        parser.add_argument('--repeat', type=int, default=20, help="Number of timed encodes per renderer.")
+
+    def handle(self, *args, **options):
+        rows, repeat = options['rows'], options['repeat']
+        now = timezone.now()
+        # Unsaved instances, so the benchmark needs no data in the database
+        groceries = [
+            Grocery(
+                id=i, barcode_number=f"{4006381333931 + i}", name=f"Product {i}",
+                description="Synthetic product used for renderer benchmarks.",
+                category="Food, Beverages & Tobacco > Food Items", brand="Brand", size="500 g",
+                image_url=f"https://images.example.com/{i}.jpg", store_name="Store",
+                store_price=Decimal("3.49") + i % 100, store_price_last_updated=now - timedelta(days=i % 30),
+                barcode_api_last_checked=now, created_at=now,
+            )
+            for i in range(rows)
+        ]
+        data = GrocerySerializer(groceries, many=True).data
+
+        renderers = [('json', JSONRenderer()), ('columnar', ColumnarJSONRenderer()), ('msgpack', MessagePackRenderer())]
+        self.stdout.write(f"{rows} rows, best of {repeat} encodes")
+        self.stdout.write(f"{'renderer':<10} {'encode ms':>10} {'bytes':>10} {'gzip':>10} {'brotli':>10}")
+        for name, renderer in renderers:
+            timings = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                payload = renderer.render(data)
+                timings.append(time.perf_counter() - start)
+            gzip_size = len(compress_string(payload))
+            brotli_size = len(brotli.compress(payload, quality=4)) if brotli else 0
+            self.stdout.write(
+                f"{name:<10} {min(timings) * 1000:>10.2f} {len(payload):>10} {gzip_size:>10} {brotli_size or '-':>10}"
+            )
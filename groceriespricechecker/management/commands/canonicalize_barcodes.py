@@ -0,0 +1,129 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from groceriespricechecker.barcodes import VALID_LENGTHS, try_normalize_barcode
+from groceriespricechecker.models import Grocery, GroceryItem
+
+# Fields copied onto the surviving row when it has no value of its own
+MERGE_FIELDS = [
+    'description', 'category', 'brand', 'size', 'image_url',
+    'store_name', 'store_price', 'store_price_last_updated',
+]
+
+
+# Rank rows so the best candidate to keep sorts first: manually entered data
+# wins, then successful lookups, then the most recently checked row
+def keep_priority(grocery):
+    last_checked = grocery.barcode_api_last_checked.timestamp() if grocery.barcode_api_last_checked else 0
+    return (not grocery.manually_entered, grocery.barcode_lookup_failed, -last_checked, grocery.id)
+
+
+# Every stored form that normalizes to `canonical`: the same GTIN with or
+# without leading zero padding
+def barcode_variants(canonical):
+    gtin14 = canonical.zfill(14)
+    return [gtin14[14 - length:] for length in VALID_LENGTHS if not gtin14[:14 - length].strip('0')]
+
+
+class Command(BaseCommand):
+    help = ("Rewrite Grocery.barcode_number in canonical GTIN form and merge rows that refer to the same "
+            "product, and canonicalize GroceryItem.barcode.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="Report changes without writing them.")
+        parser.add_argument('--batch-size', type=int, default=2000, help="Rows read per batch.")
+
+    # Walk the table in primary key batches. Only rows whose barcode is not
+    # canonical start a merge; their groups (every row holding the same code
+    # with other padding) are loaded with one query per batch.
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        queryset = (
+            Grocery.objects.exclude(barcode_number__isnull=True).exclude(barcode_number='')
+            .only('pk', 'barcode_number').order_by('pk')
+        )
+        renamed = merged = invalid = 0
+        handled = set()  # Rows already merged; under --dry-run they are still in the table
+        last_pk = 0
+        while True:
+            rows = list(queryset.filter(pk__gt=last_pk)[:options['batch_size']])
+            if not rows:
+                break
+            last_pk = rows[-1].pk
+
+            lookup = set()
+            for row in rows:
+                canonical = try_normalize_barcode(row.barcode_number)
+                if canonical is None:
+                    invalid += 1
+                elif canonical != row.barcode_number and row.pk not in handled:
+                    # The row itself too, in case it was stored with spaces or dashes
+                    lookup.update(barcode_variants(canonical), [row.barcode_number])
+            if not lookup:
+                continue
+
+            groups = {}
+            for grocery in Grocery.objects.filter(barcode_number__in=lookup):
+                groups.setdefault(try_normalize_barcode(grocery.barcode_number), []).append(grocery)
+
+            for canonical, groceries in groups.items():
+                if len(groceries) == 1 and groceries[0].barcode_number == canonical:
+                    continue
+                if dry_run and any(grocery.pk in handled for grocery in groceries):
+                    # A row stored with separators joining a group reported earlier
+                    merged += sum(grocery.pk not in handled for grocery in groceries)
+                    handled.update(grocery.pk for grocery in groceries)
+                    continue
+                handled.update(grocery.pk for grocery in groceries)
+                groceries.sort(key=keep_priority)
+                keeper, duplicates = groceries[0], groceries[1:]
+
+                for field in MERGE_FIELDS:
+                    if getattr(keeper, field) in (None, ''):
+                        for duplicate in duplicates:
+                            value = getattr(duplicate, field)
+                            if value not in (None, ''):
+                                setattr(keeper, field, value)
+                                break
+                if keeper.name in ('', 'Unknown Product'):
+                    keeper.name = next((d.name for d in duplicates if d.name), keeper.name)
+                if keeper.barcode_number != canonical:
+                    renamed += 1
+                    keeper.barcode_number = canonical
+
+                merged += len(duplicates)
+                if dry_run:
+                    continue
+                with transaction.atomic():
+                    # Delete first so the unique constraint on barcode_number is free
+                    Grocery.objects.filter(pk__in=[d.pk for d in duplicates]).delete()
+                    keeper.save()
+
+        items = self.canonicalize_items(options['batch_size'], dry_run)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{'Would update' if dry_run else 'Updated'} {renamed} barcodes, "
+            f"merged {merged} duplicate rows, skipped {invalid} invalid barcodes, "
+            f"{'would update' if dry_run else 'updated'} {items} grocery item barcodes."
+        ))
+
+    # Grocery items have no uniqueness to preserve; valid GTINs are rewritten
+    # in canonical form (price drop alerts match on them) and the rest left alone
+    def canonicalize_items(self, batch_size, dry_run):
+        queryset = GroceryItem.objects.filter(barcode__gt='').only('pk', 'barcode').order_by('pk')
+        updated = 0
+        last_pk = 0
+        while True:
+            rows = list(queryset.filter(pk__gt=last_pk)[:batch_size])
+            if not rows:
+                break
+            last_pk = rows[-1].pk
+            changed = []
+            for row in rows:
+                canonical = try_normalize_barcode(row.barcode)
+                if canonical and canonical != row.barcode:
+                    row.barcode = canonical
+                    changed.append(row)
+            updated += len(changed)
+            if not dry_run:
+                GroceryItem.objects.bulk_update(changed, ['barcode'])
+        return updated
@@ -0,0 +1,34 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from groceriespricechecker.synthetic import PASSWORD, generate
+
+
+# For local benchmarks and query plan checks at a realistic scale; don't run
+# it against production
+class Command(BaseCommand):
+    help = "Populate the database with synthetic users, shops, shopping lists, prices and groceries."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10)
+        parser.add_argument('--shops-per-user', type=int, default=5)
+        parser.add_argument('--lists-per-user', type=int, default=3)
+        parser.add_argument('--items-per-list', type=int, default=20)
+        parser.add_argument('--prices-per-item', type=int, default=3)
+        parser.add_argument('--catalog-size', type=int, default=1000, help="Number of Grocery rows.")
+        parser.add_argument('--prefix', default='synthetic', help="Username prefix of the generated users.")
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        prefix = options['prefix']
+        if get_user_model().objects.filter(username__startswith=f"{prefix}-").exists():
+            raise CommandError(f"Users named '{prefix}-*' already exist; pick another --prefix.")
+
+        counts = generate(
+            users=options['users'], shops_per_user=options['shops_per_user'],
+            lists_per_user=options['lists_per_user'], items_per_list=options['items_per_list'],
+            prices_per_item=options['prices_per_item'], catalog_size=options['catalog_size'],
+            prefix=prefix, seed=options['seed'],
+        )
+        for model, count in counts.items():
+            self.stdout.write(f"{model:<16} {count:>10}")
+        self.stdout.write(self.style.SUCCESS(f"Done. Users log in as '{prefix}-<n>' with password '{PASSWORD}'."))
@@ -0,0 +1,70 @@
+import gzip
+import json
+import os
+import sqlite3
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from groceriespricechecker.barcodes import try_normalize_barcode
+from groceriespricechecker.providers import open_food_facts_fields
+
+
+class Command(BaseCommand):
+    help = (
+        "Build the local product database (an SQLite file keyed by canonical barcode) "
+        "from an Open Food Facts style JSONL dump, optionally gzipped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('dump', help="Path to the .jsonl or .jsonl.gz product dump.")
+        parser.add_argument('--output', default=None,
+                            help="Database file to write. Defaults to settings.LOCAL_PRODUCT_DB.")
+        parser.add_argument('--batch-size', type=int, default=10000)
+
+    def handle(self, *args, **options):
+        output = options['output'] or settings.LOCAL_PRODUCT_DB
+        if not output:
+            raise CommandError("Pass --output or set LOCAL_PRODUCT_DB.")
+
+        # Build next to the target and swap it in at the end, so readers
+        # never see a half-written file
+        building = f"{output}.building"
+        if os.path.exists(building):
+            os.remove(building)
+        connection = sqlite3.connect(building)
+        connection.execute("PRAGMA journal_mode = OFF")
+        connection.execute("PRAGMA synchronous = OFF")
+        connection.execute("CREATE TABLE products (barcode TEXT PRIMARY KEY, data TEXT NOT NULL) WITHOUT ROWID")
+
+        opener = gzip.open if options['dump'].endswith('.gz') else open
+        imported = skipped = 0
+        batch = []
+        with opener(options['dump'], 'rt', encoding='utf-8') as dump:
+            for line in dump:
+                try:
+                    product = json.loads(line)
+                except ValueError:
+                    skipped += 1
+                    continue
+                barcode = try_normalize_barcode(product.get('code'))
+                if barcode is None or not product.get('product_name'):
+                    skipped += 1
+                    continue
+                fields = {k: v for k, v in open_food_facts_fields(product).items() if v}
+                batch.append((barcode, json.dumps(fields, separators=(',', ':'))))
+                if len(batch) >= options['batch_size']:
+                    imported += self.write(connection, batch)
+                    batch = []
+        imported += self.write(connection, batch)
+
+        connection.execute("VACUUM")
+        connection.close()
+        os.replace(building, output)
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {imported} products into {output} ({skipped} skipped). "
+            "Restart the workers to pick up the new file."
+        ))
+
+    def write(self, connection, batch):
+        with connection:
+            connection.executemany("INSERT OR REPLACE INTO products (barcode, data) VALUES (?, ?)", batch)
+        return len(batch)
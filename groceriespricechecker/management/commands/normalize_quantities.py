@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand
+from groceriespricechecker.models import Grocery, GroceryItem
+from groceriespricechecker.units import parse_item_quantity, parse_quantity
+
+
+# Backfill (or, with --all, recompute) the parsed quantity columns, e.g. after
+# deploying the columns or extending the unit table in units.py
+class Command(BaseCommand):
+    help = "Parse grocery sizes into the quantity/quantity_unit columns."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000, help="Rows read and updated per batch.")
+        parser.add_argument('--all', action='store_true', help="Reparse rows that already have a quantity.")
+
+    def handle(self, *args, **options):
+        groceries = self.normalize(
+            Grocery, ['size'], lambda grocery: parse_quantity(grocery.size), options,
+        )
+        items = self.normalize(
+            GroceryItem, ['unit', 'packaging_size'],
+            lambda item: parse_item_quantity(item.unit, item.packaging_size), options,
+        )
+        self.stdout.write(self.style.SUCCESS(f"Parsed {groceries} grocery sizes and {items} grocery item sizes."))
+
+    # Walk the table in primary key batches and bulk_update changed rows.
+    # Returns the number of rows that ended up with a quantity.
+    def normalize(self, model, source_fields, parse, options):
+        queryset = model.objects.all()
+        if not options['all']:
+            queryset = queryset.filter(quantity__isnull=True)
+        queryset = queryset.only('pk', 'quantity', 'quantity_unit', *source_fields).order_by('pk')
+
+        parsed = 0
+        last_pk = 0
+        while True:
+            rows = list(queryset.filter(pk__gt=last_pk)[:options['batch_size']])
+            if not rows:
+                break
+            last_pk = rows[-1].pk
+            changed = []
+            for row in rows:
+                quantity, quantity_unit = parse(row)
+                if quantity is not None:
+                    parsed += 1
+                if (quantity, quantity_unit) != (row.quantity, row.quantity_unit):
+                    row.quantity, row.quantity_unit = quantity, quantity_unit
+                    changed.append(row)
+            model.objects.bulk_update(changed, ['quantity', 'quantity_unit'])
+        return parsed
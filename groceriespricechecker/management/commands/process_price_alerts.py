@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from groceriespricechecker.alerts import match_price_drops, send_price_alerts
+
+
+# Meant to be run periodically, e.g. from the Heroku scheduler or cron
+class Command(BaseCommand):
+    help = "Match new discounted prices against watched shopping list items and email the alerts."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000, help="Prices scanned per batch.")
+        parser.add_argument('--no-send', action='store_true', help="Only create alerts, do not email them.")
+
+    def handle(self, *args, **options):
+        scanned, matched = match_price_drops(batch_size=options['batch_size'])
+        self.stdout.write(f"Scanned {scanned} new prices, matched {matched} price drops.")
+        if not options['no_send']:
+            sent = send_price_alerts()
+            self.stdout.write(self.style.SUCCESS(f"Sent {sent} price alert emails."))
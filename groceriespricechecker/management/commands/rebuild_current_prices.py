@@ -0,0 +1,63 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from groceriespricechecker.current_prices import (
+    build_current_price, latest_price_shops, save_current_prices, valid_price_shops,
+)
+from groceriespricechecker.models import CurrentPrice, Shop
+
+COMPARE_FIELDS = ['price_shop_id', 'price', 'is_discounted', 'price_before_discount', 'observed_at']
+
+
+class Command(BaseCommand):
+    help = "Backfill the CurrentPrice table from the price history, or report drift with --check."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true', help="Only report drift, do not write.")
+        parser.add_argument('--shops-per-batch', type=int, default=200,
+                            help="Number of shops processed per query/transaction.")
+
+    def handle(self, *args, **options):
+        check = options['check']
+        batch = options['shops_per_batch']
+        shop_ids = list(Shop.objects.order_by('id').values_list('id', flat=True))
+        missing = changed = stale = 0
+
+        # Work shop by shop so memory is bounded by the batch, not the table
+        for start in range(0, len(shop_ids), batch):
+            batch_ids = shop_ids[start:start + batch]
+            expected = {
+                (cp.user_grocery_id, cp.shop_id): cp
+                for cp in map(build_current_price, latest_price_shops(valid_price_shops().filter(shop_id__in=batch_ids)))
+            }
+            actual = {
+                (cp.user_grocery_id, cp.shop_id): cp
+                for cp in CurrentPrice.objects.filter(shop_id__in=batch_ids)
+            }
+
+            to_save = []
+            for pair, current_price in expected.items():
+                existing = actual.get(pair)
+                if existing is None:
+                    missing += 1
+                elif any(getattr(existing, f) != getattr(current_price, f) for f in COMPARE_FIELDS):
+                    changed += 1
+                else:
+                    continue
+                to_save.append(current_price)
+            stale_ids = [cp.id for pair, cp in actual.items() if pair not in expected]
+            stale += len(stale_ids)
+
+            if check:
+                continue
+            with transaction.atomic():
+                save_current_prices(to_save)
+                CurrentPrice.objects.filter(pk__in=stale_ids).delete()
+
+        summary = f"{missing} missing, {changed} out of date, {stale} stale current price rows"
+        if check:
+            if missing or changed or stale:
+                self.stdout.write(self.style.WARNING(f"Drift detected: {summary}."))
+            else:
+                self.stdout.write(self.style.SUCCESS("No drift detected."))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Rebuilt current prices: fixed {summary}."))
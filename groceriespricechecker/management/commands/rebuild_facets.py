@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from groceriespricechecker.facets import rebuild_facets
+
+
+# Needed after bulk Grocery writes that skip signals (update(), bulk_create(),
+# raw imports) and once after the GroceryFacet table is first deployed
+class Command(BaseCommand):
+    help = "Recompute the category and brand counts in the GroceryFacet table."
+
+    def handle(self, *args, **options):
+        count = rebuild_facets()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {count} facet values."))
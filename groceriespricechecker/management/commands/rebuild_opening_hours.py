@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from groceriespricechecker.models import Shop
+from groceriespricechecker.opening_hours import parse_opening_hours, sync_opening_intervals
+
+
+# Backfills ShopOpeningInterval for existing shops, or re-parses every shop
+# after a change to the opening hours parser
+class Command(BaseCommand):
+    help = "Parse Shop.opening_hours into ShopOpeningInterval rows."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help="Shops parsed and written per batch.")
+
+    def handle(self, *args, **options):
+        queryset = Shop.objects.only('pk', 'opening_hours').order_by('pk')
+        total = unparsed = 0
+        last_pk = 0
+        while True:
+            shops = list(queryset.filter(pk__gt=last_pk)[:options['batch_size']])
+            if not shops:
+                break
+            last_pk = shops[-1].pk
+            sync_opening_intervals(shops)
+            total += len(shops)
+            unparsed += sum(parse_opening_hours(shop.opening_hours) is None for shop in shops)
+        self.stdout.write(self.style.SUCCESS(
+            f"Parsed opening hours for {total} shops ({unparsed} could not be parsed)."
+        ))
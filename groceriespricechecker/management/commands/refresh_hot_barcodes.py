@@ -0,0 +1,49 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.db.models import F
+from django.utils import timezone
+from groceriespricechecker.barcode_cache import BARCODE_REFRESH_AGE, cache_product, top_barcodes, warm_barcode_cache
+from groceriespricechecker.models import BarcodePopularity, Grocery
+from groceriespricechecker.product_views import update_grocery_from_api
+
+
+# Meant to be run periodically, e.g. daily from the Heroku scheduler
+class Command(BaseCommand):
+    help = (
+        "Look up the most scanned barcodes again before their data expires, "
+        "then warm the lookup cache with them."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=500, help="Number of popular barcodes to consider.")
+        parser.add_argument('--within-days', type=int, default=14,
+                            help="Refresh barcodes whose data expires within this many days.")
+        parser.add_argument('--decay', action='store_true',
+                            help="Halve all hit counts afterwards so popularity follows recent traffic.")
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        refresh_before = now - BARCODE_REFRESH_AGE + timedelta(days=options['within_days'])
+        groceries = Grocery.objects.filter(
+            barcode_number__in=top_barcodes(options['top']),
+            manually_entered=False,
+            barcode_api_last_checked__lt=refresh_before,
+        )
+
+        refreshed = failed = 0
+        for grocery in groceries:
+            try:
+                update_grocery_from_api(grocery, now)
+            except Exception as e:
+                failed += 1
+                self.stderr.write(f"Could not refresh {grocery.barcode_number}: {e}")
+                continue
+            cache_product(grocery, now=now)
+            refreshed += 1
+
+        warmed = warm_barcode_cache(options['top'])
+        if options['decay']:
+            BarcodePopularity.objects.update(hits=F('hits') / 2)
+        self.stdout.write(self.style.SUCCESS(
+            f"Refreshed {refreshed} barcodes ({failed} failed), warmed {warmed} cache entries."
+        ))
@@ -0,0 +1,39 @@
+import time
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from groceriespricechecker.models import Grocery
+from groceriespricechecker.product_views import update_grocery_from_api
+
+
+# Works through groceries queued by the admin's "Re-lookup barcodes" action
+# (those with no barcode_api_last_checked). Meant to be run periodically.
+class Command(BaseCommand):
+    help = "Look up queued groceries in the external barcode API in batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=1000, help="Maximum number of lookups in this run.")
+        parser.add_argument('--delay', type=float, default=0.2,
+                            help="Seconds to wait between lookups to respect the provider's rate limit.")
+
+    def handle(self, *args, **options):
+        queued = (
+            Grocery.objects
+            .filter(barcode_api_last_checked__isnull=True, manually_entered=False)
+            .exclude(barcode_number=None)
+            .order_by('id')[:options['limit']]
+        )
+        found = missing = failed = 0
+        for grocery in queued.iterator(chunk_size=100):
+            try:
+                if update_grocery_from_api(grocery, timezone.now()):
+                    found += 1
+                else:
+                    missing += 1
+            except Exception as e:
+                failed += 1
+                self.stderr.write(f"Could not look up {grocery.barcode_number}: {e}")
+            time.sleep(options['delay'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Looked up {found + missing + failed} barcodes: {found} found, {missing} not found, {failed} failed."
+        ))
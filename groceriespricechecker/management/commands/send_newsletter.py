@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+from groceriespricechecker.models import NewsletterCampaign
+from groceriespricechecker.newsletter import send_newsletter
+
+
+# Safe to re-run after a crash: it picks up from the campaign's checkpoint
+class Command(BaseCommand):
+    help = "Send a newsletter campaign to the email list."
+
+    def add_arguments(self, parser):
+        parser.add_argument('campaign_id', type=int)
+        parser.add_argument('--chunk-size', type=int, default=200, help="Subscribers per checkpointed chunk.")
+        parser.add_argument('--rate', type=float, default=None,
+                            help="Maximum emails per second (defaults to NEWSLETTER_RATE).")
+
+    def handle(self, *args, **options):
+        try:
+            campaign = NewsletterCampaign.objects.get(pk=options['campaign_id'])
+        except NewsletterCampaign.DoesNotExist:
+            raise CommandError(f"Campaign {options['campaign_id']} does not exist.")
+        if campaign.finished_at:
+            self.stdout.write(f"Campaign {campaign.pk} already finished at {campaign.finished_at}.")
+            return
+
+        sent, failed = send_newsletter(campaign, chunk_size=options['chunk_size'], rate=options['rate'])
+        self.stdout.write(self.style.SUCCESS(f"Sent {sent} emails, {failed} failed."))
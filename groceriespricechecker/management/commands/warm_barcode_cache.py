@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from groceriespricechecker.barcode_cache import warm_barcode_cache
+
+
+class Command(BaseCommand):
+    help = "Preload the most scanned barcode payloads into the lookup cache."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=500, help="Number of popular barcodes to preload.")
+
+    def handle(self, *args, **options):
+        warmed = warm_barcode_cache(options['top'])
+        self.stdout.write(self.style.SUCCESS(f"Warmed {warmed} cache entries."))
@@ -0,0 +1,78 @@
+# groceries/middleware.py
+
+from django.utils.cache import patch_vary_headers
+from django.utils.text import compress_string
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - Brotli is listed in requirements.txt
+    brotli = None
+
+
+# Content codings of an Accept-Encoding header with their q-values
+def accepted_encodings(header):
+    encodings = {}
+    for part in header.split(','):
+        coding, *params = part.split(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        encodings[coding] = quality
+    return encodings
+
+
+# Whether the header allows `coding`: listed (or covered by "*") with q > 0
+def accepts_encoding(header, coding):
+    encodings = accepted_encodings(header)
+    return encodings.get(coding, encodings.get('*', 0.0)) > 0
+
+
+# Compress API responses with brotli or gzip, whichever the client accepts
+# (brotli preferred). Only GET responses are compressed: they carry the large
+# list payloads, and keeping compression away from responses to POSTs (tokens,
+# form submissions) avoids BREACH-style leaks. Streaming responses and
+# responses that are already encoded (exports, WhiteNoise static files) pass
+# through unchanged.
+class CompressionMiddleware:
+    min_length = 200
+    brotli_quality = 4
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if request.method not in ('GET', 'HEAD') or response.streaming:
+            return response
+        if response.has_header('Content-Encoding') or len(response.content) < self.min_length:
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        accept_encoding = request.META.get('HTTP_ACCEPT_ENCODING', '')
+        if brotli is not None and accepts_encoding(accept_encoding, 'br'):
+            encoding = 'br'
+            compressed = brotli.compress(response.content, quality=self.brotli_quality)
+        elif accepts_encoding(accept_encoding, 'gzip'):
+            encoding = 'gzip'
+            compressed = compress_string(response.content)
+        else:
+            return response
+        if len(compressed) >= len(response.content):
+            return response
+
+        response.content = compressed
+        response['Content-Length'] = str(len(compressed))
+        response['Content-Encoding'] = encoding
+        # The representation changed, so a strong ETag no longer applies
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        return response
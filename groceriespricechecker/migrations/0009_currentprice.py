@@ -0,0 +1,32 @@
+# Generated by Django 5.1.7 on 2026-10-19 11:35
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('groceriespricechecker', '0008_shop_image_url'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CurrentPrice',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('is_discounted', models.BooleanField(default=False)),
+                ('price_before_discount', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('observed_at', models.DateTimeField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('price_shop', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='groceriespricechecker.priceshop')),
+                ('shop', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='current_prices', to='groceriespricechecker.shop')),
+                ('user_grocery', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='current_prices', to='groceriespricechecker.usergrocery')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['shop', 'user_grocery'], name='current_price_shop_idx')],
+                'constraints': [models.UniqueConstraint(fields=('user_grocery', 'shop'), name='unique_current_price_per_shop')],
+            },
+        ),
+    ]
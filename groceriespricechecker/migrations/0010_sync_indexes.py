@@ -0,0 +1,31 @@
+# Generated by Django 5.1.7 on 2026-10-19 11:36
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('groceriespricechecker', '0009_currentprice'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='groceryitem',
+            index=models.Index(fields=['user_grocery', 'updated_at'], name='groceryitem_ug_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='shop',
+            index=models.Index(fields=['owner', 'updated_at'], name='shop_owner_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='shoppinglist',
+            index=models.Index(fields=['owner', 'updated_at'], name='shoppinglist_owner_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='usergrocery',
+            index=models.Index(fields=['owner', 'updated_at'], name='usergrocery_owner_updated_idx'),
+        ),
+    ]
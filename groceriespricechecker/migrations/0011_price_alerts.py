@@ -0,0 +1,48 @@
+# Generated by Django 5.1.7 on 2026-10-19 11:39
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('groceriespricechecker', '0010_sync_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='JobCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('position', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='usergrocery',
+            name='watch_price_drops',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.CreateModel(
+            name='PriceAlert',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('price_before_discount', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('notified_at', models.DateTimeField(blank=True, null=True)),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='price_alerts', to=settings.AUTH_USER_MODEL)),
+                ('price_shop', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='groceriespricechecker.priceshop')),
+                ('shop', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='price_alerts', to='groceriespricechecker.shop')),
+                ('user_grocery', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='price_alerts', to='groceriespricechecker.usergrocery')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['notified_at', 'owner'], name='price_alert_pending_idx')],
+                'constraints': [models.UniqueConstraint(fields=('user_grocery', 'shop', 'price'), name='unique_price_alert')],
+            },
+        ),
+    ]
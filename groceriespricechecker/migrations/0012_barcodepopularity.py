@@ -0,0 +1,22 @@
+# Generated by Django 5.1.7 on 2026-10-19 11:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('groceriespricechecker', '0011_price_alerts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BarcodePopularity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('barcode_number', models.CharField(max_length=20, unique=True)),
+                ('hits', models.BigIntegerField(db_index=True, default=0)),
+                ('last_seen', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+    ]
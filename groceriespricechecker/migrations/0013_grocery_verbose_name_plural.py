@@ -0,0 +1,17 @@
+# Generated by Django 5.1.7 on 2026-10-19 11:42
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('groceriespricechecker', '0012_barcodepopularity'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='grocery',
+            options={'verbose_name_plural': 'groceries'},
+        ),
+    ]
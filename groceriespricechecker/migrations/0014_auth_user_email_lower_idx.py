@@ -0,0 +1,19 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('groceriespricechecker', '0013_grocery_verbose_name_plural'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    # Functional index for case-insensitive email logins (LOWER(email) = ...)
+    # in UsernameOrEmailBackend. auth_user belongs to django.contrib.auth, so
+    # the index is created with SQL instead of a model Meta option.
+    operations = [
+        migrations.RunSQL(
+            sql='CREATE INDEX IF NOT EXISTS auth_user_email_lower_idx ON auth_user (LOWER(email));',
+            reverse_sql='DROP INDEX IF EXISTS auth_user_email_lower_idx;',
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.1.7 on 2026-10-19 11:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('groceriespricechecker', '0015_newsletter'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='grocery',
+            name='quantity',
+            field=models.DecimalField(blank=True, decimal_places=3, max_digits=12, null=True),
+        ),
+        migrations.AddField(
+            model_name='grocery',
+            name='quantity_unit',
+            field=models.CharField(blank=True, choices=[('g', 'Grams'), ('ml', 'Millilitres'), ('count', 'Count')], max_length=5, null=True),
+        ),
+        migrations.AddField(
+            model_name='groceryitem',
+            name='quantity',
+            field=models.DecimalField(blank=True, decimal_places=3, max_digits=12, null=True),
+        ),
+        migrations.AddField(
+            model_name='groceryitem',
+            name='quantity_unit',
+            field=models.CharField(blank=True, choices=[('g', 'Grams'), ('ml', 'Millilitres'), ('count', 'Count')], max_length=5, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='grocery',
+            index=models.Index(fields=['quantity_unit', 'quantity'], name='grocery_quantity_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='groceryitem',
+            index=models.Index(fields=['user_grocery', 'quantity_unit', 'quantity'], name='groceryitem_quantity_idx'),
+        ),
+    ]
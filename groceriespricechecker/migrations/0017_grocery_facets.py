@@ -0,0 +1,27 @@
+# Generated by Django 5.1.7 on 2026-10-19 11:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('groceriespricechecker', '0016_quantities'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GroceryFacet',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('facet', models.CharField(choices=[('category', 'Category'), ('brand', 'Brand')], max_length=10)),
+                ('value', models.CharField(max_length=100)),
+                ('key', models.CharField(max_length=100)),
+                ('count', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['facet', '-count'], name='grocery_facet_count_idx'), models.Index(fields=['facet', 'key'], name='grocery_facet_key_idx', opclasses=['varchar_pattern_ops', 'varchar_pattern_ops'])],
+                'constraints': [models.UniqueConstraint(fields=('facet', 'value'), name='unique_grocery_facet')],
+            },
+        ),
+    ]
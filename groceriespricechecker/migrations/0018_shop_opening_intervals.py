@@ -0,0 +1,32 @@
+# Generated by Django 5.1.7 on 2026-10-19 11:53
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('groceriespricechecker', '0017_grocery_facets'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shop',
+            name='timezone',
+            field=models.CharField(default='UTC', max_length=64),
+        ),
+        migrations.CreateModel(
+            name='ShopOpeningInterval',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.PositiveSmallIntegerField()),
+                ('start_minute', models.PositiveSmallIntegerField()),
+                ('end_minute', models.PositiveSmallIntegerField()),
+                ('shop', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='opening_intervals', to='groceriespricechecker.shop')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['day', 'start_minute', 'end_minute'], name='shop_interval_day_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.7 on 2026-10-19 11:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('groceriespricechecker', '0018_shop_opening_intervals'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='price',
+            name='anomaly_score',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='price',
+            name='is_anomaly',
+            field=models.BooleanField(db_index=True, default=False),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.1.7 on 2026-10-19 12:12
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('groceriespricechecker', '0019_price_anomalies'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='pricealert',
+            name='unique_price_alert',
+        ),
+        migrations.AddIndex(
+            model_name='groceryitem',
+            index=models.Index(fields=['barcode'], name='groceryitem_barcode_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pricealert',
+            index=models.Index(fields=['user_grocery', 'created_at'], name='price_alert_recent_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='pricealert',
+            constraint=models.UniqueConstraint(fields=('user_grocery', 'price_shop'), name='unique_price_alert'),
+        ),
+    ]
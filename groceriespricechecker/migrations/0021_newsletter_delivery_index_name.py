@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-19 12:14
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('groceriespricechecker', '0020_price_alert_matching'),
+    ]
+
+    operations = [
+        migrations.RenameIndex(
+            model_name='newsletterdelivery',
+            new_name='newsletter_delivery_status_idx',
+            old_name='groceriespr_campaig_990515_idx',
+        ),
+    ]
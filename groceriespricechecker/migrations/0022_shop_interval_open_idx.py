@@ -0,0 +1,21 @@
+# Generated by Django 5.1.7 on 2026-10-19 12:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('groceriespricechecker', '0021_newsletter_delivery_index_name'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='shopopeninginterval',
+            name='shop_interval_day_idx',
+        ),
+        migrations.AddIndex(
+            model_name='shopopeninginterval',
+            index=models.Index(fields=['shop', 'day', 'start_minute', 'end_minute'], name='shop_interval_open_idx'),
+        ),
+    ]
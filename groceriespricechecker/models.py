@@ -1,5 +1,6 @@
 from django.conf import settings
 from django.db import models
+from .units import BASE_UNIT_CHOICES
 
 # This is a table for testing the barcode (3rd party) api
 class Grocery(models.Model):
@@ -17,10 +18,82 @@ class Grocery(models.Model):
     barcode_api_last_checked = models.DateTimeField(blank=True, null=True)
     barcode_lookup_failed = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
+    # `size` parsed into a base unit (see units.py); kept in sync on save
+    quantity = models.DecimalField(max_digits=12, decimal_places=3, blank=True, null=True)
+    quantity_unit = models.CharField(max_length=5, choices=BASE_UNIT_CHOICES, blank=True, null=True)
+
+    class Meta:
+        verbose_name_plural = 'groceries'
+        indexes = [
+            models.Index(fields=['quantity_unit', 'quantity'], name='grocery_quantity_idx'),
+        ]
 
     def __str__(self):
         return self.name
 
+    # Values as last loaded from or saved to the database, so the pre_save
+    # signal can see what changed without reading the row back
+    tracked_fields = ('category', 'brand', 'barcode_number')
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = {
+            name: value for name, value in zip(field_names, values) if name in cls.tracked_fields
+        }
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        super().refresh_from_db(using, fields, from_queryset)
+        self._remember_values(fields)
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self._remember_values(kwargs.get('update_fields'))
+
+    def _remember_values(self, fields=None):
+        loaded = getattr(self, '_loaded_values', {})
+        for name in self.tracked_fields:
+            if fields is None or name in fields:
+                loaded[name] = getattr(self, name)
+        self._loaded_values = loaded
+
+class GroceryFacet(models.Model):
+    # Number of groceries per category and per brand, kept up to date by
+    # signals (see facets.py) so browsing never has to GROUP BY Grocery
+    CATEGORY = 'category'
+    BRAND = 'brand'
+    FACET_CHOICES = [(CATEGORY, 'Category'), (BRAND, 'Brand')]
+
+    facet = models.CharField(max_length=10, choices=FACET_CHOICES)
+    value = models.CharField(max_length=100)
+    # Lowercased value for prefix search
+    key = models.CharField(max_length=100)
+    count = models.BigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['facet', 'value'], name='unique_grocery_facet'),
+        ]
+        indexes = [
+            models.Index(fields=['facet', '-count'], name='grocery_facet_count_idx'),
+            models.Index(fields=['facet', 'key'], name='grocery_facet_key_idx',
+                         opclasses=['varchar_pattern_ops', 'varchar_pattern_ops']),
+        ]
+
+    def __str__(self):
+        return f"{self.facet} {self.value}: {self.count}"
+
+class BarcodePopularity(models.Model):
+    # How often each barcode is looked up; drives cache warming and proactive
+    # refreshes of the hottest products (see barcode_cache.py)
+    barcode_number = models.CharField(max_length=20, unique=True)
+    hits = models.BigIntegerField(default=0, db_index=True)
+    last_seen = models.DateTimeField(blank=True, null=True)
+
+    def __str__(self):
+        return f"{self.barcode_number} ({self.hits} hits)"
+
 class Message(models.Model):
     name = models.CharField(max_length=100)
     email = models.EmailField()
@@ -59,11 +132,34 @@ class Shop(BaseModel):
     latitude = models.DecimalField(max_digits=9, decimal_places=6, blank=True, null=True)
     longitude = models.DecimalField(max_digits=9, decimal_places=6, blank=True, null=True)
     opening_hours = models.TextField()
+    # IANA timezone the opening hours are given in
+    timezone = models.CharField(max_length=64, default='UTC')
     image_url = models.URLField(max_length=500, blank=True, null=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['owner', 'updated_at'], name='shop_owner_updated_idx'),
+        ]
+
     def __str__(self):
         return self.name
 
+class ShopOpeningInterval(models.Model):
+    # Shop.opening_hours parsed into weekly intervals in the shop's local time
+    # (see opening_hours.py). Day 0 is Monday; minutes count from local midnight.
+    shop = models.ForeignKey(Shop, on_delete=models.CASCADE, related_name='opening_intervals')
+    day = models.PositiveSmallIntegerField()
+    start_minute = models.PositiveSmallIntegerField()
+    end_minute = models.PositiveSmallIntegerField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['shop', 'day', 'start_minute', 'end_minute'], name='shop_interval_open_idx'),
+        ]
+
+    def __str__(self):
+        return f"Shop {self.shop_id} day {self.day} {self.start_minute}-{self.end_minute}"
+
 class ShoppingList(BaseModel):
     # Relationship: many shopping_list to one auth_user
     owner = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='shopping_lists')
@@ -71,6 +167,11 @@ class ShoppingList(BaseModel):
     name = models.CharField(max_length=255)
     description = models.TextField(blank=True, null=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['owner', 'updated_at'], name='shoppinglist_owner_updated_idx'),
+        ]
+
     def __str__(self):
         return self.name
 
@@ -81,6 +182,14 @@ class UserGrocery(BaseModel):
     shopping_list = models.ForeignKey(ShoppingList, on_delete=models.CASCADE, related_name='user_groceries')
     owner = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='user_groceries')
 
+    # Whether the owner wants price drop alerts for this item
+    watch_price_drops = models.BooleanField(default=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['owner', 'updated_at'], name='usergrocery_owner_updated_idx'),
+        ]
+
     def __str__(self):
         return f"UserGrocery {self.id}"
 
@@ -96,6 +205,19 @@ class GroceryItem(BaseModel):
     unit = models.CharField(max_length=50, blank=True, null=True)
     packaging_size = models.CharField(max_length=100, blank=True, null=True)
     image = models.URLField(blank=True, null=True)  # Or use ImageField if you configure media storage
+    # `unit` and `packaging_size` parsed into a base unit (see units.py); kept in sync on save
+    quantity = models.DecimalField(max_digits=12, decimal_places=3, blank=True, null=True)
+    quantity_unit = models.CharField(max_length=5, choices=BASE_UNIT_CHOICES, blank=True, null=True)
+
+    class Meta:
+        # GroceryItem has no owner column; sync reaches it through the owner's
+        # user groceries, so index the changes per user_grocery instead
+        indexes = [
+            models.Index(fields=['user_grocery', 'updated_at'], name='groceryitem_ug_updated_idx'),
+            models.Index(fields=['user_grocery', 'quantity_unit', 'quantity'], name='groceryitem_quantity_idx'),
+            # Price drop alerts match other users' observations by barcode
+            models.Index(fields=['barcode'], name='groceryitem_barcode_idx'),
+        ]
 
     def __str__(self):
         return self.name
@@ -109,6 +231,10 @@ class Price(BaseModel):
     price = models.DecimalField(max_digits=10, decimal_places=2)
     is_discounted = models.BooleanField(default=False)
     price_before_discount = models.DecimalField(max_digits=10, decimal_places=2, blank=True, null=True)
+    # Set at ingestion by anomalies.py: the robust z-score against the recent
+    # history of the same item and shop, and whether it was flagged as an outlier
+    anomaly_score = models.FloatField(blank=True, null=True)
+    is_anomaly = models.BooleanField(default=False, db_index=True)
 
     def __str__(self):
         return f"{self.price} (Discounted: {self.is_discounted})"
@@ -121,7 +247,70 @@ class PriceShop(BaseModel):
     shop = models.ForeignKey(Shop, on_delete=models.CASCADE, related_name='price_shops')
 
     def __str__(self):
-        return f"PriceShop for Price ID {self.price.id} at Shop {self.shop.name}"
+        return f"PriceShop for Price ID {self.price_id} at Shop {self.shop.name}"
+
+class CurrentPrice(models.Model):
+    # Denormalized "latest active price per user_grocery per shop". One row per
+    # pair, kept in sync by current_prices.refresh_current_prices() (called from
+    # signals and bulk writes) and rebuilt with the rebuild_current_prices command.
+    user_grocery = models.ForeignKey(UserGrocery, on_delete=models.CASCADE, related_name='current_prices')
+    shop = models.ForeignKey(Shop, on_delete=models.CASCADE, related_name='current_prices')
+    price_shop = models.ForeignKey(PriceShop, on_delete=models.CASCADE, related_name='+')
+
+    price = models.DecimalField(max_digits=10, decimal_places=2)
+    is_discounted = models.BooleanField(default=False)
+    price_before_discount = models.DecimalField(max_digits=10, decimal_places=2, blank=True, null=True)
+    observed_at = models.DateTimeField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user_grocery', 'shop'], name='unique_current_price_per_shop'),
+        ]
+        indexes = [
+            models.Index(fields=['shop', 'user_grocery'], name='current_price_shop_idx'),
+        ]
+
+    def __str__(self):
+        return f"Current price {self.price} for UserGrocery {self.user_grocery_id} at Shop {self.shop_id}"
+
+class PriceAlert(models.Model):
+    # A discounted price the owner recorded at one of their shops for a
+    # watched UserGrocery (or another of their items with the same barcode).
+    # Created in batches by alerts.match_price_drops() and emailed by
+    # alerts.send_price_alerts().
+    owner = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='price_alerts')
+    user_grocery = models.ForeignKey(UserGrocery, on_delete=models.CASCADE, related_name='price_alerts')
+    shop = models.ForeignKey(Shop, on_delete=models.CASCADE, related_name='price_alerts')
+    price_shop = models.ForeignKey(PriceShop, on_delete=models.CASCADE, related_name='+')
+
+    price = models.DecimalField(max_digits=10, decimal_places=2)
+    price_before_discount = models.DecimalField(max_digits=10, decimal_places=2, blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    notified_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        constraints = [
+            # Each observation is reported at most once per watched item
+            models.UniqueConstraint(fields=['user_grocery', 'price_shop'], name='unique_price_alert'),
+        ]
+        indexes = [
+            models.Index(fields=['notified_at', 'owner'], name='price_alert_pending_idx'),
+            # Recent alerts per item, to avoid repeating the same sale price
+            models.Index(fields=['user_grocery', 'created_at'], name='price_alert_recent_idx'),
+        ]
+
+    def __str__(self):
+        return f"Price alert {self.price} for UserGrocery {self.user_grocery_id} at Shop {self.shop_id}"
+
+class JobCheckpoint(models.Model):
+    # Progress marker for resumable batch jobs, keyed by job name
+    name = models.CharField(max_length=100, unique=True)
+    position = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} at {self.position}"
 
 class EmailList(models.Model):
     name = models.CharField(max_length=255)
@@ -135,3 +324,40 @@ class EmailList(models.Model):
 
     def __str__(self):
         return f"{self.name} - {self.email}"
+
+
+class NewsletterCampaign(models.Model):
+    # One mailing to the whole EmailList; the bodies are wrapped in the
+    # emails/newsletter.* templates
+    subject = models.CharField(max_length=255)
+    body_text = models.TextField()
+    body_html = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return self.subject
+
+class NewsletterDelivery(models.Model):
+    SENT = 'sent'
+    FAILED = 'failed'
+    STATUS_CHOICES = [(SENT, 'Sent'), (FAILED, 'Failed')]
+
+    campaign = models.ForeignKey(NewsletterCampaign, on_delete=models.CASCADE, related_name='deliveries')
+    subscriber = models.ForeignKey(EmailList, on_delete=models.CASCADE, related_name='newsletter_deliveries')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES)
+    error = models.TextField(blank=True)
+    sent_at = models.DateTimeField()
+
+    class Meta:
+        verbose_name_plural = 'newsletter deliveries'
+        constraints = [
+            models.UniqueConstraint(fields=['campaign', 'subscriber'], name='unique_newsletter_delivery'),
+        ]
+        indexes = [
+            models.Index(fields=['campaign', 'status'], name='newsletter_delivery_status_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.campaign_id} to {self.subscriber_id}: {self.status}"
@@ -0,0 +1,137 @@
+# groceries/newsletter.py
+
+# Resumable newsletter delivery to the EmailList.
+#
+# send_newsletter() renders the campaign templates once, then walks
+# subscribers in primary key order, one chunk at a time, over a single SMTP
+# connection. Each chunk's delivery rows and the checkpoint move forward in
+# one transaction, so a crashed run resumes after the last recorded chunk
+# (subscribers in the chunk that was in flight may get the email twice).
+#
+# A dropped SMTP connection is reopened and the current subscriber retried.
+# If the server stays unreachable the run stops, recording only the
+# subscribers that were attempted on a live connection, so the next run
+# starts with the first one that wasn't.
+
+import smtplib
+import time
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.template.loader import render_to_string
+from django.utils import timezone
+from .models import EmailList, JobCheckpoint, NewsletterDelivery
+
+
+# Reconnect attempts per subscriber, and the pause before each one (doubled
+# every time)
+RECONNECT_ATTEMPTS = 3
+RECONNECT_DELAY = 1.0
+
+
+def checkpoint_name(campaign):
+    return f"newsletter:{campaign.pk}"
+
+
+# Errors that mean the connection is gone rather than that this message or
+# recipient was refused. smtplib's errors are OSErrors too.
+def is_connection_error(error):
+    if isinstance(error, smtplib.SMTPServerDisconnected):
+        return True
+    if isinstance(error, smtplib.SMTPResponseException):
+        return error.smtp_code == 421  # Service not available, closing channel
+    return isinstance(error, OSError) and not isinstance(error, smtplib.SMTPException)
+
+
+# Send one message, reopening the connection and retrying after connection
+# errors. Raises the last connection error when every attempt fails.
+def send_with_reconnect(connection, message):
+    delay = RECONNECT_DELAY
+    for attempt in range(RECONNECT_ATTEMPTS + 1):
+        try:
+            message.send()
+            return
+        except Exception as e:
+            if not is_connection_error(e) or attempt == RECONNECT_ATTEMPTS:
+                raise
+        try:
+            connection.close()
+        except OSError:
+            pass
+        time.sleep(delay)
+        delay *= 2
+        try:
+            connection.open()
+        except OSError:
+            pass  # The next send fails and counts as another attempt
+
+
+# Send `campaign` to every subscriber not covered by its checkpoint, at most
+# `rate` messages per second (None for no limit). Returns (sent, failed).
+def send_newsletter(campaign, chunk_size=200, rate=None):
+    if campaign.finished_at:
+        return 0, 0
+    if rate is None:
+        rate = settings.NEWSLETTER_RATE
+    checkpoint, _ = JobCheckpoint.objects.get_or_create(name=checkpoint_name(campaign))
+    if not campaign.started_at:
+        campaign.started_at = timezone.now()
+        campaign.save(update_fields=['started_at'])
+
+    context = {'subject': campaign.subject, 'body_text': campaign.body_text, 'body_html': campaign.body_html}
+    body = render_to_string('emails/newsletter.txt', context)
+    html = render_to_string('emails/newsletter.html', context) if campaign.body_html else None
+
+    sent = failed = 0
+    interval = 1 / rate if rate else 0
+    next_send = time.monotonic()
+    connection = get_connection()
+    with connection:
+        while True:
+            subscribers = list(
+                EmailList.objects.filter(id__gt=checkpoint.position)
+                .order_by('id').values_list('id', 'email')[:chunk_size]
+            )
+            if not subscribers:
+                break
+
+            deliveries = []
+            last_attempted = checkpoint.position
+            try:
+                for subscriber_id, email in subscribers:
+                    delay = next_send - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+                    next_send = max(next_send, time.monotonic()) + interval
+
+                    message = EmailMultiAlternatives(
+                        subject=campaign.subject, body=body,
+                        from_email=settings.DEFAULT_FROM_EMAIL, to=[email], connection=connection,
+                    )
+                    if html:
+                        message.attach_alternative(html, "text/html")
+                    try:
+                        send_with_reconnect(connection, message)
+                    except Exception as e:
+                        if is_connection_error(e):
+                            raise  # Not attempted on a live connection
+                        status, error = NewsletterDelivery.FAILED, str(e)
+                        failed += 1
+                    else:
+                        status, error = NewsletterDelivery.SENT, ''
+                        sent += 1
+                    deliveries.append(NewsletterDelivery(
+                        campaign=campaign, subscriber_id=subscriber_id,
+                        status=status, error=error, sent_at=timezone.now(),
+                    ))
+                    last_attempted = subscriber_id
+            finally:
+                # Also when giving up, so the attempts made so far are kept
+                with transaction.atomic():
+                    NewsletterDelivery.objects.bulk_create(deliveries, ignore_conflicts=True)
+                    checkpoint.position = last_attempted
+                    checkpoint.save(update_fields=['position', 'updated_at'])
+
+    campaign.finished_at = timezone.now()
+    campaign.save(update_fields=['finished_at'])
+    return sent, failed
@@ -0,0 +1,154 @@
+# groceries/opening_hours.py
+
+# Structured opening hours. Shop.opening_hours is free text in (a subset of)
+# the OpenStreetMap opening_hours syntax, e.g. "Mo-Fr 08:00-20:00; Sa
+# 09:00-14:00; Su off" or "24/7". A time range without days, the way shops
+# have always been stored (e.g. "8AM - 10PM"), applies to every day.
+# parse_opening_hours() turns it into weekly
+# (day, start minute, end minute) intervals in the shop's local time, which
+# are stored as ShopOpeningInterval rows so "open at" filters are an indexed
+# range query instead of parsing every shop's text.
+
+import re
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q
+from .models import ShopOpeningInterval
+
+MINUTES_PER_DAY = 24 * 60
+
+DAY_NAMES = {
+    'mo': 0, 'mon': 0, 'monday': 0,
+    'tu': 1, 'tue': 1, 'tues': 1, 'tuesday': 1,
+    'we': 2, 'wed': 2, 'wednesday': 2,
+    'th': 3, 'thu': 3, 'thur': 3, 'thurs': 3, 'thursday': 3,
+    'fr': 4, 'fri': 4, 'friday': 4,
+    'sa': 5, 'sat': 5, 'saturday': 5,
+    'su': 6, 'sun': 6, 'sunday': 6,
+}
+
+_DAY = r'[a-z]+'
+_DAYS_RE = re.compile(rf'^({_DAY}(?:\s*-\s*{_DAY})?(?:\s*,\s*{_DAY}(?:\s*-\s*{_DAY})?)*)\s+(.*)$', re.IGNORECASE)
+_TIME = r'(\d{1,2})(?:[:.](\d{2}))?\s*(am|pm)?'
+_RANGE_RE = re.compile(rf'^{_TIME}\s*[-–]\s*{_TIME}$', re.IGNORECASE)
+
+
+def _day(name):
+    return DAY_NAMES.get(name.strip().lower().rstrip('.'))
+
+
+# "Mo-Fr,Su" -> [0, 1, 2, 3, 4, 6]; None if a day name is not recognised
+def _parse_days(text):
+    days = []
+    for part in text.split(','):
+        first, _, last = part.partition('-')
+        start, end = _day(first), _day(last) if last else _day(first)
+        if start is None or end is None:
+            return None
+        day = start
+        days.append(day)
+        while day != end:  # Ranges may wrap around the week, e.g. Sa-Mo
+            day = (day + 1) % 7
+            days.append(day)
+    return days
+
+
+def _minute(hour, minute, meridiem):
+    hour, minute = int(hour), int(minute or 0)
+    if meridiem:
+        if not 1 <= hour <= 12:
+            return None
+        hour = hour % 12 + (12 if meridiem.lower() == 'pm' else 0)
+    if minute > 59 or hour > 24 or (hour == 24 and minute):
+        return None
+    return hour * 60 + minute
+
+
+# "08:00-12:00,13:00-18:00" -> [(480, 720), (780, 1080)]; None if malformed.
+# An end at or before the start runs past midnight.
+def _parse_ranges(text):
+    if text.strip().lower() in ('off', 'closed'):
+        return []
+    ranges = []
+    for part in text.split(','):
+        match = _RANGE_RE.match(part.strip())
+        if not match:
+            return None
+        start, end = _minute(*match.groups()[:3]), _minute(*match.groups()[3:])
+        if start is None or end is None or start >= MINUTES_PER_DAY:
+            return None
+        if end <= start:
+            end += MINUTES_PER_DAY
+        ranges.append((start, end))
+    return ranges
+
+
+# Weekly intervals as a sorted list of (day, start_minute, end_minute) with
+# day 0 = Monday, in local time. Later rules replace earlier ones for the days
+# they name (so "Mo-Su 08:00-20:00; Su off" closes on Sundays). Returns None
+# if the text can't be parsed.
+def parse_opening_hours(text):
+    if not text or not text.strip():
+        return None
+    week = {}
+    for rule in re.split(r'[;\n]', text):
+        rule = rule.strip()
+        if not rule:
+            continue
+        if rule == '24/7':
+            week.update({day: [(0, MINUTES_PER_DAY)] for day in range(7)})
+            continue
+        match = _DAYS_RE.match(rule)
+        if match:
+            days, ranges = _parse_days(match[1]), _parse_ranges(match[2])
+        else:
+            days, ranges = range(7), _parse_ranges(rule)
+        if days is None or ranges is None:
+            return None
+        week.update({day: ranges for day in days})
+
+    intervals = set()
+    for day, ranges in week.items():
+        for start, end in ranges:
+            intervals.add((day, start, min(end, MINUTES_PER_DAY)))
+            if end > MINUTES_PER_DAY:  # The part after midnight belongs to the next day
+                intervals.add(((day + 1) % 7, 0, end - MINUTES_PER_DAY))
+    return sorted(intervals)
+
+
+# Replace the stored intervals of `shops` with ones parsed from their current
+# opening_hours, using one DELETE and one INSERT. The API rejects hours that
+# can't be parsed; shops that still have them (e.g. from before validation)
+# are left without intervals and so never match an open_at filter.
+def sync_opening_intervals(shops):
+    shops = list(shops)
+    if not shops:
+        return
+    rows = [
+        ShopOpeningInterval(shop=shop, day=day, start_minute=start, end_minute=end)
+        for shop in shops
+        for day, start, end in parse_opening_hours(shop.opening_hours) or []
+    ]
+    with transaction.atomic():
+        ShopOpeningInterval.objects.filter(shop__in=[shop.pk for shop in shops]).delete()
+        ShopOpeningInterval.objects.bulk_create(rows, batch_size=1000)
+
+
+# Shop filter matching shops open at the aware datetime `moment`, for shops in
+# any of `timezones`. A shop's local weekday and minute depend on its
+# timezone, so there is one interval lookup per timezone. Each is correlated
+# with the shop row, so it only probes the (shop, day, start, end) index for
+# the shops the rest of the query selects, not every user's intervals.
+def open_at_condition(moment, timezones):
+    condition = Q(pk__in=[])
+    for name in timezones:
+        try:
+            local = moment.astimezone(ZoneInfo(name))
+        except (ZoneInfoNotFoundError, ValueError):
+            continue
+        minute = local.hour * 60 + local.minute
+        is_open = ShopOpeningInterval.objects.filter(
+            shop_id=OuterRef('pk'), day=local.weekday(), start_minute__lte=minute, end_minute__gt=minute,
+        )
+        condition |= Q(Exists(is_open), timezone=name)
+    return condition
@@ -3,7 +3,8 @@ from rest_framework.permissions import BasePermission
 class IsOwner(BasePermission):
     """
     Custom permission to only allow owners of an object to access or modify it.
-    Assumes the model instance has an `owner` attribute.
+    Assumes the model instance has an `owner` foreign key. Compares ids so the
+    owner row is never fetched.
     """
     def has_object_permission(self, request, view, obj):
-        return obj.owner == request.user
\ No newline at end of file
+        return obj.owner_id == request.user.id
\ No newline at end of file
@@ -0,0 +1,145 @@
+# groceries/price_views.py
+
+import math
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, ExpressionWrapper, F, FloatField, OuterRef, Subquery, Value, When
+from django.db.models.functions import Cast
+from rest_framework import generics
+from rest_framework.views import APIView
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework import status
+from .anomalies import score_observations
+from .current_prices import refresh_current_prices
+from .models import CurrentPrice, GroceryItem, Price, PriceShop, Shop, UserGrocery
+from .serializers import CurrentPriceSerializer, PriceObservationSerializer
+from .units import UNIT_PRICE_SCALE
+
+
+# Accepts a batch of price observations and stores each one as a Price plus a
+# PriceShop row. Ownership of every referenced user grocery and shop is checked
+# with one query per table, the batch is scored for outliers against recent
+# history with one more (see anomalies.py), and both tables are written with
+# bulk_create in a single transaction. Outliers are stored inactive when
+# PRICE_ANOMALY_ACTION is 'quarantine'.
+class PriceBulkCreateAPIView(APIView):
+    permission_classes = [IsAuthenticated]
+    max_items = 1000
+
+    def post(self, request, format=None):
+        serializer = PriceObservationSerializer(data=request.data, many=True, max_length=self.max_items)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        observations = serializer.validated_data
+
+        user_grocery_ids = set(
+            UserGrocery.objects.filter(
+                owner=request.user, deleted=False,
+                pk__in={obs['user_grocery'] for obs in observations},
+            ).values_list('id', flat=True)
+        )
+        shop_ids = set(
+            Shop.objects.filter(
+                owner=request.user, deleted=False,
+                pk__in={obs['shop'] for obs in observations},
+            ).values_list('id', flat=True)
+        )
+
+        errors = []
+        for obs in observations:
+            item_errors = {}
+            if obs['user_grocery'] not in user_grocery_ids:
+                item_errors['user_grocery'] = ['Not found.']
+            if obs['shop'] not in shop_ids:
+                item_errors['shop'] = ['Not found.']
+            errors.append(item_errors)
+        if any(errors):
+            return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+
+        scores, anomalies = score_observations(observations)
+        quarantine = settings.PRICE_ANOMALY_ACTION == 'quarantine'
+        prices = [
+            Price(
+                user_grocery_id=obs['user_grocery'],
+                price=obs['price'],
+                is_discounted=obs['is_discounted'],
+                price_before_discount=obs.get('price_before_discount'),
+                anomaly_score=None if math.isnan(score) else score,
+                is_anomaly=is_anomaly,
+                active=not (quarantine and is_anomaly),
+            )
+            for obs, score, is_anomaly in zip(observations, scores.tolist(), anomalies.tolist())
+        ]
+        with transaction.atomic():
+            Price.objects.bulk_create(prices, batch_size=self.max_items)
+            price_shops = PriceShop.objects.bulk_create(
+                [PriceShop(price=price, shop_id=obs['shop']) for price, obs in zip(prices, observations)],
+                batch_size=self.max_items,
+            )
+            # bulk_create() skips signals, so update CurrentPrice here
+            refresh_current_prices((obs['user_grocery'], obs['shop']) for obs in observations)
+
+        response_data = [
+            {
+                "id": price.id,
+                "price_shop_id": price_shop.id,
+                "user_grocery": price.user_grocery_id,
+                "shop": price_shop.shop_id,
+                "price": str(price.price),
+                "is_discounted": price.is_discounted,
+                "price_before_discount": str(price.price_before_discount) if price.price_before_discount is not None else None,
+                "is_anomaly": price.is_anomaly,
+                "active": price.active,
+            }
+            for price, price_shop in zip(prices, price_shops)
+        ]
+        return Response(response_data, status=status.HTTP_201_CREATED)
+
+
+# Annotate current prices with the pack size of their grocery item and the
+# price per 100 g / 100 ml / item, computed in the database. The division is
+# done in floating point since SQLite truncates NUMERIC division.
+def with_unit_prices(queryset):
+    item = GroceryItem.objects.filter(
+        user_grocery_id=OuterRef('user_grocery_id'), deleted=False, quantity__isnull=False,
+    ).order_by('id')
+    # Pack size in pricing units, e.g. 5.0 for 500 g
+    pricing_units = item.annotate(pricing_units=ExpressionWrapper(
+        Cast('quantity', FloatField()) / Case(
+            *[When(quantity_unit=unit, then=Value(float(scale))) for unit, scale in UNIT_PRICE_SCALE.items()],
+        ),
+        output_field=FloatField(),
+    ))
+    return queryset.annotate(
+        quantity=Subquery(item.values('quantity')[:1]),
+        quantity_unit=Subquery(item.values('quantity_unit')[:1]),
+        unit_price=ExpressionWrapper(
+            Cast('price', FloatField()) / Subquery(pricing_units.values('pricing_units')[:1]),
+            output_field=FloatField(),
+        ),
+    )
+
+
+# Current prices for the user's groceries, optionally filtered by shop, user
+# grocery and/or base unit. Served from the CurrentPrice table, so this is an
+# indexed lookup rather than a scan of the price history. ?ordering=unit_price
+# ranks the cheapest per 100 g (or ml, or item) first.
+class CurrentPriceListAPIView(generics.ListAPIView):
+    serializer_class = CurrentPriceSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        queryset = with_unit_prices(CurrentPrice.objects.filter(user_grocery__owner=self.request.user))
+        for param in ('shop', 'user_grocery'):
+            value = self.request.query_params.get(param)
+            if value:
+                if not value.isdigit():
+                    return queryset.none()
+                queryset = queryset.filter(**{f'{param}_id': value})
+        quantity_unit = self.request.query_params.get('quantity_unit')
+        if quantity_unit:
+            queryset = queryset.filter(quantity_unit=quantity_unit)
+        if self.request.query_params.get('ordering') == 'unit_price':
+            return queryset.order_by(F('unit_price').asc(nulls_last=True), 'user_grocery_id', 'shop_id')
+        return queryset.order_by('user_grocery_id', 'shop_id')
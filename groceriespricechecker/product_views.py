@@ -1,15 +1,72 @@
 # groceries/product_views.py
 
-import requests
-from datetime import timedelta
 from django.utils import timezone
-from django.conf import settings
 from rest_framework.views import APIView
+from rest_framework.permissions import IsAdminUser
 from rest_framework.response import Response
 from rest_framework import status
 from .models import Grocery
-from django.utils.dateparse import parse_datetime
-from django.utils.timezone import make_aware
+from .barcodes import normalize_barcode
+from .barcode_cache import BARCODE_REFRESH_AGE, build_product_data, cache_product, get_cached_product, tracker
+from .concurrency import Overloaded
+from .providers import ProviderError, ProviderTimeout, resolve_barcode, stats as provider_stats
+
+
+# Seconds a client is asked to wait when upstream lookups are shed
+OVERLOADED_RETRY_AFTER = 5
+
+
+# Raised when the external barcode API answers with a non-200 status
+class BarcodeLookupError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"External API error ({status_code})")
+        self.status_code = status_code
+
+
+# Whether a grocery has to be looked up in the external API
+def needs_barcode_update(grocery, created, now):
+    if created:
+        return True  # Newly created record
+    # Check if older than 6 months and not manually entered
+    if grocery.manually_entered:
+        return False
+    if grocery.barcode_api_last_checked:
+        return grocery.barcode_api_last_checked < now - BARCODE_REFRESH_AGE
+    return True  # Never checked before
+
+
+# Look the grocery's barcode up through the barcode providers (see
+# providers.py) and save the result on the grocery. Returns True if the
+# product was found and False if no provider knows the barcode. Raises
+# BarcodeLookupError when a provider answered with an error status (after
+# saving the check time) or didn't answer in time (without saving, so the
+# next request tries again), and lets network errors propagate unsaved.
+def update_grocery_from_api(grocery, now):
+    try:
+        fields, provider_name = resolve_barcode(grocery.barcode_number)
+    except ProviderTimeout as e:
+        raise BarcodeLookupError(e.status_code)
+    except ProviderError as e:
+        if e.status_code is None:
+            raise
+        grocery.barcode_api_last_checked = now
+        grocery.save()
+        raise BarcodeLookupError(e.status_code)
+
+    grocery.barcode_api_last_checked = now
+    if fields is None:
+        # Barcode doesn't exist on API
+        grocery.barcode_lookup_failed = True
+        grocery.save()
+        return False
+
+    # Update local record with whatever the winning provider knows
+    for field, value in fields.items():
+        setattr(grocery, field, value)
+    grocery.name = fields.get("name") or grocery.name or "Unknown Product"
+    grocery.barcode_lookup_failed = False
+    grocery.save()
+    return True
 
 
 class ProductFromBarcodeAPIView(APIView):
@@ -22,95 +79,66 @@ class ProductFromBarcodeAPIView(APIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
+        # Canonicalize before touching the DB or the external API so that
+        # UPC-A/EAN-13/GTIN-14 spellings of one product share a row, and bad
+        # scans never reach the provider
+        try:
+            barcode_number = normalize_barcode(barcode_number)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        tracker.record(barcode_number)
+
+        # Fresh products are served straight from the lookup cache
+        cached = get_cached_product(barcode_number)
+        if cached is not None:
+            return Response({"products": [cached]}, status=status.HTTP_200_OK)
+
         now = timezone.now()
 
         # Check if barcode exists in local DB
         grocery, created = Grocery.objects.get_or_create(barcode_number=barcode_number)
 
-        needs_update = False
-
-        if created:
-            needs_update = True  # Newly created record
-        else:
-            # Check if older than 6 months and not manually entered
-            if grocery.manually_entered:
-                needs_update = False
-            elif grocery.barcode_api_last_checked:
-                six_months_ago = now - timedelta(days=180)
-                if grocery.barcode_api_last_checked < six_months_ago:
-                    needs_update = True
-            else:
-                needs_update = True  # Never checked before
-
-        if needs_update:
-            api_url = settings.BARCODE_LOOKUP_URL
-            api_key = settings.BARCODE_LOOKUP_KEY
-            full_url = f"{api_url}?barcode={barcode_number}&formatted=y&key={api_key}"
-
+        if needs_barcode_update(grocery, created, now):
             try:
-                external_response = requests.get(full_url, timeout=10)
-                grocery.barcode_api_last_checked = now
-
-                if external_response.status_code == 200:
-                    data = external_response.json()
-                    if data.get("products"):
-                        product = data["products"][0]
-                        # Update local record
-                        grocery.name = product.get("title", grocery.name or "Unknown Product")
-                        grocery.description = product.get("description", "")
-                        grocery.category = product.get("category", "")
-                        grocery.brand = product.get("brand", "")
-                        grocery.size = product.get("size", "")
-                        grocery.image_url = product["images"][0] if product.get("images") else None
-                        if product.get("stores"):
-                            store = product["stores"][0]
-                            grocery.store_name = store.get("name", "")
-                            grocery.store_price = store.get("price") or None
-                            last_update_str = store.get("last_update")
-                            if last_update_str:
-                                parsed_date = parse_datetime(last_update_str)
-                                if parsed_date:
-                                    grocery.store_price_last_updated = make_aware(parsed_date)
-                                else:
-                                    grocery.store_price_last_updated = None
-                            else:
-                                grocery.store_price_last_updated = None
-                        grocery.barcode_lookup_failed = False
-                        grocery.save()
-                    else:
-                        # Barcode doesn't exist on API
-                        grocery.barcode_lookup_failed = True
-                        grocery.save()
-                        return Response({"error": "Barcode not found in external API."},
-                                        status=status.HTTP_404_NOT_FOUND)
-                else:
-                    grocery.save()
-                    return Response(
-                        {"error": "External API error", "status_code": external_response.status_code},
-                        status=status.HTTP_502_BAD_GATEWAY
-                    )
-
+                if not update_grocery_from_api(grocery, now):
+                    return Response({"error": "Barcode not found in external API."},
+                                    status=status.HTTP_404_NOT_FOUND)
+            except BarcodeLookupError as e:
+                return Response(
+                    {"error": "External API error", "status_code": e.status_code},
+                    status=status.HTTP_502_BAD_GATEWAY
+                )
+            except Overloaded:
+                return self.overloaded_response(grocery, created)
             except Exception as e:
                 grocery.save()
                 return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
         # Build response from grocery instance
-        response_data = {
-            "barcode_number": grocery.barcode_number,
-            "title": grocery.name,
-            "description": grocery.description,
-            "category": grocery.category,
-            "brand": grocery.brand,
-            "size": grocery.size,
-            "images": [grocery.image_url] if grocery.image_url else [],
-            "stores": [{
-                "name": grocery.store_name,
-                "price": str(grocery.store_price) if grocery.store_price else "",
-                "last_update": grocery.store_price_last_updated.strftime("%Y-%m-%d %H:%M:%S") if grocery.store_price_last_updated else ""
-            }] if grocery.store_name else [],
-            "manually_entered": grocery.manually_entered,
-            "barcode_lookup_failed": grocery.barcode_lookup_failed,
-            "barcode_api_last_checked": grocery.barcode_api_last_checked.strftime("%Y-%m-%d %H:%M:%S") if grocery.barcode_api_last_checked else ""
-        }
+        response_data = build_product_data(grocery)
+        cache_product(grocery, response_data, now)
 
         return Response({"products": [response_data]}, status=status.HTTP_200_OK)
+
+    # The upstream limiter is full: answer from the stale row when there is
+    # one (without caching it, so the next request tries again), otherwise
+    # ask the client to come back
+    def overloaded_response(self, grocery, created):
+        if not created and grocery.name:
+            response = Response({"products": [build_product_data(grocery)]}, status=status.HTTP_200_OK)
+            response['Warning'] = '110 - "Response is Stale"'
+            return response
+        return Response(
+            {"error": "Barcode lookups are temporarily overloaded, please retry."},
+            status=status.HTTP_503_SERVICE_UNAVAILABLE,
+            headers={'Retry-After': str(OVERLOADED_RETRY_AFTER)},
+        )
+
+
+# Per-provider call counts, latency percentiles and win rates for this worker
+class BarcodeProviderStatsAPIView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, format=None):
+        return Response(provider_stats.snapshot(), status=status.HTTP_200_OK)
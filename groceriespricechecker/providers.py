@@ -0,0 +1,340 @@
+# groceries/providers.py
+
+# Pluggable barcode providers and hedged resolution across them.
+#
+# Each provider turns a canonical barcode into a dict of Grocery field values,
+# returns None when it doesn't know the barcode, and raises ProviderError (or
+# any other exception) when it can't answer. resolve_barcode() asks the
+# primary provider first and, if it hasn't answered within its recent latency
+# percentile, fires the next provider too; the first product found wins.
+
+import json
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import requests
+from django.conf import settings
+from django.utils.dateparse import parse_datetime
+from django.utils.module_loading import import_string
+from django.utils.timezone import make_aware
+from .concurrency import Overloaded, upstream_limiter
+
+
+class ProviderError(Exception):
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+# No final answer within BARCODE_LOOKUP_TIMEOUT: a provider was still working
+# on it, so "not found" from the others is not conclusive
+class ProviderTimeout(ProviderError):
+    def __init__(self, message="Barcode providers timed out."):
+        super().__init__(message, status_code=504)
+
+
+class BarcodeProvider(ABC):
+    name = None
+    # Local providers are called directly, ahead of any network provider,
+    # and a "not found" from them doesn't count as a final answer
+    inline = False
+
+    @abstractmethod
+    def lookup(self, barcode_number):
+        ...
+
+
+# The paid barcode API configured by BARCODE_LOOKUP_URL/BARCODE_LOOKUP_KEY
+class BarcodeLookupProvider(BarcodeProvider):
+    name = 'barcodelookup'
+
+    def lookup(self, barcode_number):
+        api_url = settings.BARCODE_LOOKUP_URL
+        api_key = settings.BARCODE_LOOKUP_KEY
+        full_url = f"{api_url}?barcode={barcode_number}&formatted=y&key={api_key}"
+
+        external_response = requests.get(full_url, timeout=settings.BARCODE_LOOKUP_TIMEOUT)
+        if external_response.status_code != 200:
+            raise ProviderError("External API error", status_code=external_response.status_code)
+
+        data = external_response.json()
+        if not data.get("products"):
+            return None
+
+        product = data["products"][0]
+        fields = {
+            "name": product.get("title") or None,
+            "description": product.get("description", ""),
+            "category": product.get("category", ""),
+            "brand": product.get("brand", ""),
+            "size": product.get("size", ""),
+            "image_url": product["images"][0] if product.get("images") else None,
+        }
+        if product.get("stores"):
+            store = product["stores"][0]
+            fields["store_name"] = store.get("name", "")
+            fields["store_price"] = store.get("price") or None
+            fields["store_price_last_updated"] = None
+            last_update_str = store.get("last_update")
+            if last_update_str:
+                parsed_date = parse_datetime(last_update_str)
+                if parsed_date:
+                    fields["store_price_last_updated"] = make_aware(parsed_date)
+        return fields
+
+
+# Grocery fields from an Open Food Facts product record (API or dump)
+def open_food_facts_fields(product):
+    return {
+        "name": product.get("product_name"),
+        "description": product.get("generic_name", ""),
+        "category": (product.get("categories") or "").split(",")[-1].strip(),
+        "brand": (product.get("brands") or "").split(",")[0].strip(),
+        "size": product.get("quantity", ""),
+        "image_url": product.get("image_url") or None,
+    }
+
+
+# Open Food Facts, a free public product database (no store prices)
+class OpenFoodFactsProvider(BarcodeProvider):
+    name = 'openfoodfacts'
+    url = "https://world.openfoodfacts.org/api/v2/product/{barcode}.json"
+
+    def lookup(self, barcode_number):
+        external_response = requests.get(
+            self.url.format(barcode=barcode_number),
+            params={"fields": "product_name,generic_name,categories,brands,quantity,image_url"},
+            timeout=settings.BARCODE_LOOKUP_TIMEOUT,
+        )
+        if external_response.status_code == 404:
+            return None
+        if external_response.status_code != 200:
+            raise ProviderError("Open Food Facts error", status_code=external_response.status_code)
+
+        data = external_response.json()
+        product = data.get("product")
+        if data.get("status") != 1 or not product or not product.get("product_name"):
+            return None
+        return open_food_facts_fields(product)
+
+
+# Local product database built by the import_product_dump command: an SQLite
+# file with one row per canonical barcode. It is opened read-only and
+# memory-mapped, so lookups cost an index probe and the data lives in the
+# shared OS page cache rather than in each worker.
+class LocalProductProvider(BarcodeProvider):
+    name = 'local'
+    inline = True
+    mmap_size = 1 << 30
+
+    def __init__(self, path=None):
+        self.path = path or settings.LOCAL_PRODUCT_DB
+        self.local = threading.local()
+
+    def connection(self):
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            try:
+                connection = sqlite3.connect(f"file:{self.path}?mode=ro&immutable=1", uri=True)
+                connection.execute(f"PRAGMA mmap_size = {self.mmap_size}")
+            except sqlite3.DatabaseError as e:
+                raise ProviderError(f"Local product database unavailable: {e}")
+            self.local.connection = connection
+        return connection
+
+    def lookup(self, barcode_number):
+        try:
+            row = self.connection().execute(
+                "SELECT data FROM products WHERE barcode = ?", (barcode_number,)
+            ).fetchone()
+        except sqlite3.DatabaseError as e:  # Not a database, or not one we built
+            raise ProviderError(f"Local product database unusable: {e}")
+        return json.loads(row[0]) if row else None
+
+
+# Per-provider latency samples and outcome counters, kept per process
+class ProviderStats:
+    def __init__(self, window=200):
+        self.lock = threading.Lock()
+        self.latencies = {}
+        self.counters = {}
+        self.window = window
+
+    def record(self, name, latency, outcome):
+        with self.lock:
+            self.latencies.setdefault(name, deque(maxlen=self.window)).append(latency)
+            counters = self.counters.setdefault(name, {"calls": 0, "found": 0, "not_found": 0, "errors": 0, "wins": 0})
+            counters["calls"] += 1
+            counters[outcome] += 1
+
+    def record_win(self, name):
+        with self.lock:
+            self.counters.setdefault(name, {"calls": 0, "found": 0, "not_found": 0, "errors": 0, "wins": 0})
+            self.counters[name]["wins"] += 1
+
+    # Latency (seconds) below which `percentile`% of recent calls finished,
+    # or None until there are enough samples to say
+    def percentile(self, name, percentile, min_samples=20):
+        with self.lock:
+            samples = sorted(self.latencies.get(name, ()))
+        if len(samples) < min_samples:
+            return None
+        index = min(len(samples) - 1, int(len(samples) * percentile / 100))
+        return samples[index]
+
+    def snapshot(self):
+        with self.lock:
+            names = list(self.counters)
+        result = {}
+        for name in names:
+            with self.lock:
+                counters = dict(self.counters[name])
+            counters["win_rate"] = counters["wins"] / counters["calls"] if counters["calls"] else 0.0
+            for percentile in (50, 95, 99):
+                latency = self.percentile(name, percentile, min_samples=1)
+                counters[f"p{percentile}_ms"] = round(latency * 1000, 1) if latency is not None else None
+            result[name] = counters
+        return result
+
+
+stats = ProviderStats()
+_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix='barcode-provider')
+_providers = None
+
+
+def get_providers():
+    global _providers
+    if _providers is None:
+        _providers = [import_string(path)() for path in settings.BARCODE_PROVIDERS]
+    return _providers
+
+
+def _timed_lookup(provider, barcode_number):
+    start = time.monotonic()
+    try:
+        result = provider.lookup(barcode_number)
+    except Exception:
+        stats.record(provider.name, time.monotonic() - start, "errors")
+        raise
+    stats.record(provider.name, time.monotonic() - start, "found" if result else "not_found")
+    return result
+
+
+# How long to wait for a provider before hedging with the next one
+def hedge_delay(provider):
+    delay = stats.percentile(provider.name, settings.BARCODE_HEDGE_PERCENTILE)
+    if delay is None:
+        return settings.BARCODE_HEDGE_DEFAULT_DELAY
+    return max(delay, settings.BARCODE_HEDGE_MIN_DELAY)
+
+
+# Resolve a barcode across the configured providers.
+#
+# Returns (fields, provider name) for the first provider that finds the
+# product, or (None, None) if every provider that answered said "not found"
+# and none is still running. ProviderTimeout is raised when the deadline
+# passes with a provider still running; otherwise, if no provider answered,
+# the first provider's error is raised.
+# Network providers only run inside a slot of the upstream concurrency
+# limiter; concurrency.Overloaded is raised when none is free. The slot is
+# held until every call that was started has finished, including hedges that
+# lost, so abandoned calls still count against the limit.
+def resolve_barcode(barcode_number, providers=None):
+    providers = list(providers or get_providers())
+    inline_errors = []
+    for provider in [p for p in providers if p.inline]:
+        try:
+            result = _timed_lookup(provider, barcode_number)
+        except Exception as e:
+            inline_errors.append(e)
+            continue
+        if result:
+            stats.record_win(provider.name)
+            return result, provider.name
+    providers = [p for p in providers if not p.inline]
+    if not providers:
+        if inline_errors:
+            raise inline_errors[0]
+        return None, None
+
+    if not upstream_limiter.try_acquire():
+        raise Overloaded(upstream_limiter.name)
+    start = time.monotonic()
+    pending = {}
+    ok = False
+    try:
+        result = _resolve_remote(barcode_number, providers, inline_errors, pending)
+        ok = True
+        return result
+    finally:
+        _release_when_done(list(pending), start, ok)
+
+
+# Cancel calls that haven't started and give the limiter slot back once the
+# running ones finish
+def _release_when_done(futures, start, ok):
+    running = [future for future in futures if not future.cancel()]
+    if not running:
+        upstream_limiter.release(time.monotonic() - start, ok)
+        return
+    lock = threading.Lock()
+    remaining = [len(running)]
+
+    def finished(future):
+        with lock:
+            remaining[0] -= 1
+            last = remaining[0] == 0
+        if last:
+            upstream_limiter.release(time.monotonic() - start, ok)
+
+    for future in running:
+        future.add_done_callback(finished)
+
+
+# Calls still outstanding when this returns or raises are left in `pending`
+def _resolve_remote(barcode_number, providers, inline_errors, pending):
+    deadline = time.monotonic() + settings.BARCODE_LOOKUP_TIMEOUT
+    errors = []
+    answered = False
+
+    def launch(provider):
+        pending[_executor.submit(_timed_lookup, provider, barcode_number)] = provider
+
+    launch(providers.pop(0))
+    while pending:
+        timeout = deadline - time.monotonic()
+        if timeout <= 0:
+            break
+        if providers:
+            # Hedge once the oldest outstanding call is slower than usual
+            timeout = min(timeout, hedge_delay(next(iter(pending.values()))))
+        done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+        if not done:
+            if providers:
+                launch(providers.pop(0))
+            continue
+        for future in done:
+            provider = pending.pop(future)
+            try:
+                result = future.result()
+            except Exception as e:
+                errors.append(e)
+            else:
+                answered = True
+                if result:
+                    stats.record_win(provider.name)
+                    return result, provider.name
+        # The call that finished had nothing; move on to the next provider now
+        if not pending and providers:
+            launch(providers.pop(0))
+
+    if pending:
+        raise ProviderTimeout()
+    if answered:
+        return None, None
+    if errors or inline_errors:
+        raise (errors + inline_errors)[0]
+    raise ProviderTimeout()
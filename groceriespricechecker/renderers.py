@@ -0,0 +1,60 @@
+# groceries/renderers.py
+
+# Opt-in compact renderers, selected with the Accept header (or ?format=).
+# JSONRenderer stays the default.
+
+from django.core.serializers.json import DjangoJSONEncoder
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - msgpack is listed in requirements.txt
+    msgpack = None
+
+
+# Turn every list of dicts that share the same keys into
+# {"columns": [...], "rows": [[...], ...]} so each key is sent once
+def to_columnar(data):
+    if isinstance(data, dict):
+        return {key: to_columnar(value) for key, value in data.items()}
+    if isinstance(data, list):
+        if data and all(isinstance(item, dict) for item in data):
+            columns = list(data[0].keys())
+            if all(list(item.keys()) == columns for item in data):
+                return {
+                    "columns": columns,
+                    "rows": [[to_columnar(item[column]) for column in columns] for item in data],
+                }
+        return [to_columnar(item) for item in data]
+    return data
+
+
+# Column-oriented JSON: Accept: application/vnd.pricechecker.columnar+json
+class ColumnarJSONRenderer(JSONRenderer):
+    media_type = 'application/vnd.pricechecker.columnar+json'
+    format = 'columnar'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return super().render(to_columnar(data), accepted_media_type, renderer_context)
+
+
+def _msgpack_default(obj):
+    # Same string forms the JSON renderer would produce
+    return DjangoJSONEncoder().default(obj)
+
+
+# MessagePack: Accept: application/msgpack
+class MessagePackRenderer(BaseRenderer):
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if msgpack is None:
+            raise RuntimeError("msgpack is not installed.")
+        return msgpack.packb(data, default=_msgpack_default, use_bin_type=True)
@@ -1,5 +1,6 @@
+from decimal import Decimal
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 from django.contrib.auth.models import User
-from django.utils import timezone
 from django.contrib.auth.tokens import default_token_generator
 from django.core.mail import EmailMultiAlternatives
 from django.template.loader import render_to_string
@@ -9,7 +10,10 @@ from django.conf import settings
 from django.db import transaction
 from rest_framework import serializers
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
-from .models import Grocery, Message, EmailList, Shop
+from .models import Grocery, Message, EmailList, Shop, CurrentPrice, ShoppingList, UserGrocery, GroceryItem
+from .barcodes import normalize_barcode
+from .opening_hours import parse_opening_hours
+from .backends import update_last_login_coalesced
 
 # Serializer for the Grocery model
 class GrocerySerializer(serializers.ModelSerializer):
@@ -17,6 +21,23 @@ class GrocerySerializer(serializers.ModelSerializer):
         model = Grocery
         fields = '__all__'
 
+    # Store barcodes in canonical GTIN form so they match barcode lookups.
+    # The field's unique validator only saw the raw value, so uniqueness is
+    # checked again on the canonical one.
+    def validate_barcode_number(self, value):
+        if not value:
+            return value
+        try:
+            barcode = normalize_barcode(value)
+        except ValueError as e:
+            raise serializers.ValidationError(str(e))
+        existing = Grocery.objects.filter(barcode_number=barcode)
+        if self.instance is not None:
+            existing = existing.exclude(pk=self.instance.pk)
+        if existing.exists():
+            raise serializers.ValidationError("grocery with this barcode number already exists.")
+        return barcode
+
 # Serializer for user signup
 class UserSignupSerializer(serializers.ModelSerializer):
     password = serializers.CharField(write_only=True, required=True)
@@ -93,19 +114,12 @@ class UserSignupSerializer(serializers.ModelSerializer):
             )
 
 # Custom serializer for obtaining JWT tokens
+# Username-or-email resolution happens in UsernameOrEmailBackend, in the same
+# query that loads the user for authentication
 class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
     def validate(self, attrs):
-        identifier = attrs.get("username")
-        if identifier and "@" in identifier:  # Check if the identifier is an email
-            try:
-                user = User.objects.get(email__iexact=identifier)
-                attrs["username"] = user.username  # Replace with the actual username
-            except User.DoesNotExist:
-                pass  # Let authentication fail if no matching user is found
-
         data = super().validate(attrs)
-        self.user.last_login = timezone.now()
-        self.user.save(update_fields=['last_login'])
+        update_last_login_coalesced(self.user)
         return data
 
     @classmethod
@@ -147,9 +161,126 @@ class ShopSerializer(serializers.ModelSerializer):
             'latitude',
             'longitude',
             'opening_hours',
+            'timezone',
             'image_url',
             'created_at',
             'updated_at',
             'active',
             'deleted'
         ]
+
+    def validate_timezone(self, value):
+        try:
+            ZoneInfo(value)
+        except (ZoneInfoNotFoundError, ValueError):
+            raise serializers.ValidationError("Unknown timezone.")
+        return value
+
+    # Hours that can't be parsed would never match an open_at filter
+    def validate_opening_hours(self, value):
+        if parse_opening_hours(value) is None:
+            raise serializers.ValidationError(
+                'Use the OpenStreetMap format, e.g. "Mo-Fr 08:00-20:00; Sa 09:00-14:00; Su off", '
+                '"8AM - 10PM" or "24/7".'
+            )
+        return value
+
+# Serializer for bulk shop writes: the owner always comes from the request
+class ShopBulkSerializer(ShopSerializer):
+    class Meta(ShopSerializer.Meta):
+        read_only_fields = ['owner']
+
+# Serializer for one price observation in a bulk price submission. Foreign keys
+# are plain integers here; ownership and existence are checked for the whole
+# batch at once by the view instead of one query per item.
+class PriceObservationSerializer(serializers.Serializer):
+    user_grocery = serializers.IntegerField(min_value=1)
+    shop = serializers.IntegerField(min_value=1)
+    price = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=Decimal('0'))
+    is_discounted = serializers.BooleanField(default=False)
+    price_before_discount = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=Decimal('0'),
+                                                     required=False, allow_null=True)
+
+    def validate(self, attrs):
+        before = attrs.get('price_before_discount')
+        if attrs['is_discounted'] and before is not None and before <= attrs['price']:
+            raise serializers.ValidationError(
+                {'price_before_discount': ['Must be greater than the discounted price.']}
+            )
+        return attrs
+
+class CurrentPriceSerializer(serializers.ModelSerializer):
+    # Annotated by price_views.with_unit_prices
+    quantity = serializers.DecimalField(max_digits=12, decimal_places=3, read_only=True)
+    quantity_unit = serializers.CharField(read_only=True)
+    unit_price = serializers.DecimalField(max_digits=14, decimal_places=4, read_only=True)
+
+    class Meta:
+        model = CurrentPrice
+        fields = [
+            'user_grocery',
+            'shop',
+            'price_shop',
+            'price',
+            'is_discounted',
+            'price_before_discount',
+            'observed_at',
+            'quantity',
+            'quantity_unit',
+            'unit_price',
+        ]
+
+class ShoppingListSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ShoppingList
+        fields = ['id', 'owner', 'name', 'description', 'created_at', 'updated_at', 'active', 'deleted']
+
+class UserGrocerySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = UserGrocery
+        fields = ['id', 'owner', 'shopping_list', 'watch_price_drops', 'created_at', 'updated_at', 'active', 'deleted']
+
+class GroceryItemSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = GroceryItem
+        fields = [
+            'id',
+            'user_grocery',
+            'name',
+            'brand',
+            'category',
+            'description',
+            'barcode',
+            'unit',
+            'packaging_size',
+            'image',
+            'created_at',
+            'updated_at',
+            'active',
+            'deleted'
+        ]
+
+# Serializers for the nested shopping list read endpoint. They read the
+# prefetched `active_*` lists set up by ShoppingListDetailAPIView, so they
+# never trigger queries of their own.
+class ShoppingListCurrentPriceSerializer(serializers.ModelSerializer):
+    shop_name = serializers.CharField(source='shop.name', read_only=True)
+
+    class Meta:
+        model = CurrentPrice
+        fields = ['shop', 'shop_name', 'price', 'is_discounted', 'price_before_discount', 'observed_at']
+
+class ShoppingListGrocerySerializer(serializers.ModelSerializer):
+    grocery_items = GroceryItemSerializer(source='active_grocery_items', many=True, read_only=True)
+    current_prices = ShoppingListCurrentPriceSerializer(source='active_current_prices', many=True, read_only=True)
+
+    class Meta:
+        model = UserGrocery
+        fields = ['id', 'created_at', 'updated_at', 'grocery_items', 'current_prices']
+
+class ShoppingListDetailSerializer(serializers.ModelSerializer):
+    user_groceries = ShoppingListGrocerySerializer(source='active_user_groceries', many=True, read_only=True)
+
+    class Meta:
+        model = ShoppingList
+        fields = ['id', 'owner', 'name', 'description', 'created_at', 'updated_at', 'active', 'user_groceries']
@@ -0,0 +1,44 @@
+# groceries/shop_cache.py
+
+# Per-user cache of serialized shop responses. Every key embeds the user's
+# current version token, so invalidating all of a user's cached shop
+# responses is a single write of a new token. Tokens are random rather than
+# counters, so a version key that was evicted never brings back old entries.
+
+from uuid import uuid4
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+
+def version_key(user_id):
+    return f"shops-version:{user_id}"
+
+
+def shop_cache_version(user_id):
+    version = cache.get(version_key(user_id))
+    if version is None:
+        cache.add(version_key(user_id), uuid4().hex, None)
+        version = cache.get(version_key(user_id))
+    return version
+
+
+# Build the key before reading the database: if a writer commits in between,
+# the rows read are stored under the version they belong to, which is no
+# longer current, instead of under the new one
+def shop_cache_key(user_id, *parts):
+    return ":".join(["shops", str(user_id), f"v{shop_cache_version(user_id)}", *map(str, parts)])
+
+
+def get_cached_shops(key):
+    return cache.get(key)
+
+
+def cache_shops(key, data):
+    cache.set(key, data, settings.SHOP_CACHE_TIMEOUT)
+
+
+# Replace the user's version once the current transaction commits, so
+# readers can't re-cache the old rows under the new version
+def invalidate_shops(user_id):
+    transaction.on_commit(lambda: cache.set(version_key(user_id), uuid4().hex, None))
@@ -0,0 +1,157 @@
+# groceries/signals.py
+
+from django.db import connections, transaction
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from .barcode_cache import invalidate_product
+from .barcodes import try_normalize_barcode
+from .current_prices import pairs_for_prices, refresh_current_prices
+from .facets import facet_values, update_facets
+from .opening_hours import sync_opening_intervals
+from .models import Grocery, GroceryItem, Price, PriceShop, Shop
+from .shop_cache import invalidate_shops
+from .units import parse_item_quantity, parse_quantity
+
+
+# Keep CurrentPrice in sync when a single Price or PriceShop is written.
+# Soft deletes and deactivations are saves, so they are handled here too.
+@receiver(post_save, sender=PriceShop)
+def price_shop_saved(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    refresh_current_prices([(instance.price.user_grocery_id, instance.shop_id)])
+
+@receiver(post_save, sender=Price)
+def price_saved(sender, instance, created, raw=False, **kwargs):
+    if raw or created:
+        return  # A new Price has no PriceShop rows yet
+    refresh_current_prices(pairs_for_prices([instance.pk]))
+
+# Hard deletes cascade through several tables, so the deleted rows are noted
+# per transaction while they still exist, and the affected pairs are
+# recomputed once the rows are really gone: one on_commit callback and one
+# query for the owners of the prices, however many rows the cascade removed.
+class PendingPriceDeletes:
+    def __init__(self, using):
+        self.using = using
+        self.user_groceries = {}  # price_id -> user_grocery_id, from deleted Price rows
+        self.price_shops = set()  # (price_id, shop_id)
+        self.flushed = False
+
+    def flush(self):
+        self.flushed = True
+        unknown = {price_id for price_id, _ in self.price_shops} - self.user_groceries.keys()
+        if unknown:
+            self.user_groceries.update(
+                Price.objects.using(self.using).filter(pk__in=unknown).values_list('pk', 'user_grocery_id')
+            )
+        refresh_current_prices(
+            (self.user_groceries[price_id], shop_id)
+            for price_id, shop_id in self.price_shops if price_id in self.user_groceries
+        )
+
+# The batch of the connection's current transaction. A new one is started
+# once the last was flushed, or rolled back (its callback is no longer queued).
+# Deletes always run in an atomic block, so the callback waits for the cascade.
+def pending_price_deletes(using):
+    connection = connections[using]
+    pending = getattr(connection, 'pending_price_deletes', None)
+    if pending is None or pending.flushed or not any(
+            func == pending.flush for _, func, _ in connection.run_on_commit):
+        pending = connection.pending_price_deletes = PendingPriceDeletes(using)
+        transaction.on_commit(pending.flush, using=using)
+    return pending
+
+@receiver(pre_delete, sender=Price)
+def price_deleted(sender, instance, using, **kwargs):
+    pending_price_deletes(using).user_groceries[instance.pk] = instance.user_grocery_id
+
+@receiver(pre_delete, sender=PriceShop)
+def price_shop_deleted(sender, instance, using, **kwargs):
+    pending_price_deletes(using).price_shops.add((instance.price_id, instance.shop_id))
+
+# Drop cached barcode payloads when the grocery behind them changes,
+# including the payload under its old barcode when it was renamed
+@receiver(post_save, sender=Grocery)
+@receiver(post_delete, sender=Grocery)
+def grocery_changed(sender, instance, **kwargs):
+    invalidate_product(instance.barcode_number)
+    old_barcode_number = getattr(instance, '_old_barcode_number', None)
+    if old_barcode_number != instance.barcode_number:
+        invalidate_product(old_barcode_number)
+
+# Any change to a shop invalidates its owner's cached shop responses
+@receiver(post_save, sender=Shop)
+@receiver(post_delete, sender=Shop)
+def shop_changed(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    invalidate_shops(instance.owner_id)
+
+# Re-parse opening hours into ShopOpeningInterval rows whenever they may have
+# changed. Bulk shop writes call sync_opening_intervals themselves.
+@receiver(post_save, sender=Shop)
+def shop_opening_hours_saved(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw or (update_fields is not None and 'opening_hours' not in update_fields):
+        return
+    sync_opening_intervals([instance])
+
+# Parse free-text sizes into the indexed quantity columns. Rows written with
+# update() or bulk_create() are picked up by the normalize_quantities command.
+@receiver(pre_save, sender=Grocery)
+def grocery_quantity(sender, instance, raw=False, **kwargs):
+    if not raw:
+        instance.quantity, instance.quantity_unit = parse_quantity(instance.size)
+
+@receiver(pre_save, sender=GroceryItem)
+def grocery_item_quantity(sender, instance, raw=False, **kwargs):
+    if not raw:
+        instance.quantity, instance.quantity_unit = parse_item_quantity(instance.unit, instance.packaging_size)
+
+# Store valid GTINs in canonical form so price drop alerts can match items of
+# different users by barcode; anything else is kept as entered
+@receiver(pre_save, sender=GroceryItem)
+def grocery_item_barcode(sender, instance, raw=False, **kwargs):
+    if not raw and instance.barcode:
+        instance.barcode = try_normalize_barcode(instance.barcode) or instance.barcode
+
+# Keep the GroceryFacet counts in step with single-row writes. The old facet
+# values (and the old barcode, for grocery_changed) come from the values the
+# instance was loaded with (Grocery.from_db); the row is only read back when
+# one of them was deferred. Nothing is needed when update_fields shows they
+# can't change.
+@receiver(pre_save, sender=Grocery)
+def grocery_before_save(sender, instance, raw=False, update_fields=None, **kwargs):
+    instance._old_facets = {}
+    instance._old_barcode_number = None
+    if raw or instance._state.adding or instance.pk is None:
+        return
+    fields = set(Grocery.tracked_fields)
+    if update_fields is not None:
+        fields &= set(update_fields)
+    if not {'category', 'brand'} & fields:
+        instance._old_facets = None
+    if not fields:
+        return
+    old = getattr(instance, '_loaded_values', {})
+    if not fields <= old.keys():
+        row = Grocery.objects.filter(pk=instance.pk).values_list(*Grocery.tracked_fields).first()
+        if row is None:
+            return
+        old = dict(zip(Grocery.tracked_fields, row))
+    # Fields the save doesn't write keep their stored value
+    old = {name: old[name] if name in fields else getattr(instance, name) for name in Grocery.tracked_fields}
+    if instance._old_facets is not None:
+        instance._old_facets = facet_values(old['category'], old['brand'])
+    instance._old_barcode_number = old['barcode_number']
+
+@receiver(post_save, sender=Grocery)
+def grocery_facets_saved(sender, instance, raw=False, **kwargs):
+    old_facets = getattr(instance, '_old_facets', {})
+    if raw or old_facets is None:
+        return
+    update_facets(old_facets, facet_values(instance.category, instance.brand))
+
+@receiver(post_delete, sender=Grocery)
+def grocery_facets_deleted(sender, instance, **kwargs):
+    update_facets(facet_values(instance.category, instance.brand), {})
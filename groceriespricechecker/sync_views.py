@@ -0,0 +1,103 @@
+# groceries/sync_views.py
+
+from datetime import timedelta
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework.views import APIView
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework import status
+from .models import GroceryItem, Shop, ShoppingList, UserGrocery
+from .serializers import GroceryItemSerializer, ShopSerializer, ShoppingListSerializer, UserGrocerySerializer
+
+
+# Delta sync for offline-first clients.
+#
+# GET sync/?since=<cursor> returns the user's shopping lists, user groceries,
+# grocery items and shops changed since the cursor. Rows flagged `deleted` are
+# returned as tombstone ids. Without `since` it is a full sync of the
+# non-deleted rows. The response carries the cursor for the next call; rows
+# near the cursor may be sent twice, so clients must upsert.
+#
+# Rows of all models are ordered by (updated_at, model, id). A page that is
+# cut short ends in a "<updated_at>|<model>|<id>" cursor so the next page
+# resumes after that exact row, even when many rows share one updated_at
+# (bulk writes stamp a whole batch with the same time). Otherwise the cursor
+# is a plain timestamp and rows at or after it are returned.
+class SyncAPIView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    # Maximum rows returned per model in one response
+    page_size = 1000
+    # The next cursor trails "now" so rows written by transactions that were
+    # still in flight while we read are picked up by the next sync
+    cursor_lag = timedelta(seconds=5)
+
+    def get_sources(self, user):
+        return [
+            ('shopping_lists', ShoppingList.objects.filter(owner=user), ShoppingListSerializer),
+            ('user_groceries', UserGrocery.objects.filter(owner=user), UserGrocerySerializer),
+            ('grocery_items', GroceryItem.objects.filter(
+                user_grocery__in=UserGrocery.objects.filter(owner=user).values('id')
+            ), GroceryItemSerializer),
+            ('shops', Shop.objects.filter(owner=user), ShopSerializer),
+        ]
+
+    def get(self, request, format=None):
+        sources = self.get_sources(request.user)
+        names = [name for name, _, _ in sources]
+        since = after = None
+        since_param = request.query_params.get('since')
+        if since_param:
+            since_param, *position = since_param.split('|')
+            since = parse_datetime(since_param)
+            if position:
+                # Position of the last row sent: (model index, id)
+                try:
+                    after = (names.index(position[0]), int(position[1]))
+                except (ValueError, IndexError):
+                    since = None
+            if since is None:
+                return Response({"error": "since must be an ISO 8601 datetime or a cursor from a previous sync."},
+                                status=status.HTTP_400_BAD_REQUEST)
+            if timezone.is_naive(since):
+                since = timezone.make_aware(since)
+
+        started_at = timezone.now()
+        response_data = {}
+        page_ends = []
+
+        for index, (name, queryset, serializer_class) in enumerate(sources):
+            if since is None:
+                queryset = queryset.filter(deleted=False)
+            elif after is None or index > after[0]:
+                queryset = queryset.filter(updated_at__gte=since)
+            elif index < after[0]:
+                queryset = queryset.filter(updated_at__gt=since)
+            else:
+                queryset = queryset.filter(Q(updated_at__gt=since) | Q(updated_at=since, id__gt=after[1]))
+            rows = list(queryset.order_by('updated_at', 'id')[:self.page_size + 1])
+            if len(rows) > self.page_size:
+                rows = rows[:self.page_size]
+                page_ends.append((rows[-1].updated_at, index, rows[-1].id))
+
+            response_data[name] = {
+                "updated": serializer_class([row for row in rows if not row.deleted], many=True).data,
+                "deleted": [row.id for row in rows if row.deleted],
+            }
+
+        if page_ends:
+            # Resume after the earliest row a truncated model stopped at; rows
+            # after it in the other models are simply sent again
+            updated_at, index, pk = min(page_ends)
+            cursor = f"{updated_at.isoformat()}|{names[index]}|{pk}"
+        else:
+            cursor = started_at - self.cursor_lag
+            if since and since > cursor:
+                cursor = since
+            cursor = cursor.isoformat()
+
+        response_data["cursor"] = cursor
+        response_data["has_more"] = bool(page_ends)
+        return Response(response_data, status=status.HTTP_200_OK)
@@ -0,0 +1,149 @@
+# groceries/synthetic.py
+
+# Synthetic data at a configurable scale, for benchmarks and for the query
+# count and query plan tests. Everything is written with bulk_create, and the
+# derived tables (current prices, facets, opening intervals, parsed
+# quantities) are filled in as the normal write paths would.
+
+import random
+from decimal import Decimal
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.utils import timezone
+from .barcodes import gtin_check_digit
+from .current_prices import refresh_current_prices
+from .facets import rebuild_facets
+from .models import Grocery, GroceryItem, Price, PriceShop, Shop, ShoppingList, UserGrocery
+from .opening_hours import sync_opening_intervals
+from .units import parse_item_quantity, parse_quantity
+
+User = get_user_model()
+
+CATEGORIES = ['Dairy', 'Bakery', 'Produce', 'Meat', 'Frozen', 'Snacks', 'Drinks', 'Pantry', 'Household']
+BRANDS = ['Acme', 'Northfield', 'Golden Farm', 'Blue Coast', 'Harvest', 'Everyday', 'Prime Choice']
+SIZES = [('500 g', 'g', '500'), ('1 kg', 'kg', '1'), ('330 ml', 'ml', '330'), ('1 l', 'l', '1'),
+         ('6 x 330 ml', 'pack', '6 x 330 ml'), ('12 ct', 'ct', '12'), ('250 g', 'g', '250')]
+OPENING_HOURS = ['Mo-Fr 08:00-20:00; Sa 09:00-18:00; Su off', '24/7', 'Mo-Su 07:00-22:00']
+TIMEZONES = ['UTC', 'Europe/London', 'America/New_York']
+PASSWORD = 'Synthetic123'
+
+
+# Random EAN-13 codes in the GS1 "restricted circulation" range (prefix 2),
+# which no real product uses, skipping any already in the catalog
+def synthetic_barcodes(rng, count):
+    barcodes = set()
+    while len(barcodes) < count:
+        candidates = set()
+        while len(candidates) < count - len(barcodes):
+            digits = '2' + ''.join(rng.choice('0123456789') for _ in range(11))
+            candidates.add(digits + gtin_check_digit(digits))
+        candidates -= set(Grocery.objects.filter(barcode_number__in=candidates).values_list('barcode_number', flat=True))
+        barcodes |= candidates
+    return sorted(barcodes)
+
+
+# Create `users` users (named "<prefix>-<n>", password PASSWORD), each with
+# shops, shopping lists of catalog items and prices across their shops, plus a
+# catalog of `catalog_size` groceries. Returns the number of rows per model.
+def generate(users=10, shops_per_user=5, lists_per_user=3, items_per_list=20, prices_per_item=3,
+             catalog_size=1000, prefix='synthetic', seed=0, batch_size=1000):
+    rng = random.Random(seed)
+    now = timezone.now()
+    password = make_password(PASSWORD)
+    counts = {}
+
+    with transaction.atomic():
+        catalog = []
+        for barcode in synthetic_barcodes(rng, catalog_size):
+            label, _, _ = rng.choice(SIZES)
+            quantity, quantity_unit = parse_quantity(label)
+            catalog.append(Grocery(
+                barcode_number=barcode, name=f"Product {barcode[-6:]}",
+                category=rng.choice(CATEGORIES), brand=rng.choice(BRANDS), size=label,
+                quantity=quantity, quantity_unit=quantity_unit, barcode_api_last_checked=now,
+            ))
+        Grocery.objects.bulk_create(catalog, batch_size=batch_size)
+        counts['groceries'] = len(catalog)
+
+        people = User.objects.bulk_create(
+            [User(username=f"{prefix}-{n}", email=f"{prefix}-{n}@example.com", password=password)
+             for n in range(users)],
+            batch_size=batch_size,
+        )
+        counts['users'] = len(people)
+
+        shops = Shop.objects.bulk_create(
+            [
+                Shop(
+                    owner=user, name=f"Shop {n}", address_line1=f"{n} Market Street", city='Springfield',
+                    state='State', postal_code=f"{10000 + n}", country='Country', phone_number='555-0100',
+                    latitude=Decimal(rng.uniform(-60, 60)).quantize(Decimal('0.000001')),
+                    longitude=Decimal(rng.uniform(-180, 180)).quantize(Decimal('0.000001')),
+                    opening_hours=rng.choice(OPENING_HOURS), timezone=rng.choice(TIMEZONES),
+                )
+                for user in people for n in range(shops_per_user)
+            ],
+            batch_size=batch_size,
+        )
+        sync_opening_intervals(shops)
+        counts['shops'] = len(shops)
+        shops_by_owner = {}
+        for shop in shops:
+            shops_by_owner.setdefault(shop.owner_id, []).append(shop)
+
+        lists = ShoppingList.objects.bulk_create(
+            [ShoppingList(owner=user, name=f"List {n}") for user in people for n in range(lists_per_user)],
+            batch_size=batch_size,
+        )
+        counts['shopping_lists'] = len(lists)
+
+        user_groceries = UserGrocery.objects.bulk_create(
+            [UserGrocery(owner_id=shopping_list.owner_id, shopping_list=shopping_list)
+             for shopping_list in lists for _ in range(items_per_list)],
+            batch_size=batch_size,
+        )
+        counts['user_groceries'] = len(user_groceries)
+
+        items = []
+        for user_grocery in user_groceries:
+            grocery = rng.choice(catalog) if catalog else None
+            _, unit, packaging_size = rng.choice(SIZES)
+            quantity, quantity_unit = parse_item_quantity(unit, packaging_size)
+            items.append(GroceryItem(
+                user_grocery=user_grocery, name=grocery.name if grocery else "Item",
+                brand=grocery.brand if grocery else None,
+                category=grocery.category if grocery else rng.choice(CATEGORIES),
+                barcode=grocery.barcode_number if grocery else None,
+                unit=unit, packaging_size=packaging_size, quantity=quantity, quantity_unit=quantity_unit,
+            ))
+        GroceryItem.objects.bulk_create(items, batch_size=batch_size)
+        counts['grocery_items'] = len(items)
+
+        prices, owner_shops = [], []
+        for user_grocery in user_groceries:
+            candidates = shops_by_owner.get(user_grocery.owner_id)
+            if not candidates:
+                continue
+            for _ in range(prices_per_item):
+                amount = Decimal(rng.uniform(0.5, 20)).quantize(Decimal('0.01'))
+                discounted = rng.random() < 0.2
+                prices.append(Price(
+                    user_grocery=user_grocery, price=amount, is_discounted=discounted,
+                    price_before_discount=(amount * Decimal('1.25')).quantize(Decimal('0.01')) if discounted else None,
+                ))
+                owner_shops.append(rng.choice(candidates))
+        Price.objects.bulk_create(prices, batch_size=batch_size)
+        PriceShop.objects.bulk_create(
+            [PriceShop(price=price, shop=shop) for price, shop in zip(prices, owner_shops)],
+            batch_size=batch_size,
+        )
+        counts['prices'] = len(prices)
+
+        pairs = sorted({(price.user_grocery_id, shop.pk) for price, shop in zip(prices, owner_shops)})
+        for start in range(0, len(pairs), batch_size):
+            refresh_current_prices(pairs[start:start + batch_size])
+        counts['current_prices'] = len(pairs)
+
+        rebuild_facets()
+    return counts
@@ -1,3 +1,1401 @@
-from django.test import TestCase
+import gzip
+import json
+import smtplib
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from itertools import combinations
+from pathlib import Path
+from unittest.mock import patch
+import brotli
+import msgpack
+import numpy as np
+from django.contrib.auth import authenticate
+from django.contrib.auth.models import User
+from django.contrib.messages import get_messages
+from django.core import mail
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.mail import EmailMultiAlternatives
+from django.db import connection, transaction
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+from .admin import LargeTableAdmin
+from .alerts import (
+    discounted_observations, match_price_drops, observed_barcodes, price_drop_watchers, recent_alerts,
+    send_price_alerts,
+)
+from .anomalies import load_history, pair_keys, score_prices
+from .barcode_cache import BarcodeAccessTracker, cache_product, get_cached_product
+from .basket import BasketOptimizer
+from .concurrency import AdaptiveConcurrencyLimiter, Overloaded, upstream_limiter
+from .current_prices import latest_price_shops, refresh_current_prices, valid_price_shops
+from .export_views import StreamingExportView
+from .facets import rebuild_facets
+from .idempotency import idempotent
+from .middleware import CompressionMiddleware, accepted_encodings, accepts_encoding
+from .models import (
+    CurrentPrice, EmailList, Grocery, GroceryFacet, GroceryItem, JobCheckpoint, NewsletterCampaign, NewsletterDelivery,
+    Price, PriceAlert, PriceShop, Shop, ShopOpeningInterval, ShoppingList, UserGrocery,
+)
+from .newsletter import checkpoint_name, send_newsletter
+from .opening_hours import open_at_condition, parse_opening_hours
+from .price_views import with_unit_prices
+from .product_views import BarcodeLookupError, update_grocery_from_api
+from .providers import (
+    BarcodeProvider, LocalProductProvider, ProviderError, ProviderStats, ProviderTimeout, resolve_barcode,
+)
+from .renderers import to_columnar
+from .shop_cache import cache_shops, get_cached_shops, invalidate_shops, shop_cache_key, version_key
+from .sync_views import SyncAPIView
+from .synthetic import generate
+from .units import parse_item_quantity, parse_quantity
 
-# Create your tests here.
+
+def create_shop(owner, **kwargs):
+    fields = {
+        'name': 'Shop',
+        'address_line1': '1 High Street',
+        'city': 'Town',
+        'state': 'State',
+        'postal_code': '12345',
+        'country': 'Country',
+        'phone_number': '555-0100',
+        'opening_hours': 'Mo-Su 08:00-20:00',
+    }
+    fields.update(kwargs)
+    return Shop.objects.create(owner=owner, **fields)
+
+
+class ShoppingListDetailTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('shopper', 'shopper@example.com', 'Password123')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.shops = [create_shop(self.user, name=f'Shop {i}') for i in range(3)]
+
+    def create_list(self, size):
+        shopping_list = ShoppingList.objects.create(owner=self.user, name=f'List of {size}')
+        for i in range(size):
+            user_grocery = UserGrocery.objects.create(owner=self.user, shopping_list=shopping_list)
+            GroceryItem.objects.create(user_grocery=user_grocery, name=f'Item {i}', category='Food')
+            for shop in self.shops:
+                price = Price.objects.create(user_grocery=user_grocery, price='1.99')
+                PriceShop.objects.create(price=price, shop=shop)
+        return shopping_list
+
+    def test_query_count_does_not_grow_with_list_size(self):
+        small = self.create_list(2)
+        large = self.create_list(10)
+
+        with self.assertNumQueries(4):
+            response = self.client.get(f'/api/shopping-lists/{small.pk}/')
+        self.assertEqual(len(response.data['user_groceries']), 2)
+
+        with self.assertNumQueries(4):
+            response = self.client.get(f'/api/shopping-lists/{large.pk}/')
+        self.assertEqual(len(response.data['user_groceries']), 10)
+        self.assertEqual(len(response.data['user_groceries'][0]['current_prices']), 3)
+
+    def test_deleted_rows_are_excluded(self):
+        shopping_list = self.create_list(2)
+        user_grocery = shopping_list.user_groceries.first()
+        user_grocery.deleted = True
+        user_grocery.save()
+        self.shops[0].deleted = True
+        self.shops[0].save()
+
+        response = self.client.get(f'/api/shopping-lists/{shopping_list.pk}/')
+        self.assertEqual(len(response.data['user_groceries']), 1)
+        self.assertEqual(len(response.data['user_groceries'][0]['current_prices']), 2)
+
+    def test_other_users_list_is_not_found(self):
+        other = User.objects.create_user('other', 'other@example.com', 'Password123')
+        shopping_list = ShoppingList.objects.create(owner=other, name='Private')
+
+        response = self.client.get(f'/api/shopping-lists/{shopping_list.pk}/')
+        self.assertEqual(response.status_code, 404)
+
+
+# Full table scans in a query plan. On PostgreSQL sequential scans are
+# disabled first, so any "Seq Scan" left means no index could serve the query;
+# on SQLite a bare "SCAN <table>" (without USING INDEX) is a full scan.
+def full_scans(queryset):
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute("SET LOCAL enable_seqscan = off")
+            cursor.execute(f"EXPLAIN {sql}", params)
+            return [row[0].strip() for row in cursor.fetchall() if 'Seq Scan' in row[0]]
+        cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+        details = [row[-1] for row in cursor.fetchall()]
+    # Co-routines and materialized subqueries are scanned by name, not tables
+    virtual = {detail.split(' ', 1)[1] for detail in details if detail.startswith(('CO-ROUTINE ', 'MATERIALIZE '))}
+    return [
+        detail for detail in details
+        if detail.startswith('SCAN ') and 'USING' not in detail
+        and detail[5:] not in virtual and not detail[5:].startswith('(') and detail != 'SCAN CONSTANT ROW'
+    ]
+
+
+# Query counts per endpoint and query plans for the hot queries, on a small
+# synthetic data set (see synthetic.py). The counts must not depend on how
+# much data a user has, so a new N+1 shows up as a failure here.
+class QueryRegressionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        generate(users=3, shops_per_user=4, lists_per_user=2, items_per_list=8, prices_per_item=3,
+                 catalog_size=40, prefix='querytest')
+        cls.user = User.objects.get(username='querytest-1')
+        cls.shop = Shop.objects.filter(owner=cls.user).first()
+        cls.shopping_list = ShoppingList.objects.filter(owner=cls.user).first()
+        cls.grocery = Grocery.objects.filter(barcode_number__startswith='2').first()
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_read_endpoint_query_counts(self):
+        endpoints = [
+            ('/api/shops/', 1),
+            ('/api/shops/?open_at=2026-10-19T10:00:00Z', 2),
+            (f'/api/shops/{self.shop.pk}/', 1),
+            (f'/api/shopping-lists/{self.shopping_list.pk}/', 4),
+            (f'/api/shopping-lists/{self.shopping_list.pk}/basket/?k=2', 2),
+            ('/api/current-prices/', 1),
+            ('/api/current-prices/?ordering=unit_price', 1),
+            (f'/api/groceries/{self.grocery.pk}/', 1),
+            ('/api/groceries/facets/', 2),
+            ('/api/sync/', 4),
+        ]
+        for url, expected in endpoints:
+            with self.subTest(url=url), self.assertNumQueries(expected):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+
+    def test_barcode_lookup_query_count(self):
+        # A fresh catalog row is answered from the database without any provider
+        with self.assertNumQueries(1):
+            response = self.client.post('/api/product-from-barcode/',
+                                        {'barcode_number': self.grocery.barcode_number}, format='json')
+        self.assertEqual(response.status_code, 200)
+        # ...and from the lookup cache afterwards
+        with self.assertNumQueries(0):
+            self.client.post('/api/product-from-barcode/', {'barcode_number': self.grocery.barcode_number}, format='json')
+
+    def test_bulk_price_query_count_does_not_grow(self):
+        user_groceries = list(UserGrocery.objects.filter(owner=self.user).values_list('pk', flat=True))
+
+        def post(count):
+            items = [{'user_grocery': user_groceries[i % len(user_groceries)], 'shop': self.shop.pk, 'price': '1.00'}
+                     for i in range(count)]
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.post('/api/prices/bulk/', items, format='json')
+            self.assertEqual(response.status_code, 201)
+            return len(queries)
+
+        self.assertEqual(post(2), post(20))
+
+    def test_hot_queries_use_indexes(self):
+        user_grocery_ids = list(UserGrocery.objects.filter(owner=self.user).values_list('pk', flat=True))
+        shop_ids = list(Shop.objects.filter(owner=self.user).values_list('pk', flat=True))
+        price_ids = list(Price.objects.order_by('pk').values_list('pk', flat=True)[:100])
+        barcodes = list(GroceryItem.objects.exclude(barcode='').values_list('barcode', flat=True)[:20])
+        self.assertTrue(price_ids and barcodes)
+        queries = {
+            'barcode lookup': Grocery.objects.filter(barcode_number=self.grocery.barcode_number),
+            'owner shop list': Shop.objects.filter(owner=self.user),
+            'open shops': Shop.objects.filter(owner=self.user).filter(
+                open_at_condition(timezone.now(), ['UTC', 'Europe/London'])),
+            # refresh_current_prices() and the rebuild_current_prices command
+            'latest prices for pairs': latest_price_shops(valid_price_shops().filter(
+                price__user_grocery_id__in=user_grocery_ids, shop_id__in=shop_ids)),
+            'latest prices for shops': latest_price_shops(valid_price_shops().filter(shop_id__in=shop_ids)),
+            'current prices': with_unit_prices(CurrentPrice.objects.filter(user_grocery__owner=self.user)),
+            # match_price_drops()
+            'discounted observations': discounted_observations(price_ids[0], price_ids[-1]),
+            'observed barcodes': observed_barcodes(user_grocery_ids),
+            'price drop watchers': price_drop_watchers([self.user.pk], user_grocery_ids, barcodes),
+            'recent alerts': recent_alerts(user_grocery_ids),
+            'facets': GroceryFacet.objects.filter(facet=GroceryFacet.BRAND, count__gt=0).order_by('-count'),
+        }
+        for name, queryset in queries.items():
+            with self.subTest(query=name):
+                self.assertEqual(full_scans(queryset), [])
+
+
+class UsernameOrEmailBackendTests(TestCase):
+    def test_username_or_email(self):
+        user = User.objects.create_user('shopper', 'Shopper@Example.com', 'Password123')
+        self.assertEqual(authenticate(username='shopper', password='Password123'), user)
+        self.assertEqual(authenticate(username='shopper@example.com', password='Password123'), user)
+        self.assertIsNone(authenticate(username='shopper@example.com', password='wrong'))
+
+    def test_username_containing_at(self):
+        user = User.objects.create_user('alice@corp', 'alice@example.com', 'Password123')
+        self.assertEqual(authenticate(username='alice@corp', password='Password123'), user)
+
+    def test_exact_username_wins_over_email(self):
+        by_email = User.objects.create_user('bob', 'carol@corp', 'Password123')
+        by_username = User.objects.create_user('carol@corp', 'carol@example.com', 'Password123')
+        self.assertEqual(authenticate(username='carol@corp', password='Password123'), by_username)
+        self.assertEqual(authenticate(username='CAROL@corp', password='Password123'), by_email)
+
+
+class GrocerySerializerTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('shopper', 'shopper@example.com', 'Password123'))
+
+    def test_barcode_is_stored_canonical(self):
+        response = self.client.post('/api/groceries/', {'barcode_number': '036000291452', 'name': 'Tissues'},
+                                    format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['barcode_number'], '0036000291452')
+
+    def test_duplicate_canonical_barcode_is_rejected(self):
+        Grocery.objects.create(barcode_number='0036000291452', name='Tissues')
+        response = self.client.post('/api/groceries/', {'barcode_number': '036000291452', 'name': 'Tissues'},
+                                    format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('barcode_number', response.data)
+
+
+class ShopCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('shopper', 'shopper@example.com', 'Password123')
+
+    def test_rows_read_before_a_write_are_not_cached_as_current(self):
+        key = shop_cache_key(self.user.pk, 'list', '/api/shops/')
+        # A writer commits between the reader's query and its cache write
+        with self.captureOnCommitCallbacks(execute=True):
+            invalidate_shops(self.user.pk)
+        cache_shops(key, ['stale'])
+        self.assertIsNone(get_cached_shops(shop_cache_key(self.user.pk, 'list', '/api/shops/')))
+
+    def test_evicted_version_does_not_revive_old_entries(self):
+        key = shop_cache_key(self.user.pk, 'detail', 1)
+        cache_shops(key, {'name': 'old'})
+        cache.delete(version_key(self.user.pk))
+        self.assertNotEqual(shop_cache_key(self.user.pk, 'detail', 1), key)
+
+
+class SyncTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('shopper', 'shopper@example.com', 'Password123')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_pages_through_rows_sharing_one_updated_at(self):
+        shopping_list = ShoppingList.objects.create(owner=self.user, name='List')
+        UserGrocery.objects.bulk_create([UserGrocery(owner=self.user, shopping_list=shopping_list) for _ in range(7)])
+        shops = [create_shop(self.user, name=f'Shop {i}') for i in range(5)]
+        # A bulk write stamps the whole batch with one time
+        stamp = timezone.now() - timedelta(minutes=1)
+        UserGrocery.objects.update(updated_at=stamp)
+        Shop.objects.update(updated_at=stamp)
+
+        seen = {'user_groceries': set(), 'shops': set()}
+        since = stamp.isoformat()
+        with patch.object(SyncAPIView, 'page_size', 2):
+            for _ in range(10):
+                response = self.client.get('/api/sync/', {'since': since})
+                self.assertEqual(response.status_code, 200)
+                for name in seen:
+                    seen[name].update(row['id'] for row in response.data[name]['updated'])
+                since = response.data['cursor']
+                if not response.data['has_more']:
+                    break
+        self.assertFalse(response.data['has_more'])
+        self.assertEqual(seen['user_groceries'], set(UserGrocery.objects.values_list('id', flat=True)))
+        self.assertEqual(seen['shops'], {shop.pk for shop in shops})
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/sync/', {'since': '2026-01-01T00:00:00+00:00|nope|1'})
+        self.assertEqual(response.status_code, 400)
+
+
+class QuantityParsingTests(TestCase):
+    def test_sizes(self):
+        self.assertEqual(parse_quantity('1,5 kg'), (Decimal('1500.000'), 'g'))
+        self.assertEqual(parse_quantity('6 x 330 ml'), (Decimal('1980.000'), 'ml'))
+        self.assertEqual(parse_item_quantity('g', '500'), (Decimal('500.000'), 'g'))
+        self.assertEqual(parse_quantity('large'), (None, None))
+
+    def test_sizes_too_large_for_the_column_are_ignored(self):
+        self.assertEqual(parse_quantity('999999999 kg'), (None, None))
+        self.assertEqual(parse_quantity('99999999999999999999999999999 kg'), (None, None))
+        self.assertEqual(parse_quantity('999999999 g'), (Decimal('999999999.000'), 'g'))
+
+        grocery = Grocery.objects.create(barcode_number='4006381333931', name='Typo', size='999999999 kg')
+        self.assertIsNone(grocery.quantity)
+
+
+class PriceDropAlertTests(TestCase):
+    barcode = '0036000291452'
+
+    def setUp(self):
+        self.watcher = User.objects.create_user('watcher', 'watcher@example.com', 'Password123', first_name='Wat')
+        self.observer = User.objects.create_user('observer', 'observer@example.com', 'Password123')
+        self.watched = self.create_item(self.watcher, watch=True)
+        # The same product on another list, stored under its UPC-A spelling
+        self.same_product = self.create_item(self.watcher, watch=True, barcode=self.barcode[1:])
+        self.unwatched = self.create_item(self.watcher, watch=False)
+        self.shop = create_shop(self.watcher, name='Corner Shop')
+        self.observed = self.create_item(self.observer, watch=True)
+        self.other_shop = create_shop(self.observer, name='Secret Shop')
+
+    def create_item(self, owner, watch, barcode=None):
+        shopping_list = ShoppingList.objects.create(owner=owner, name='List')
+        user_grocery = UserGrocery.objects.create(owner=owner, shopping_list=shopping_list, watch_price_drops=watch)
+        # Stored in canonical form, so UPC-A and EAN-13 spellings match
+        GroceryItem.objects.create(user_grocery=user_grocery, name='Pencils', category='Office',
+                                   barcode=barcode or self.barcode)
+        return user_grocery
+
+    def observe(self, price='1.50', before='3.00', user_grocery=None, shop=None):
+        price = Price.objects.create(user_grocery=user_grocery or self.watched, price=price,
+                                     is_discounted=True, price_before_discount=before)
+        PriceShop.objects.create(price=price, shop=shop or self.shop)
+        Price.objects.filter(pk=price.pk).update(created_at=timezone.now() - timedelta(minutes=5))
+
+    def alerts(self):
+        return set(PriceAlert.objects.values_list('owner__username', 'user_grocery', 'shop', 'price'))
+
+    def test_owner_is_alerted_about_discounts_at_their_shops(self):
+        self.observe()
+        self.observe(price='2.00', before='1.50')  # Not a drop
+        match_price_drops()
+        self.assertEqual(self.alerts(), {
+            ('watcher', self.watched.pk, self.shop.pk, Decimal('1.50')),
+            ('watcher', self.same_product.pk, self.shop.pk, Decimal('1.50')),
+        })
+
+    def test_other_users_discounts_are_not_shared(self):
+        self.observe(price='0.99', user_grocery=self.observed, shop=self.other_shop)
+        match_price_drops()
+        self.assertEqual(self.alerts(), {('observer', self.observed.pk, self.other_shop.pk, Decimal('0.99'))})
+
+    def test_alert_email_has_no_other_users_shop_data(self):
+        self.observe(price='0.99', user_grocery=self.observed, shop=self.other_shop)
+        self.observe()
+        match_price_drops()
+        # A row matched across users by an earlier version of the job
+        price_shop = PriceShop.objects.get(shop=self.other_shop)
+        PriceAlert.objects.create(owner=self.watcher, user_grocery=self.watched, shop=self.other_shop,
+                                  price_shop=price_shop, price='0.99', price_before_discount='3.00')
+        send_price_alerts()
+
+        [message] = [message for message in mail.outbox if message.to == ['watcher@example.com']]
+        for body in (message.body, message.alternatives[0][0]):
+            self.assertIn('Corner Shop', body)
+            self.assertNotIn('Secret Shop', body)
+            self.assertNotIn('0.99', body)
+
+    def test_repeated_sale_is_reported_again_later(self):
+        self.observe(user_grocery=self.unwatched)
+        self.observe(user_grocery=self.unwatched)
+        match_price_drops()
+        self.assertEqual(PriceAlert.objects.count(), 2)  # For the two watched items of the product
+
+        PriceAlert.objects.update(created_at=timezone.now() - timedelta(days=8))
+        self.observe(user_grocery=self.unwatched)
+        match_price_drops()
+        self.assertEqual(PriceAlert.objects.count(), 4)
+
+    def test_items_are_not_watched_by_default(self):
+        self.assertFalse(UserGrocery._meta.get_field('watch_price_drops').default)
+
+
+@patch('groceriespricechecker.newsletter.RECONNECT_DELAY', 0)
+class NewsletterTests(TestCase):
+    def setUp(self):
+        self.subscribers = [EmailList.objects.create(email=f'reader{i}@example.com') for i in range(4)]
+        self.campaign = NewsletterCampaign.objects.create(subject='News', body_text='Hello')
+
+    def test_dropped_connection_is_reopened_and_the_recipient_retried(self):
+        send = EmailMultiAlternatives.send
+        calls = []
+
+        def flaky_send(message, *args, **kwargs):
+            calls.append(message.to[0])
+            if len(calls) == 2:
+                raise smtplib.SMTPServerDisconnected("Connection unexpectedly closed")
+            return send(message, *args, **kwargs)
+
+        with patch.object(EmailMultiAlternatives, 'send', flaky_send):
+            self.assertEqual(send_newsletter(self.campaign, chunk_size=10, rate=0), (4, 0))
+        self.assertEqual(calls[1], calls[2])
+        self.assertEqual(len(mail.outbox), 4)
+        self.assertEqual(NewsletterDelivery.objects.filter(status=NewsletterDelivery.SENT).count(), 4)
+
+    def test_unreachable_server_stops_before_the_current_recipient(self):
+        send = EmailMultiAlternatives.send
+
+        def failing_send(message, *args, **kwargs):
+            if message.to[0] == self.subscribers[2].email:
+                raise ConnectionRefusedError()
+            return send(message, *args, **kwargs)
+
+        with patch.object(EmailMultiAlternatives, 'send', failing_send), self.assertRaises(ConnectionRefusedError):
+            send_newsletter(self.campaign, chunk_size=10, rate=0)
+        checkpoint = JobCheckpoint.objects.get(name=checkpoint_name(self.campaign))
+        self.assertEqual(checkpoint.position, self.subscribers[1].pk)
+        self.assertEqual(NewsletterDelivery.objects.count(), 2)
+        self.assertFalse(NewsletterDelivery.objects.filter(status=NewsletterDelivery.FAILED).exists())
+
+        # The next run picks up with the recipient that was not reached
+        self.assertEqual(send_newsletter(self.campaign, chunk_size=10, rate=0), (2, 0))
+        self.assertEqual(len(mail.outbox), 4)
+
+
+class BarcodeCacheTests(TestCase):
+    def test_flush_runs_off_the_request_thread(self):
+        tracker = BarcodeAccessTracker(flush_interval=0)
+        flushed = threading.Event()
+        threads = []
+
+        def flush():
+            threads.append(threading.current_thread())
+            flushed.set()
+
+        with patch.object(tracker, 'flush', flush), self.assertNumQueries(0):
+            tracker.record('4006381333931')
+        self.assertTrue(flushed.wait(5))
+        self.assertIsNot(threads[0], threading.current_thread())
+
+    def test_renamed_barcode_is_dropped_from_the_cache(self):
+        grocery = Grocery.objects.create(barcode_number='4006381333931', name='Pencils', manually_entered=True)
+        cache_product(grocery)
+        grocery.barcode_number = '0036000291452'
+        grocery.save()
+        self.assertIsNone(get_cached_product('4006381333931'))
+
+
+class FakeProvider(BarcodeProvider):
+    def __init__(self, name, result=None, blocker=None):
+        self.name = name
+        self.result = result
+        self.blocker = blocker  # threading.Event the lookup waits for
+        self.calls = 0
+
+    def lookup(self, barcode_number):
+        self.calls += 1
+        if self.blocker is not None:
+            self.blocker.wait(5)
+        return self.result
+
+
+@override_settings(BARCODE_HEDGE_DEFAULT_DELAY=0.02, BARCODE_LOOKUP_TIMEOUT=0.3)
+class BarcodeProviderTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.blocker = threading.Event()
+        self.addCleanup(self.blocker.set)
+        patcher = patch('groceriespricechecker.providers.stats', ProviderStats())
+        self.stats = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def wait_for_idle_limiter(self):
+        for _ in range(200):
+            if upstream_limiter.inflight() == 0:
+                return
+            time.sleep(0.01)
+        self.fail("The upstream limiter slot was not released.")
+
+    def test_providers_must_implement_lookup(self):
+        class Incomplete(BarcodeProvider):
+            name = 'incomplete'
+
+        with self.assertRaises(TypeError):
+            Incomplete()
+
+    def test_fast_primary_wins_without_a_hedge(self):
+        primary, hedge = FakeProvider('primary', {'name': 'Milk'}), FakeProvider('hedge', {'name': 'Other'})
+        self.assertEqual(resolve_barcode('0036000291452', [primary, hedge]), ({'name': 'Milk'}, 'primary'))
+        self.assertEqual(hedge.calls, 0)
+        snapshot = self.stats.snapshot()
+        self.assertEqual(snapshot['primary']['wins'], 1)
+        self.assertEqual(snapshot['primary']['win_rate'], 1.0)
+        self.assertEqual(upstream_limiter.inflight(), 0)
+
+    def test_slow_primary_is_hedged_and_keeps_its_slot(self):
+        primary = FakeProvider('primary', {'name': 'Late'}, blocker=self.blocker)
+        hedge = FakeProvider('hedge', {'name': 'Milk'})
+        self.assertEqual(resolve_barcode('0036000291452', [primary, hedge]), ({'name': 'Milk'}, 'hedge'))
+        self.assertEqual(self.stats.snapshot()['hedge']['win_rate'], 1.0)
+        # The losing call is still running and still counts against the limit
+        self.assertEqual(upstream_limiter.inflight(), 1)
+        self.blocker.set()
+        self.wait_for_idle_limiter()
+        self.assertEqual(self.stats.snapshot()['primary']['wins'], 0)
+
+    def test_not_found_is_final_only_when_every_provider_answered(self):
+        primary, hedge = FakeProvider('primary'), FakeProvider('hedge')
+        self.assertEqual(resolve_barcode('0036000291452', [primary, hedge]), (None, None))
+        self.assertEqual((primary.calls, hedge.calls), (1, 1))
+
+    def test_pending_primary_is_not_stored_as_not_found(self):
+        primary, hedge = FakeProvider('primary', blocker=self.blocker), FakeProvider('hedge')
+        with self.assertRaises(ProviderTimeout):
+            resolve_barcode('0036000291452', [primary, hedge])
+
+        grocery = Grocery.objects.create(barcode_number='0036000291452')
+        with patch('groceriespricechecker.product_views.resolve_barcode', side_effect=ProviderTimeout()), \
+                self.assertRaises(BarcodeLookupError):
+            update_grocery_from_api(grocery, timezone.now())
+        grocery.refresh_from_db()
+        self.assertFalse(grocery.barcode_lookup_failed)
+        self.assertIsNone(grocery.barcode_api_last_checked)
+        self.blocker.set()
+        self.wait_for_idle_limiter()
+
+
+class LocalProductDatabaseTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+        self.remote = FakeProvider('remote', {'name': 'From the API'})
+        patcher = patch('groceriespricechecker.providers.stats', ProviderStats())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def import_dump(self):
+        dump = self.directory / 'products.jsonl.gz'
+        with gzip.open(dump, 'wt', encoding='utf-8') as file:
+            for line in [
+                json.dumps({'code': '036000291452', 'product_name': 'Pencils', 'brands': 'Acme, Other',
+                            'categories': 'Office, Stationery', 'quantity': '12 pcs'}),
+                json.dumps({'code': '123', 'product_name': 'Bad barcode'}),
+                json.dumps({'code': '4006381333931'}),  # No name
+                '{not json',
+            ]:
+                file.write(line + '\n')
+        database = self.directory / 'products.db'
+        out = StringIO()
+        call_command('import_product_dump', str(dump), output=str(database), stdout=out)
+        self.assertIn('Imported 1 products', out.getvalue())
+        self.assertIn('3 skipped', out.getvalue())
+        return database
+
+    def test_imported_product_is_resolved_locally(self):
+        providers = [LocalProductProvider(self.import_dump()), self.remote]
+        self.assertEqual(resolve_barcode('0036000291452', providers), ({
+            'name': 'Pencils', 'category': 'Stationery', 'brand': 'Acme', 'size': '12 pcs',
+        }, 'local'))
+        self.assertEqual(self.remote.calls, 0)
+        # Unknown barcodes go on to the network providers
+        self.assertEqual(resolve_barcode('4006381333931', providers), ({'name': 'From the API'}, 'remote'))
+
+    def test_missing_or_corrupt_database_falls_back(self):
+        corrupt = self.directory / 'corrupt.db'
+        corrupt.write_bytes(b'this is not an sqlite database' * 100)
+        for path in [self.directory / 'missing.db', corrupt]:
+            with self.subTest(path=path.name):
+                local = LocalProductProvider(path)
+                with self.assertRaises(ProviderError):
+                    local.lookup('0036000291452')
+                self.assertEqual(resolve_barcode('0036000291452', [local, self.remote]),
+                                 ({'name': 'From the API'}, 'remote'))
+        # With no other provider the local error is reported
+        with self.assertRaises(ProviderError):
+            resolve_barcode('0036000291452', [LocalProductProvider(corrupt)])
+
+
+class OpeningHoursTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('shopper', 'shopper@example.com', 'Password123')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_unparseable_hours_are_rejected(self):
+        response = self.client.post('/api/shops/', {
+            'owner': self.user.pk, 'name': 'Shop', 'address_line1': '1 High Street', 'city': 'Town',
+            'state': 'State', 'postal_code': '12345', 'country': 'Country', 'phone_number': '555-0100',
+            'opening_hours': 'weekdays nine to five',
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('opening_hours', response.data)
+
+    def test_fixture_hours_apply_every_day(self):
+        with open(Path(__file__).parent / 'fixtures' / 'dummy_stores.json') as fixture:
+            hours = {row['fields']['opening_hours'] for row in json.load(fixture)}
+        self.assertEqual(hours, {'8AM - 10PM', '9AM - 9PM', '10AM - 8PM'})
+        self.assertEqual(parse_opening_hours('8AM - 10PM'), [(day, 480, 1320) for day in range(7)])
+        for opening_hours in sorted(hours):
+            with self.subTest(opening_hours=opening_hours):
+                response = self.client.post('/api/shops/', {
+                    'owner': self.user.pk, 'name': 'Shop', 'address_line1': '1 High Street', 'city': 'Town',
+                    'state': 'State', 'postal_code': '12345', 'country': 'Country', 'phone_number': '555-0100',
+                    'opening_hours': opening_hours,
+                }, format='json')
+                self.assertEqual(response.status_code, 201)
+                self.assertEqual(ShopOpeningInterval.objects.filter(shop_id=response.data['id']).count(), 7)
+
+    def test_open_at(self):
+        open_shop = create_shop(self.user, opening_hours='Mo-Fr 08:00-20:00', timezone='Europe/London')
+        create_shop(self.user, opening_hours='Mo-Fr 08:00-20:00', timezone='America/New_York')
+        # Monday 09:00 in London is 04:00 in New York
+        response = self.client.get('/api/shops/', {'open_at': '2026-10-19T08:00:00Z'})
+        self.assertEqual([shop['id'] for shop in response.data], [open_shop.pk])
+
+
+class IdempotencyTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.factory = RequestFactory()
+        self.calls = 0
+
+    def post(self, view, **extra):
+        request = self.factory.post('/api/things/', {'a': 1}, content_type='application/json',
+                                    HTTP_IDEMPOTENCY_KEY='key-1', **extra)
+        return view(request)
+
+    def test_anonymous_keys_are_scoped_by_client_address(self):
+        @idempotent
+        def view(request):
+            self.calls += 1
+            return JsonResponse({'call': self.calls}, status=201)
+
+        self.post(view, REMOTE_ADDR='10.0.0.1')
+        replay = self.post(view, REMOTE_ADDR='10.0.0.1')
+        self.post(view, REMOTE_ADDR='10.0.0.2')
+        self.assertEqual(replay['Idempotent-Replayed'], 'true')
+        self.assertEqual(self.calls, 2)
+
+    # Runs the first request in a thread until `release` is set; returns the
+    # thread and a list that receives its response
+    def start_original(self, view, release):
+        started, responses = threading.Event(), []
+
+        @idempotent
+        def blocking_view(request):
+            started.set()
+            release.wait(5)
+            return view(request)
+
+        thread = threading.Thread(target=lambda: responses.append(self.post(blocking_view)))
+        thread.start()
+        started.wait(5)
+        return thread, responses
+
+    @override_settings(IDEMPOTENCY_WAIT=5)
+    def test_duplicate_waits_for_the_original_response(self):
+        def view(request):
+            self.calls += 1
+            return JsonResponse({'call': self.calls}, status=201)
+
+        release = threading.Event()
+        thread, responses = self.start_original(view, release)
+        threading.Timer(0.1, release.set).start()
+        duplicate = self.post(idempotent(view))
+        thread.join()
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(duplicate.status_code, 201)
+        self.assertEqual(duplicate['Idempotent-Replayed'], 'true')
+        self.assertEqual(duplicate.content, responses[0].content)
+
+    @override_settings(IDEMPOTENCY_WAIT=5)
+    def test_duplicate_runs_the_view_when_the_original_fails(self):
+        def view(request):
+            self.calls += 1
+            return JsonResponse({'call': self.calls}, status=500 if self.calls == 1 else 201)
+
+        release = threading.Event()
+        thread, responses = self.start_original(view, release)
+        threading.Timer(0.1, release.set).start()
+        duplicate = self.post(idempotent(view))
+        thread.join()
+        self.assertEqual(responses[0].status_code, 500)
+        self.assertEqual(duplicate.status_code, 201)
+        self.assertFalse(duplicate.has_header('Idempotent-Replayed'))
+
+    @override_settings(IDEMPOTENCY_WAIT=0.1)
+    def test_duplicate_gets_409_when_the_original_runs_too_long(self):
+        duplicates = []
+
+        @idempotent
+        def view(request):
+            if not duplicates:
+                duplicates.append(self.post(view))
+            return JsonResponse({}, status=201)
+
+        self.assertEqual(self.post(view).status_code, 201)
+        self.assertEqual(duplicates[0].status_code, 409)
+        self.assertEqual(duplicates[0]['Retry-After'], '1')
+        self.assertEqual(self.post(view)['Idempotent-Replayed'], 'true')
+
+
+class PriceAnomalyTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('shopper', 'shopper@example.com', 'Password123')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.shop = create_shop(self.user)
+        shopping_list = ShoppingList.objects.create(owner=self.user, name='List')
+        self.user_grocery = UserGrocery.objects.create(owner=self.user, shopping_list=shopping_list)
+
+    def add_history(self, prices, user_grocery=None, shop=None):
+        for amount in prices:
+            price = Price.objects.create(user_grocery=user_grocery or self.user_grocery, price=amount)
+            PriceShop.objects.create(price=price, shop=shop or self.shop)
+
+    def submit(self, **observation):
+        return self.client.post('/api/prices/bulk/', [
+            {'user_grocery': self.user_grocery.pk, 'shop': self.shop.pk, **observation},
+        ], format='json')
+
+    def test_score_prices(self):
+        history_keys = pair_keys([1] * 6 + [2] * 6, [1] * 12)
+        history = [9.00, 8.90, 9.10, 9.00, 8.95, 9.05] * 2
+        keys = pair_keys([1, 1, 1, 2], [1, 1, 1, 1])
+        scores, anomalies = score_prices(history_keys, history, keys, [0.09, 6.50, 9.20, 90.0],
+                                         threshold=6, max_ratio=3, min_history=5, min_spread=0.05)
+        self.assertEqual(anomalies.tolist(), [True, False, False, True])
+        self.assertLess(scores[0], -6)
+
+    def test_min_history_is_respected(self):
+        history_keys = pair_keys([1] * 4, [1] * 4)
+        scores, anomalies = score_prices(history_keys, [9.0] * 4, pair_keys([1], [1]), [0.09], min_history=5)
+        self.assertTrue(np.isnan(scores[0]))
+        self.assertFalse(anomalies[0])
+        _, anomalies = score_prices(history_keys, [9.0] * 4, pair_keys([1], [1]), [0.09], min_history=4)
+        self.assertTrue(anomalies[0])
+
+    def test_load_history_only_returns_the_requested_pairs(self):
+        other_shop = create_shop(self.user, name='Other')
+        other_grocery = UserGrocery.objects.create(owner=self.user, shopping_list=self.user_grocery.shopping_list)
+        self.add_history(['1.00', '2.00'])
+        self.add_history(['5.00'], shop=other_shop)
+        self.add_history(['7.00'], user_grocery=other_grocery)
+        self.add_history(['3.00'], user_grocery=other_grocery, shop=other_shop)
+        keys, values = load_history([(self.user_grocery.pk, self.shop.pk), (other_grocery.pk, other_shop.pk)])
+        self.assertEqual(sorted(values.tolist()), [1.0, 2.0, 3.0])
+        self.assertEqual(set(keys.tolist()), set(pair_keys([self.user_grocery.pk, other_grocery.pk],
+                                                           [self.shop.pk, other_shop.pk]).tolist()))
+
+    def test_typo_is_quarantined(self):
+        self.add_history(['9.00', '8.90', '9.10', '9.00', '8.95', '9.05'])
+        response = self.submit(price='0.09')
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(response.data[0]['is_anomaly'])
+        self.assertFalse(response.data[0]['active'])
+        current = CurrentPrice.objects.get(user_grocery=self.user_grocery, shop=self.shop)
+        self.assertNotEqual(current.price, Decimal('0.09'))
+
+    def test_marked_discount_passes(self):
+        self.add_history(['9.00', '8.90', '9.10', '9.00', '8.95', '9.05'])
+        response = self.submit(price='2.50', is_discounted=True, price_before_discount='9.00')
+        self.assertFalse(response.data[0]['is_anomaly'])
+        self.assertEqual(CurrentPrice.objects.get(user_grocery=self.user_grocery, shop=self.shop).price,
+                         Decimal('2.50'))
+
+    def test_approving_restores_the_current_price(self):
+        self.add_history(['9.00', '8.90', '9.10', '9.00', '8.95', '9.05'])
+        price_id = self.submit(price='0.09').data[0]['id']
+        admin_user = User.objects.create_superuser('admin', 'admin@example.com', 'Password123')
+        self.client.force_login(admin_user)
+        self.client.post('/admin/groceriespricechecker/price/',
+                         {'action': 'approve_prices', '_selected_action': [price_id]})
+        price = Price.objects.get(pk=price_id)
+        self.assertTrue(price.active)
+        self.assertFalse(price.is_anomaly)
+        self.assertEqual(CurrentPrice.objects.get(user_grocery=self.user_grocery, shop=self.shop).price,
+                         Decimal('0.09'))
+
+
+class BasketPlanTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('shopper', 'shopper@example.com', 'Password123')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.shopping_list = ShoppingList.objects.create(owner=self.user, name='List')
+
+    def add_price(self, user_grocery, shop, amount):
+        price = Price.objects.create(user_grocery=user_grocery, price=amount)
+        PriceShop.objects.create(price=price, shop=shop)
+
+    def plan(self, query):
+        return self.client.get(f'/api/shopping-lists/{self.shopping_list.pk}/basket/?{query}')
+
+    # Cheapest set of at most k shops by trying every one
+    def brute_force(self, optimizer, k):
+        n = optimizer.costs.shape[1]
+        return min(optimizer.score(shops) for size in range(1, k + 1) for shops in combinations(range(n), size))
+
+    def random_costs(self, rng, items, shops):
+        costs = rng.uniform(1, 10, (items, shops)).round(2)
+        costs[rng.random((items, shops)) < 0.3] = np.inf
+        return costs
+
+    def test_solve_matches_brute_force(self):
+        rng = np.random.default_rng(7)
+        for trial in range(20):
+            costs = self.random_costs(rng, 8, 7)
+            penalties = rng.uniform(0, 3, 7).round(2) if trial % 2 else None
+            for k in (1, 2, 3):
+                with self.subTest(trial=trial, k=k, penalties=penalties is not None):
+                    optimizer = BasketOptimizer(costs, penalties, time_budget=5)
+                    chosen, score, optimal, method = optimizer.solve(k)
+                    self.assertTrue(optimal)
+                    self.assertEqual(method, 'exact')
+                    self.assertLessEqual(len(chosen), k)
+                    self.assertAlmostEqual(score, optimizer.score(chosen))
+                    self.assertAlmostEqual(score, self.brute_force(optimizer, k))
+
+    def test_heuristic_finds_the_optimum_on_small_matrices(self):
+        rng = np.random.default_rng(11)
+        for trial in range(10):
+            costs = self.random_costs(rng, 12, 9)
+            penalties = rng.uniform(0, 3, 9).round(2) if trial % 2 else None
+            with self.subTest(trial=trial, penalties=penalties is not None):
+                optimizer = BasketOptimizer(costs, penalties, time_budget=0.05, max_combinations=1)
+                chosen, score, optimal, method = optimizer.solve(4)
+                self.assertFalse(optimal)
+                self.assertEqual(method, 'heuristic')
+                self.assertAlmostEqual(score, self.brute_force(optimizer, 4))
+
+    def test_items_without_a_price_at_the_chosen_shops_are_missing(self):
+        first, second = create_shop(self.user, name='First'), create_shop(self.user, name='Second')
+        only_first, only_second = (UserGrocery.objects.create(owner=self.user, shopping_list=self.shopping_list)
+                                   for _ in range(2))
+        self.add_price(only_first, first, '1.00')
+        self.add_price(only_second, second, '5.00')
+
+        response = self.plan('k=1')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([shop['id'] for shop in response.data['shops']], [first.pk])
+        self.assertEqual(response.data['missing'], [only_second.pk])
+        self.assertEqual(response.data['total'], '1.00')
+
+        response = self.plan('k=2')
+        self.assertEqual({shop['id'] for shop in response.data['shops']}, {first.pk, second.pk})
+        self.assertEqual(response.data['missing'], [])
+        self.assertEqual(response.data['total'], '6.00')
+
+    def test_invalid_parameters_are_rejected(self):
+        for query in ['k=0', 'k=11', 'k=-1', 'k=two', 'lat=52.5', 'lng=13.4', 'lat=91&lng=0', 'lat=0&lng=181',
+                      'lat=north&lng=13.4', 'lat=nan&lng=13.4', 'lat=52.5&lng=inf', 'distance_weight=1',
+                      'lat=52.5&lng=13.4&distance_weight=-1']:
+            with self.subTest(query=query):
+                response = self.plan(query)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('error', response.data)
+        self.assertEqual(self.plan('k=10&lat=52.5&lng=13.4&distance_weight=0.5').status_code, 200)
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('shopper', 'shopper@example.com', 'Password123')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        shopping_list = ShoppingList.objects.create(owner=self.user, name='List')
+        user_grocery = UserGrocery.objects.create(owner=self.user, shopping_list=shopping_list)
+        price = Price.objects.create(user_grocery=user_grocery, price='1.50')
+        PriceShop.objects.create(price=price, shop=create_shop(self.user))
+
+    def test_base_view_is_abstract(self):
+        with self.assertRaises(TypeError):
+            StreamingExportView()
+
+    def test_accept_encoding_q_values(self):
+        self.assertEqual(accepted_encodings('gzip;q=0.5, br; Q=0 ,identity'), {'gzip': 0.5, 'br': 0.0, 'identity': 1.0})
+        self.assertTrue(accepts_encoding('deflate, gzip', 'gzip'))
+        self.assertTrue(accepts_encoding('*;q=0.1', 'gzip'))
+        self.assertFalse(accepts_encoding('gzip;q=0, *', 'gzip'))
+        self.assertFalse(accepts_encoding('gzip;q=0.000', 'gzip'))
+        self.assertFalse(accepts_encoding('xgzip', 'gzip'))
+        self.assertFalse(accepts_encoding('', 'gzip'))
+
+    def test_export_is_gzipped_only_when_accepted(self):
+        for accept_encoding, encoding in [('gzip', 'gzip'), ('gzip;q=0', None), ('br, gzip;q=0.5', 'gzip'), ('', None)]:
+            with self.subTest(accept_encoding=accept_encoding):
+                response = self.client.get('/api/export/prices/', HTTP_ACCEPT_ENCODING=accept_encoding)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.get('Content-Encoding'), encoding)
+                body = b''.join(response.streaming_content)
+                if encoding is None:
+                    self.assertIn(b'"price": "1.50"', body)
+
+
+class AdminBulkActionTests(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'Password123'))
+        self.groceries = [Grocery.objects.create(barcode_number=f'{i:012d}', name=f'Grocery {i}') for i in range(5)]
+
+    def mark_manually_entered(self):
+        return self.client.post('/admin/groceriespricechecker/grocery/', {
+            'action': 'mark_manually_entered', '_selected_action': [grocery.pk for grocery in self.groceries],
+        })
+
+    def messages(self, response):
+        return [str(message) for message in get_messages(response.wsgi_request)]
+
+    def test_small_selection_is_updated_in_the_request(self):
+        with patch.object(LargeTableAdmin, 'action_batch_size', 2), \
+                patch.object(LargeTableAdmin, 'run_in_background') as run_in_background:
+            response = self.mark_manually_entered()
+        run_in_background.assert_not_called()
+        self.assertEqual(Grocery.objects.filter(manually_entered=True).count(), 5)
+        self.assertEqual(self.messages(response), ['5 groceries marked as manually entered.'])
+
+    def test_large_selection_continues_in_the_background(self):
+        background = []
+        with patch.object(LargeTableAdmin, 'action_batch_size', 2), \
+                patch.object(LargeTableAdmin, 'action_sync_limit', 2), \
+                patch.object(LargeTableAdmin, 'run_in_background',
+                             lambda admin, target, *args: background.append((target, args))):
+            response = self.mark_manually_entered()
+            self.assertEqual(self.messages(response), [
+                '2 groceries marked as manually entered. The rest of the selection is being updated in the background.'
+            ])
+            self.assertEqual(Grocery.objects.filter(manually_entered=True).count(), 2)
+            [(target, args)] = background
+            self.assertEqual(target(*args), (3, None))
+        self.assertEqual(Grocery.objects.filter(manually_entered=True).count(), 5)
+
+
+class CurrentPriceTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('shopper', 'shopper@example.com', 'Password123')
+        shopping_list = ShoppingList.objects.create(owner=self.user, name='List')
+        self.user_grocery = UserGrocery.objects.create(owner=self.user, shopping_list=shopping_list)
+        self.shops = [create_shop(self.user, name=f'Shop {i}') for i in range(5)]
+
+    def add_price(self, amount, shops):
+        price = Price.objects.create(user_grocery=self.user_grocery, price=amount)
+        for shop in shops:
+            PriceShop.objects.create(price=price, shop=shop)
+        return price
+
+    def current_prices(self):
+        return dict(CurrentPrice.objects.filter(user_grocery=self.user_grocery).values_list('shop_id', 'price'))
+
+    def test_cascaded_delete_refreshes_each_pair(self):
+        self.add_price('2.00', self.shops[:2])
+        newest = self.add_price('1.00', self.shops)
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            newest.delete()
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(self.current_prices(), {self.shops[0].pk: Decimal('2.00'), self.shops[1].pk: Decimal('2.00')})
+
+    def test_older_observation_does_not_replace_a_newer_one(self):
+        newer = Price.objects.create(user_grocery=self.user_grocery, price='2.00')
+        older = Price.objects.create(user_grocery=self.user_grocery, price='1.00')
+        Price.objects.filter(pk=older.pk).update(created_at=timezone.now() - timedelta(hours=1))
+        PriceShop.objects.create(price=newer, shop=self.shops[0])
+        # The older observation is written (and refreshed) last
+        PriceShop.objects.create(price=older, shop=self.shops[0])
+        self.assertEqual(self.current_prices(), {self.shops[0].pk: Decimal('2.00')})
+
+        with CaptureQueriesContext(connection) as queries:
+            refresh_current_prices([(self.user_grocery.pk, self.shops[0].pk)])
+        self.assertEqual(self.current_prices(), {self.shops[0].pk: Decimal('2.00')})
+        # The pair is locked before the price history is read
+        lock = next(query['sql'] for query in queries.captured_queries if 'SAVEPOINT' not in query['sql'])
+        self.assertIn('groceriespricechecker_usergrocery', lock)
+        if connection.features.has_select_for_update:
+            self.assertIn('FOR UPDATE', lock)
+
+    def test_price_shop_delete_query_count_does_not_grow(self):
+        def delete(shops):
+            self.add_price('1.00', shops)
+            with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks(execute=True):
+                PriceShop.objects.filter(shop__in=shops).delete()
+            self.assertEqual(self.current_prices(), {})
+            return len(queries)
+
+        self.assertEqual(delete(self.shops[:1]), delete(self.shops))
+
+    def test_delete_after_a_rolled_back_delete_is_refreshed(self):
+        price = self.add_price('1.00', self.shops[:1])
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            Price.objects.filter(pk=price.pk).delete()
+            raise RuntimeError
+        with self.captureOnCommitCallbacks(execute=True):
+            Price.objects.filter(pk=price.pk).delete()
+        self.assertEqual(self.current_prices(), {})
+
+
+class ShopBulkTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('shopper', 'shopper@example.com', 'Password123')
+        self.other = User.objects.create_user('other', 'other@example.com', 'Password123')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.shops = [create_shop(self.user, name=f'Shop {i}') for i in range(2)]
+        self.foreign_shop = create_shop(self.other, name='Foreign')
+        self.long_ago = timezone.now() - timedelta(days=30)
+        Shop.objects.update(updated_at=self.long_ago)
+
+    def shop_data(self, **kwargs):
+        data = {'name': 'New', 'address_line1': '2 Low Street', 'city': 'Town', 'state': 'State',
+                'postal_code': '12345', 'country': 'Country', 'phone_number': '555-0101',
+                'opening_hours': 'Mo-Fr 09:00-17:00'}
+        data.update(kwargs)
+        return data
+
+    def test_bulk_create(self):
+        response = self.client.post('/api/shops/bulk/', [self.shop_data(), self.shop_data(name='Second')],
+                                    format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Shop.objects.filter(owner=self.user, name__in=['New', 'Second']).count(), 2)
+
+    def test_bulk_create_rejects_the_whole_batch_on_an_invalid_item(self):
+        response = self.client.post('/api/shops/bulk/', [self.shop_data(), self.shop_data(opening_hours='whenever')],
+                                    format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data[0], {})
+        self.assertIn('opening_hours', response.data[1])
+        self.assertFalse(Shop.objects.filter(name='New').exists())
+
+    def test_bulk_update_stamps_updated_at(self):
+        first, second = self.shops
+        response = self.client.patch('/api/shops/bulk/', [
+            {'id': first.pk, 'name': 'Renamed'},
+            {'id': second.pk, 'opening_hours': 'Sa-Su 10:00-14:00'},
+        ], format='json')
+        self.assertEqual(response.status_code, 200)
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual(first.name, 'Renamed')
+        self.assertEqual(first.opening_hours, 'Mo-Su 08:00-20:00')
+        self.assertEqual(second.opening_hours, 'Sa-Su 10:00-14:00')
+        self.assertEqual(set(second.opening_intervals.values_list('day', flat=True)), {5, 6})
+        self.assertGreater(first.updated_at, self.long_ago)
+        self.assertEqual(first.updated_at, second.updated_at)
+
+    def test_bulk_update_reports_errors_per_item(self):
+        first, second = self.shops
+        response = self.client.patch('/api/shops/bulk/', [
+            {'id': first.pk, 'name': 'Renamed'},
+            {'id': second.pk, 'opening_hours': 'whenever'},
+        ], format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data[0], {})
+        self.assertIn('opening_hours', response.data[1])
+        first.refresh_from_db()
+        self.assertEqual(first.name, 'Shop 0')
+        self.assertEqual(first.updated_at, self.long_ago)
+
+    def test_bulk_update_rejects_shops_of_other_users(self):
+        response = self.client.patch('/api/shops/bulk/', [
+            {'id': self.shops[0].pk, 'name': 'Renamed'},
+            {'id': self.foreign_shop.pk, 'name': 'Taken'},
+        ], format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data, [{}, {'id': ['Not found.']}])
+        self.assertEqual(set(Shop.objects.values_list('name', flat=True)), {'Shop 0', 'Shop 1', 'Foreign'})
+
+    def test_bulk_requests_must_be_lists_of_distinct_ids(self):
+        for method, body in [
+            (self.client.patch, {'id': self.shops[0].pk}),
+            (self.client.patch, [{'id': self.shops[0].pk}, {'id': self.shops[0].pk}]),
+            (self.client.patch, [self.shops[0].pk]),
+            (self.client.delete, [self.shops[0].pk, 'x']),
+        ]:
+            with self.subTest(body=body):
+                self.assertEqual(method('/api/shops/bulk/', body, format='json').status_code, 400)
+
+    def test_bulk_destroy(self):
+        response = self.client.delete('/api/shops/bulk/', [shop.pk for shop in self.shops], format='json')
+        self.assertEqual(response.status_code, 204)
+        for shop in self.shops:
+            shop.refresh_from_db()
+            self.assertTrue(shop.deleted)
+            self.assertGreater(shop.updated_at, self.long_ago)
+
+    def test_bulk_destroy_rejects_shops_of_other_users(self):
+        response = self.client.delete('/api/shops/bulk/', [self.shops[0].pk, self.foreign_shop.pk], format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data, [{}, {'id': ['Not found.']}])
+        self.assertFalse(Shop.objects.filter(deleted=True).exists())
+
+
+class ConcurrencyLimiterTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.limiter = AdaptiveConcurrencyLimiter('test', max_limit=4, latency_target=1.0)
+
+    def test_slow_or_failed_calls_halve_the_limit(self):
+        self.assertEqual(self.limiter.limit(), 4)
+        self.limiter.release(latency=2.0)
+        self.assertEqual(self.limiter.limit(), 2)
+        self.limiter.release(latency=0.1, ok=False)
+        self.assertEqual(self.limiter.limit(), 1)
+        self.limiter.release(latency=2.0)
+        self.assertEqual(self.limiter.limit(), 1)  # Never below min_limit
+
+    def test_fast_calls_raise_the_limit_additively(self):
+        for _ in range(3):
+            self.limiter.release(latency=2.0)
+        self.limiter.release(latency=0.1)
+        self.assertEqual(self.limiter.limit(), 2)
+        self.limiter.release(latency=0.1)
+        self.assertEqual(self.limiter.limit(), 2.5)
+        for _ in range(20):
+            self.limiter.release(latency=0.1)
+        self.assertEqual(self.limiter.limit(), 4)  # Never above max_limit
+
+    def test_admission_follows_the_limit(self):
+        self.limiter.release(latency=2.0)  # Limit 2
+        self.assertTrue(self.limiter.try_acquire())
+        self.assertTrue(self.limiter.try_acquire())
+        self.assertFalse(self.limiter.try_acquire())
+        self.assertEqual(self.limiter.inflight(), 2)
+        self.limiter.release(latency=0.1)
+        self.assertTrue(self.limiter.try_acquire())
+
+    def test_slot_sheds_when_full_and_counts_errors(self):
+        for _ in range(3):
+            self.limiter.release(latency=2.0)  # Limit 1
+        self.limiter.release(latency=0.1)  # Limit 2
+        with self.limiter.slot(), self.limiter.slot():
+            with self.assertRaises(Overloaded), self.limiter.slot():
+                pass
+        with self.assertRaises(ValueError), self.limiter.slot():
+            raise ValueError
+        # 2 + 1/2 + 1/2.5 after the two fast calls, halved by the failure
+        self.assertEqual(self.limiter.limit(), 1.45)
+        self.assertEqual(self.limiter.inflight(), 0)
+
+    def test_barcode_lookups_are_shed_with_retry_after(self):
+        client = APIClient()
+        stale = Grocery.objects.create(barcode_number='0036000291452', name='Pencils',
+                                       barcode_api_last_checked=timezone.now() - timedelta(days=365))
+        with patch.object(upstream_limiter, 'try_acquire', return_value=False):
+            response = client.post('/api/product-from-barcode/', {'barcode_number': '4006381333931'}, format='json')
+            self.assertEqual(response.status_code, 503)
+            self.assertEqual(response['Retry-After'], '5')
+            # A known product is served stale instead
+            response = client.post('/api/product-from-barcode/', {'barcode_number': stale.barcode_number},
+                                   format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['products'][0]['title'], 'Pencils')
+        self.assertIn('Stale', response['Warning'])
+
+
+class GroceryFacetTests(TestCase):
+    def counts(self):
+        return {
+            (facet, value): count
+            for facet, value, count in GroceryFacet.objects.filter(count__gt=0).values_list('facet', 'value', 'count')
+        }
+
+    def test_counts_follow_create_update_and_delete(self):
+        grocery = Grocery.objects.create(name='Milk', category='Dairy', brand='Acme')
+        Grocery.objects.create(name='Cheese', category='Dairy', brand='Other')
+        self.assertEqual(self.counts(), {('category', 'Dairy'): 2, ('brand', 'Acme'): 1, ('brand', 'Other'): 1})
+
+        grocery = Grocery.objects.get(pk=grocery.pk)
+        grocery.category = 'Bakery'
+        grocery.save()
+        self.assertEqual(self.counts(), {('category', 'Dairy'): 1, ('category', 'Bakery'): 1,
+                                         ('brand', 'Acme'): 1, ('brand', 'Other'): 1})
+        # A second save of the same instance starts from what was saved
+        grocery.category = 'Dairy'
+        grocery.save()
+        self.assertEqual(self.counts(), {('category', 'Dairy'): 2, ('brand', 'Acme'): 1, ('brand', 'Other'): 1})
+
+        grocery.delete()
+        self.assertEqual(self.counts(), {('category', 'Dairy'): 1, ('brand', 'Other'): 1})
+
+    def test_save_does_not_read_the_row_back(self):
+        grocery = Grocery.objects.create(name='Milk', category='Dairy', brand='Acme')
+        grocery = Grocery.objects.get(pk=grocery.pk)
+        grocery.name = 'Whole milk'
+        with self.assertNumQueries(1):  # Just the UPDATE
+            grocery.save()
+        grocery.brand = 'Other'
+        with CaptureQueriesContext(connection) as queries:
+            grocery.save()
+        self.assertFalse(any(query['sql'].startswith('SELECT') and 'groceriespricechecker_grocery"' in query['sql']
+                             for query in queries.captured_queries))
+        self.assertEqual(self.counts(), {('category', 'Dairy'): 1, ('brand', 'Other'): 1})
+
+    def test_deferred_and_partial_saves(self):
+        grocery = Grocery.objects.create(name='Milk', category='Dairy', brand='Acme')
+        deferred = Grocery.objects.only('name').get(pk=grocery.pk)
+        deferred.category = 'Bakery'
+        deferred.save()
+        self.assertEqual(self.counts(), {('category', 'Bakery'): 1, ('brand', 'Acme'): 1})
+
+        grocery.refresh_from_db()
+        grocery.brand = 'Other'
+        grocery.category = 'Unsaved'
+        grocery.save(update_fields=['brand'])
+        self.assertEqual(self.counts(), {('category', 'Bakery'): 1, ('brand', 'Other'): 1})
+
+    def test_bulk_writes_are_fixed_by_a_rebuild(self):
+        Grocery.objects.create(name='Milk', category='Dairy', brand='Acme')
+        Grocery.objects.bulk_create([Grocery(name='Bread', category='Bakery'), Grocery(name='Yogurt', category='Dairy')])
+        Grocery.objects.filter(name='Milk').update(brand='Other')
+        self.assertEqual(self.counts(), {('category', 'Dairy'): 1, ('brand', 'Acme'): 1})
+        rebuild_facets()
+        self.assertEqual(self.counts(), {('category', 'Dairy'): 2, ('category', 'Bakery'): 1, ('brand', 'Other'): 1})
+
+
+class RendererTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('shopper', 'shopper@example.com', 'Password123')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        for i in range(5):
+            create_shop(self.user, name=f'Shop {i}', description='A shop on the high street ' * 4)
+
+    def get(self, url='/api/shops/', **headers):
+        return self.client.get(url, headers=headers)
+
+    def test_json_stays_the_default(self):
+        response = self.get()
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertEqual(len(json.loads(response.content)), 5)
+
+    def test_msgpack_round_trips(self):
+        expected = json.loads(self.get().content)
+        response = self.get(Accept='application/msgpack')
+        self.assertEqual(response['Content-Type'], 'application/msgpack')
+        # Dates and decimals use the same string forms as JSON
+        self.assertEqual(msgpack.unpackb(response.content), expected)
+        self.assertEqual(msgpack.unpackb(self.get('/api/shops/?format=msgpack').content), expected)
+
+    def test_columnar_round_trips(self):
+        expected = json.loads(self.get().content)
+        response = self.get(Accept='application/vnd.pricechecker.columnar+json')
+        self.assertTrue(response['Content-Type'].startswith('application/vnd.pricechecker.columnar+json'))
+        data = json.loads(response.content)
+        self.assertEqual(data['columns'], list(expected[0]))
+        self.assertEqual([dict(zip(data['columns'], row)) for row in data['rows']], expected)
+
+    def test_to_columnar_keeps_mixed_lists(self):
+        self.assertEqual(to_columnar({'a': [{'x': 1}, {'y': 2}]}), {'a': [{'x': 1}, {'y': 2}]})
+        self.assertEqual(to_columnar([{'x': [{'y': 1}]}]), {'columns': ['x'], 'rows': [[{'columns': ['y'], 'rows': [[1]]}]]})
+
+
+class CompressionMiddlewareTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('shopper', 'shopper@example.com', 'Password123')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        for i in range(5):
+            create_shop(self.user, name=f'Shop {i}', description='A shop on the high street ' * 4)
+        self.plain = self.client.get('/api/shops/', headers={'Accept-Encoding': 'identity'}).content
+
+    def get(self, accept_encoding, url='/api/shops/'):
+        return self.client.get(url, headers={'Accept-Encoding': accept_encoding})
+
+    def test_brotli_is_preferred(self):
+        response = self.get('gzip, br')
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(brotli.decompress(response.content), self.plain)
+        self.assertEqual(response['Content-Length'], str(len(response.content)))
+
+    def test_gzip(self):
+        for accept_encoding in ['gzip', 'gzip, br;q=0']:
+            with self.subTest(accept_encoding=accept_encoding):
+                response = self.get(accept_encoding)
+                self.assertEqual(response['Content-Encoding'], 'gzip')
+                self.assertEqual(gzip.decompress(response.content), self.plain)
+
+    def test_uncompressed_without_an_accepted_coding(self):
+        for accept_encoding in ['', 'identity', 'gzip;q=0, br;q=0']:
+            with self.subTest(accept_encoding=accept_encoding):
+                response = self.get(accept_encoding)
+                self.assertFalse(response.has_header('Content-Encoding'))
+                self.assertIn('Accept-Encoding', response['Vary'])
+                self.assertEqual(response.content, self.plain)
+
+    def test_small_streaming_and_post_responses_pass_through(self):
+        middleware = CompressionMiddleware(lambda request: self.response)
+        request = RequestFactory().get('/', HTTP_ACCEPT_ENCODING='gzip')
+
+        self.response = JsonResponse({'ok': True})
+        self.assertFalse(middleware(request).has_header('Content-Encoding'))
+
+        self.response = StreamingHttpResponse(iter([b'x' * 1000]))
+        response = middleware(request)
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(b''.join(response.streaming_content), b'x' * 1000)
+
+        self.response = HttpResponse(b'x' * 1000)
+        post = RequestFactory().post('/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertFalse(middleware(post).has_header('Content-Encoding'))
+
+    def test_strong_etag_is_weakened(self):
+        self.response = HttpResponse(b'x' * 1000)
+        self.response['ETag'] = '"abc"'
+        response = CompressionMiddleware(lambda request: self.response)(
+            RequestFactory().get('/', HTTP_ACCEPT_ENCODING='gzip'))
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['ETag'], 'W/"abc"')
+
+
+class BulkPriceTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('shopper', 'shopper@example.com', 'Password123')
+        self.other = User.objects.create_user('other', 'other@example.com', 'Password123')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        shopping_list = ShoppingList.objects.create(owner=self.user, name='List')
+        self.milk, self.bread = (UserGrocery.objects.create(owner=self.user, shopping_list=shopping_list)
+                                 for _ in range(2))
+        self.shop = create_shop(self.user)
+        self.foreign_shop = create_shop(self.other)
+        self.foreign_grocery = UserGrocery.objects.create(
+            owner=self.other, shopping_list=ShoppingList.objects.create(owner=self.other, name='Theirs'))
+
+    def post(self, *rows):
+        return self.client.post('/api/prices/bulk/', list(rows), format='json')
+
+    def row(self, user_grocery=None, shop=None, **fields):
+        return {'user_grocery': (user_grocery or self.milk).pk, 'shop': (shop or self.shop).pk,
+                'price': '1.00', **fields}
+
+    def assertNothingWritten(self):
+        self.assertFalse(Price.objects.exists())
+        self.assertFalse(PriceShop.objects.exists())
+        self.assertFalse(CurrentPrice.objects.exists())
+
+    def test_batch_is_stored(self):
+        response = self.post(self.row(), self.row(user_grocery=self.bread, price='2.50'),
+                             self.row(price='0.80', is_discounted=True, price_before_discount='1.00'))
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([row['price'] for row in response.data], ['1.00', '2.50', '0.80'])
+        self.assertEqual(PriceShop.objects.filter(shop=self.shop).count(), 3)
+        self.assertEqual(dict(CurrentPrice.objects.values_list('user_grocery', 'price')),
+                         {self.milk.pk: Decimal('0.80'), self.bread.pk: Decimal('2.50')})
+
+    def test_other_users_groceries_and_shops_are_rejected(self):
+        response = self.post(self.row(), self.row(user_grocery=self.foreign_grocery),
+                             self.row(shop=self.foreign_shop))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data, [{}, {'user_grocery': ['Not found.']}, {'shop': ['Not found.']}])
+        self.assertNothingWritten()
+
+    def test_one_invalid_row_rejects_the_batch(self):
+        response = self.post(self.row(), self.row(price='-1'),
+                             self.row(is_discounted=True, price_before_discount='0.50'))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data[0], {})
+        self.assertIn('price', response.data[1])
+        self.assertIn('price_before_discount', response.data[2])
+        self.assertNothingWritten()
+
+    def test_failed_write_rolls_back_the_batch(self):
+        with patch('groceriespricechecker.price_views.refresh_current_prices', side_effect=RuntimeError), \
+                self.assertRaises(RuntimeError):
+            self.post(self.row(), self.row(user_grocery=self.bread))
+        self.assertNothingWritten()
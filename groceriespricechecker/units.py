@@ -0,0 +1,98 @@
+# groceries/units.py
+
+# Parse free-text pack sizes ("500 g", "1,5 kg", "6 x 330 ml", "12 oz",
+# "24 ct") into a quantity in a base unit: grams, millilitres or a count.
+# Grocery and GroceryItem keep the parsed values in indexed columns so value
+# comparisons (price per 100 g) can be done in SQL.
+
+import re
+from decimal import Decimal, InvalidOperation
+
+GRAMS = 'g'
+MILLILITRES = 'ml'
+COUNT = 'count'
+BASE_UNIT_CHOICES = [(GRAMS, 'Grams'), (MILLILITRES, 'Millilitres'), (COUNT, 'Count')]
+
+# Unit prices are quoted per 100 g, per 100 ml and per item
+UNIT_PRICE_SCALE = {GRAMS: 100, MILLILITRES: 100, COUNT: 1}
+
+# Spelling -> (base unit, base units per one of it)
+UNITS = {
+    'mg': (GRAMS, Decimal('0.001')),
+    'g': (GRAMS, Decimal('1')), 'gr': (GRAMS, Decimal('1')), 'grs': (GRAMS, Decimal('1')),
+    'gram': (GRAMS, Decimal('1')), 'grams': (GRAMS, Decimal('1')),
+    'kg': (GRAMS, Decimal('1000')), 'kgs': (GRAMS, Decimal('1000')),
+    'kilo': (GRAMS, Decimal('1000')), 'kilos': (GRAMS, Decimal('1000')),
+    'oz': (GRAMS, Decimal('28.349523')), 'ounce': (GRAMS, Decimal('28.349523')),
+    'ounces': (GRAMS, Decimal('28.349523')),
+    'lb': (GRAMS, Decimal('453.59237')), 'lbs': (GRAMS, Decimal('453.59237')),
+    'pound': (GRAMS, Decimal('453.59237')), 'pounds': (GRAMS, Decimal('453.59237')),
+    'ml': (MILLILITRES, Decimal('1')), 'cl': (MILLILITRES, Decimal('10')), 'dl': (MILLILITRES, Decimal('100')),
+    'l': (MILLILITRES, Decimal('1000')), 'lt': (MILLILITRES, Decimal('1000')), 'ltr': (MILLILITRES, Decimal('1000')),
+    'litre': (MILLILITRES, Decimal('1000')), 'litres': (MILLILITRES, Decimal('1000')),
+    'liter': (MILLILITRES, Decimal('1000')), 'liters': (MILLILITRES, Decimal('1000')),
+    'fl oz': (MILLILITRES, Decimal('29.573530')), 'floz': (MILLILITRES, Decimal('29.573530')),
+    'ct': (COUNT, Decimal('1')), 'count': (COUNT, Decimal('1')), 'pc': (COUNT, Decimal('1')),
+    'pcs': (COUNT, Decimal('1')), 'piece': (COUNT, Decimal('1')), 'pieces': (COUNT, Decimal('1')),
+    'pk': (COUNT, Decimal('1')), 'pack': (COUNT, Decimal('1')), 'each': (COUNT, Decimal('1')),
+    'ea': (COUNT, Decimal('1')), 'unit': (COUNT, Decimal('1')), 'units': (COUNT, Decimal('1')),
+}
+
+_NUMBER = r'\d+(?:[.,]\d+)?'
+_UNIT = '|'.join(sorted((re.escape(u).replace(r'\ ', r'\s*') for u in UNITS), key=len, reverse=True))
+# Optional "6 x" multipack prefix, a number and a unit, e.g. "6 x 330 ml"
+_QUANTITY_RE = re.compile(
+    rf'(?:(?P<count>\d+)\s*[x×*]\s*)?(?P<number>{_NUMBER})\s*(?P<unit>{_UNIT})\b\.?',
+    re.IGNORECASE,
+)
+_BARE_NUMBER_RE = re.compile(rf'^\s*({_NUMBER})\s*$')
+_QUANTUM = Decimal('0.001')
+# Largest value the quantity columns (max_digits=12, decimal_places=3) hold
+MAX_QUANTITY = Decimal('999999999.999')
+
+
+def _to_decimal(text):
+    # "1,000" is a thousands separator, "1,5" a decimal comma
+    if re.fullmatch(r'\d{1,3},\d{3}', text):
+        text = text.replace(',', '')
+    try:
+        return Decimal(text.replace(',', '.'))
+    except InvalidOperation:
+        return None
+
+
+# (quantity, base unit) for the first size found in `text`, or (None, None)
+def parse_quantity(text):
+    if not text:
+        return None, None
+    match = _QUANTITY_RE.search(text)
+    if not match:
+        return None, None
+    number = _to_decimal(match['number'])
+    base_unit, factor = UNITS[re.sub(r'\s+', ' ', match['unit'].lower())]
+    if not number:
+        return None, None
+    quantity = number * factor * (int(match['count']) if match['count'] else 1)
+    # Sizes too large to store are typos, not products
+    if quantity > MAX_QUANTITY:
+        return None, None
+    quantity = quantity.quantize(_QUANTUM)
+    if quantity <= 0:
+        return None, None
+    return quantity, base_unit
+
+
+# GroceryItem keeps the unit and the amount in separate fields, but either may
+# also hold a full size ("500 g"); a count-like unit without an amount is one item
+def parse_item_quantity(unit, packaging_size):
+    unit = (unit or '').strip()
+    packaging_size = (packaging_size or '').strip()
+    if packaging_size and _BARE_NUMBER_RE.match(packaging_size) and unit:
+        return parse_quantity(f"{packaging_size} {unit}")
+    for text in (packaging_size, unit):
+        quantity, base_unit = parse_quantity(text)
+        if quantity is not None:
+            return quantity, base_unit
+    if unit.lower() in UNITS and UNITS[unit.lower()][0] == COUNT and not packaging_size:
+        return Decimal('1.000'), COUNT
+    return None, None
@@ -1,15 +1,30 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import GroceryListCreateAPIView, GroceryRetrieveUpdateDestroyAPIView, ShopViewSet
-from .product_views import ProductFromBarcodeAPIView
+from .views import GroceryListCreateAPIView, GroceryRetrieveUpdateDestroyAPIView, ShopViewSet, ShoppingListDetailAPIView
+from .product_views import ProductFromBarcodeAPIView, BarcodeProviderStatsAPIView
+from .price_views import PriceBulkCreateAPIView, CurrentPriceListAPIView
+from .sync_views import SyncAPIView
+from .export_views import GroceryExportView, PriceExportView
+from .facet_views import GroceryFacetsAPIView
+from .basket_views import BasketPlanAPIView
+from .idempotency import idempotent
 
 router = DefaultRouter()
 router.register(r'shops', ShopViewSet, basename='shop')
 
 urlpatterns = [
     path('groceries/', GroceryListCreateAPIView.as_view(), name='grocery-list-create'),
+    path('groceries/facets/', GroceryFacetsAPIView.as_view(), name='grocery-facets'),
     path('groceries/<int:pk>/', GroceryRetrieveUpdateDestroyAPIView.as_view(), name='grocery-detail'),
-    path('product-from-barcode/', ProductFromBarcodeAPIView.as_view(), name='product-from-barcode'),
+    path('shopping-lists/<int:pk>/', ShoppingListDetailAPIView.as_view(), name='shopping-list-detail'),
+    path('shopping-lists/<int:pk>/basket/', BasketPlanAPIView.as_view(), name='shopping-list-basket'),
+    path('product-from-barcode/', idempotent(ProductFromBarcodeAPIView.as_view()), name='product-from-barcode'),
+    path('barcode-providers/stats/', BarcodeProviderStatsAPIView.as_view(), name='barcode-provider-stats'),
+    path('prices/bulk/', PriceBulkCreateAPIView.as_view(), name='price-bulk-create'),
+    path('current-prices/', CurrentPriceListAPIView.as_view(), name='current-price-list'),
+    path('sync/', SyncAPIView.as_view(), name='sync'),
+    path('export/groceries/', GroceryExportView.as_view(), name='grocery-export'),
+    path('export/prices/', PriceExportView.as_view(), name='price-export'),
     path('', include(router.urls)),
 ]
 
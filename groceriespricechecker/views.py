@@ -5,17 +5,25 @@ from django.contrib.auth.tokens import PasswordResetTokenGenerator, default_toke
 from django.utils.encoding import force_bytes, force_str, DjangoUnicodeDecodeError
 from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
 from django.core.mail import send_mail, EmailMultiAlternatives
+from django.db import transaction
+from django.db.models import Prefetch
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from django.template.loader import render_to_string
 from rest_framework import generics, status, viewsets
+from rest_framework.exceptions import ValidationError
 from rest_framework.views import APIView
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework_simplejwt.views import TokenObtainPairView
 from .permissions import IsOwner
-from .models import Grocery, Shop
-from .serializers import GrocerySerializer, UserSignupSerializer, CustomTokenObtainPairSerializer, MessageSerializer, EmailListSerializer, ShopSerializer
+from .models import CurrentPrice, Grocery, GroceryItem, Shop, ShoppingList, UserGrocery
+from .serializers import GrocerySerializer, UserSignupSerializer, CustomTokenObtainPairSerializer, MessageSerializer, EmailListSerializer, ShopSerializer, ShopBulkSerializer, ShoppingListDetailSerializer
 from .throttles import FixedIntervalForgotPasswordThrottle
+from .shop_cache import cache_shops, get_cached_shops, invalidate_shops, shop_cache_key
+from .idempotency import idempotent
+from .opening_hours import open_at_condition, sync_opening_intervals
 
 User = get_user_model()
 
@@ -192,7 +200,188 @@ class ShopViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated, IsOwner]
 
     def get_queryset(self):
-        return Shop.objects.filter(owner=self.request.user)
+        queryset = Shop.objects.filter(owner=self.request.user)
+        open_at = self.request.query_params.get('open_at')
+        if open_at and self.action == 'list':
+            moment = self._parse_open_at(open_at)
+            timezones = queryset.values_list('timezone', flat=True).distinct().order_by()
+            queryset = queryset.filter(open_at_condition(moment, timezones))
+        return queryset
+
+    # ?open_at= takes an ISO 8601 datetime (in TIME_ZONE unless it has an offset) or "now"
+    def _parse_open_at(self, value):
+        if value == 'now':
+            return timezone.now()
+        try:
+            moment = parse_datetime(value.replace(' ', '+'))
+        except ValueError:
+            moment = None
+        if moment is None:
+            raise ValidationError({'open_at': ['Expected an ISO 8601 datetime or "now".']})
+        if timezone.is_naive(moment):
+            moment = timezone.make_aware(moment)
+        return moment
+
+    # Upper bound on the number of shops accepted by a single bulk request
+    bulk_max_items = 500
+
+    # Honour Idempotency-Key on POSTs (shop creation and bulk creation)
+    @classmethod
+    def as_view(cls, actions=None, **initkwargs):
+        return idempotent(super().as_view(actions, **initkwargs))
 
     def perform_create(self, serializer):
         serializer.save(owner=self.request.user)
+
+    # List and detail responses are cached per user and invalidated by bumping
+    # the user's shop cache version (see shop_cache.py and signals.py)
+    def list(self, request, *args, **kwargs):
+        # Answers to open_at depend on the clock, so they are not cached
+        if 'open_at' in request.query_params:
+            return super().list(request, *args, **kwargs)
+        key = shop_cache_key(request.user.id, 'list', request.get_full_path())
+        data = get_cached_shops(key)
+        if data is None:
+            response = super().list(request, *args, **kwargs)
+            cache_shops(key, list(response.data))
+            return response
+        return Response(data)
+
+    def retrieve(self, request, *args, **kwargs):
+        key = shop_cache_key(request.user.id, 'detail', kwargs[self.lookup_field])
+        data = get_cached_shops(key)
+        if data is None:
+            response = super().retrieve(request, *args, **kwargs)
+            cache_shops(key, dict(response.data))
+            return response
+        return Response(data)
+
+    # Look up the requested shops with a single owner-scoped query instead of
+    # running IsOwner once per object. Returns the shops keyed by id and a list
+    # of per-item errors (empty dicts for items that were found).
+    def _get_owned_shops(self, ids):
+        shops = self.get_queryset().in_bulk(ids)
+        errors = [{} if pk in shops else {'id': ['Not found.']} for pk in ids]
+        return shops, errors
+
+    # Read the list of shop ids from a bulk request body. Items are either
+    # bare ids or, when objects=True, dicts carrying an `id` key.
+    def _get_bulk_ids(self, items, objects=False):
+        if not isinstance(items, list):
+            return None, {'non_field_errors': ['Expected a list of items.']}
+        if len(items) > self.bulk_max_items:
+            return None, {'non_field_errors': [f'Ensure this field has no more than {self.bulk_max_items} elements.']}
+        ids, errors = [], []
+        for item in items:
+            if objects and not isinstance(item, dict):
+                ids.append(None)
+                errors.append({'non_field_errors': ['Expected an object.']})
+                continue
+            try:
+                ids.append(int(item['id'] if objects else item))
+                errors.append({})
+            except (KeyError, TypeError, ValueError):
+                ids.append(None)
+                errors.append({'id': ['A valid integer is required.']})
+        if any(errors):
+            return None, errors
+        if len(set(ids)) != len(ids):
+            return None, {'non_field_errors': ['Duplicate ids in request.']}
+        return ids, None
+
+    # POST shops/bulk/ - create many shops in one transaction
+    @action(detail=False, methods=['post'], url_path='bulk')
+    def bulk(self, request):
+        serializer = ShopBulkSerializer(data=request.data, many=True, max_length=self.bulk_max_items)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        shops = [Shop(owner=request.user, **attrs) for attrs in serializer.validated_data]
+        with transaction.atomic():
+            Shop.objects.bulk_create(shops)
+            sync_opening_intervals(shops)
+            invalidate_shops(request.user.id)
+        return Response(ShopSerializer(shops, many=True).data, status=status.HTTP_201_CREATED)
+
+    # PATCH shops/bulk/ - partially update many shops, each item must include its id
+    @bulk.mapping.patch
+    def bulk_update(self, request):
+        ids, errors = self._get_bulk_ids(request.data, objects=True)
+        if errors:
+            return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+
+        shops, errors = self._get_owned_shops(ids)
+        validated = []
+        for index, (pk, item) in enumerate(zip(ids, request.data)):
+            if errors[index]:
+                continue
+            data = {key: value for key, value in item.items() if key != 'id'}
+            serializer = ShopBulkSerializer(shops[pk], data=data, partial=True)
+            if serializer.is_valid():
+                validated.append((shops[pk], serializer.validated_data))
+            else:
+                errors[index] = serializer.errors
+        if any(errors):
+            return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+
+        # bulk_update() bypasses auto_now, so updated_at has to be set here
+        now = timezone.now()
+        fields = {'updated_at'}
+        for shop, attrs in validated:
+            for field, value in attrs.items():
+                setattr(shop, field, value)
+            shop.updated_at = now
+            fields.update(attrs)
+        with transaction.atomic():
+            Shop.objects.bulk_update([shop for shop, _ in validated], sorted(fields))
+            sync_opening_intervals(shop for shop, attrs in validated if 'opening_hours' in attrs)
+            invalidate_shops(request.user.id)
+        return Response(ShopSerializer([shop for shop, _ in validated], many=True).data)
+
+    # DELETE shops/bulk/ - soft delete many shops, body is a list of ids
+    @bulk.mapping.delete
+    def bulk_destroy(self, request):
+        ids, errors = self._get_bulk_ids(request.data)
+        if errors:
+            return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+
+        shops, errors = self._get_owned_shops(ids)
+        if any(errors):
+            return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+
+        with transaction.atomic():
+            Shop.objects.filter(pk__in=ids).update(deleted=True, updated_at=timezone.now())
+            invalidate_shops(request.user.id)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+# Full shopping list with its groceries, their items and current prices.
+# Everything is loaded with select_related/Prefetch filtered to active,
+# non-deleted rows, so the query count is fixed regardless of list size.
+class ShoppingListDetailAPIView(generics.RetrieveAPIView):
+    serializer_class = ShoppingListDetailSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        current_prices = (
+            CurrentPrice.objects
+            .filter(shop__active=True, shop__deleted=False)
+            .select_related('shop')
+            .order_by('price', 'shop_id')
+        )
+        user_groceries = (
+            UserGrocery.objects
+            .filter(active=True, deleted=False)
+            .order_by('id')
+            .prefetch_related(
+                Prefetch('grocery_items',
+                         queryset=GroceryItem.objects.filter(active=True, deleted=False).order_by('id'),
+                         to_attr='active_grocery_items'),
+                Prefetch('current_prices', queryset=current_prices, to_attr='active_current_prices'),
+            )
+        )
+        return (
+            ShoppingList.objects
+            .filter(owner=self.request.user, deleted=False)
+            .prefetch_related(Prefetch('user_groceries', queryset=user_groceries, to_attr='active_user_groceries'))
+        )
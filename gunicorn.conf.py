@@ -0,0 +1,44 @@
+# Gunicorn configuration, picked up automatically from the working directory
+
+import multiprocessing
+import os
+
+# Threaded workers: our views mostly wait on Postgres, Redis or the barcode
+# providers, so each process serves several requests at once. Every thread
+# keeps its own persistent DB connection (see DB_CONN_MAX_AGE), so the
+# database sees up to workers x threads connections.
+# GUNICORN_WORKER_CLASS=sync restores one request per process.
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+workers = int(os.environ.get('WEB_CONCURRENCY', min(multiprocessing.cpu_count() * 2, 8)))
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+# Keep client connections from the router open between requests
+keepalive = 5
+# Recycle workers now and then to bound memory growth
+max_requests = 2000
+max_requests_jitter = 200
+
+
+# Each worker starts with a cold in-process cache, so preload the most
+# scanned barcodes before it takes traffic
+def post_worker_init(worker):
+    from django.conf import settings
+    from groceriespricechecker.barcode_cache import warm_barcode_cache
+    if workers > 1 and settings.CACHES['default']['BACKEND'].endswith('LocMemCache'):
+        worker.log.warning(
+            "No shared cache (REDIS_URL is not set): Idempotency-Key replays, shop cache invalidation "
+            "and the upstream concurrency limit only apply within each worker process."
+        )
+    try:
+        warm_barcode_cache()
+    except Exception as e:
+        worker.log.warning("Barcode cache warm-up failed: %s", e)
+
+
+# Persist the in-memory barcode access counts before the worker goes away
+def worker_exit(server, worker):
+    from groceriespricechecker.barcode_cache import tracker
+    try:
+        tracker.flush()
+    except Exception as e:
+        server.log.warning("Barcode access counts were not saved: %s", e)
@@ -50,6 +50,7 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'groceriespricechecker.middleware.CompressionMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -83,10 +84,53 @@ WSGI_APPLICATION = 'pricecheckerapi.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
+# Connections are kept open between requests (per worker thread) for
+# DB_CONN_MAX_AGE seconds instead of paying the TCP/TLS/auth handshake on every
+# request, and are checked before reuse so a connection the server dropped is
+# replaced instead of failing the request. DB_CONN_MAX_AGE=0 restores a
+# connection per request.
 DATABASES = {
-    'default': dj_database_url.parse(config('DATABASE_URL'))
+    'default': dj_database_url.parse(
+        config('DATABASE_URL'),
+        conn_max_age=config('DB_CONN_MAX_AGE', default=600, cast=int),
+        conn_health_checks=True,
+    )
 }
 
+# Authentication: log in with username or email in one query
+AUTHENTICATION_BACKENDS = [
+    'groceriespricechecker.backends.UsernameOrEmailBackend',
+]
+
+# Seconds between last_login writes for the same user
+LAST_LOGIN_UPDATE_INTERVAL = 15 * 60
+
+# Cache
+# Set REDIS_URL in production so every worker shares one cache; version-based
+# invalidation (e.g. of shop listings) only works across workers that way.
+REDIS_URL = config('REDIS_URL', default='')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Idempotency-Key handling for POST endpoints (seconds)
+IDEMPOTENCY_TTL = 60 * 60 * 24  # How long stored responses are replayed
+IDEMPOTENCY_LOCK_TIMEOUT = 60  # Upper bound on how long a key stays locked
+IDEMPOTENCY_WAIT = 5  # How long a retry waits for the original's response before a 409
+
+# Seconds a user's serialized shop list/detail responses stay cached
+SHOP_CACHE_TIMEOUT = 60 * 60
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -145,6 +189,13 @@ REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
         'rest_framework_simplejwt.authentication.JWTAuthentication',
     ),
+    # JSON stays the default; the compact renderers are opt-in via Accept
+    'DEFAULT_RENDERER_CLASSES': (
+        'rest_framework.renderers.JSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+        'groceriespricechecker.renderers.ColumnarJSONRenderer',
+        'groceriespricechecker.renderers.MessagePackRenderer',
+    ),
     'DEFAULT_THROTTLE_RATES': {
          'forgot_password': '2/minute',
     }
@@ -159,6 +210,29 @@ SIMPLE_JWT = {
 # App Env variables
 BARCODE_LOOKUP_URL = config('BARCODE_LOOKUP_URL')
 BARCODE_LOOKUP_KEY = config('BARCODE_LOOKUP_KEY')
+BARCODE_LOOKUP_TIMEOUT = 10  # Seconds, overall budget for resolving one barcode
+
+# Path of the local product database built by `manage.py import_product_dump`
+LOCAL_PRODUCT_DB = config('LOCAL_PRODUCT_DB', default='')
+
+# Barcode providers, tried in order. The next provider is hedged in when the
+# current one hasn't answered within its recent BARCODE_HEDGE_PERCENTILE latency.
+# The local product database, when present, is consulted before any network call.
+BARCODE_PROVIDERS = config('BARCODE_PROVIDERS', cast=Csv(), default=(
+    ('groceriespricechecker.providers.LocalProductProvider,' if LOCAL_PRODUCT_DB else '')
+    + 'groceriespricechecker.providers.BarcodeLookupProvider,'
+    'groceriespricechecker.providers.OpenFoodFactsProvider'
+))
+BARCODE_HEDGE_PERCENTILE = 95
+BARCODE_HEDGE_DEFAULT_DELAY = 1.0  # Seconds, used until enough latencies are recorded
+BARCODE_HEDGE_MIN_DELAY = 0.05
+
+# Adaptive limit on concurrent upstream barcode lookups. Calls slower than the
+# latency target (seconds) halve the limit; fast ones raise it back up to the max.
+# Without REDIS_URL the limit applies per worker process, so keep it below
+# GUNICORN_THREADS to leave threads free for other requests.
+UPSTREAM_MAX_CONCURRENCY = config('UPSTREAM_MAX_CONCURRENCY', default=2, cast=int)
+UPSTREAM_LATENCY_TARGET = 2.0
 RECAPTCHA_SECRET_KEY = config('RECAPTCHA_SECRET_KEY')
 ACCOUNT_CREATION_ENABLED = config('ACCOUNT_CREATION_ENABLED', default='true').lower() == 'true'
 FRONTEND_URL = config('FRONTEND_URL')
@@ -171,3 +245,29 @@ EMAIL_USE_TLS = True
 EMAIL_HOST_USER = 'apikey'
 EMAIL_HOST_PASSWORD = config('EMAIL_HOST_PASSWORD')
 DEFAULT_FROM_EMAIL = 'admin@grocerypricechecker.com'
+
+# Price anomaly detection at ingestion (see groceriespricechecker/anomalies.py).
+# A price is an anomaly when its robust z-score exceeds the threshold AND it is
+# more than MAX_RATIO times off the median of the last HISTORY prices for the
+# same item and shop. 'quarantine' stores anomalies inactive until approved in
+# the admin; 'flag' only marks them.
+PRICE_ANOMALY_ACTION = config('PRICE_ANOMALY_ACTION', default='quarantine')
+PRICE_ANOMALY_HISTORY = 50
+PRICE_ANOMALY_MIN_HISTORY = 5
+PRICE_ANOMALY_THRESHOLD = 6.0
+PRICE_ANOMALY_MAX_RATIO = 3.0
+PRICE_ANOMALY_MIN_SPREAD = 0.05
+
+# Basket optimizer (shopping-lists/<pk>/basket/): the most shops a plan may
+# use, the time budget in seconds, and the largest number of shop
+# combinations enumerated to prove a plan optimal
+BASKET_MAX_SHOPS = 10
+BASKET_TIME_BUDGET = 0.25
+BASKET_EXACT_MAX_COMBINATIONS = 50000
+
+# Price drop alerts: the same sale price at the same shop is reported to a
+# watched item again only after this long
+PRICE_ALERT_REPEAT_AFTER = timedelta(days=7)
+
+# Maximum newsletter emails sent per second (0 for no limit)
+NEWSLETTER_RATE = config('NEWSLETTER_RATE', default=10, cast=float)
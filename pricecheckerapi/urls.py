@@ -6,6 +6,7 @@ from rest_framework_simplejwt.views import (
 )
 from groceriespricechecker.views import CustomTokenObtainPairView, contact_us, signup_view, ForgotPasswordView, ResetPasswordView, confirm_email, EmailListView
 from groceriespricechecker.serializers import CustomTokenObtainPairSerializer
+from groceriespricechecker.idempotency import idempotent
 
 class CustomTokenObtainPairView(TokenObtainPairView):
     serializer_class = CustomTokenObtainPairSerializer
@@ -14,11 +15,11 @@ urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/token/', CustomTokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('api/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
-    path('api/contact-us/', contact_us, name='contact_us'),
+    path('api/contact-us/', idempotent(contact_us), name='contact_us'),
     path('api/signup/', signup_view, name='signup'),
     path('api/forgot-password/', ForgotPasswordView.as_view(), name='forgot-password'),
     path('api/reset-password/', ResetPasswordView.as_view(), name='reset-password'),
     path('api/confirm-email/', confirm_email, name='confirm-email'),
-    path('api/email-list/', EmailListView.as_view(), name='email-list'),
+    path('api/email-list/', idempotent(EmailListView.as_view()), name='email-list'),
     path('api/', include('groceriespricechecker.urls')),  # Include app-specific URLs
 ]